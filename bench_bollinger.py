@@ -0,0 +1,46 @@
+import logging
+import time
+
+import numpy
+import scipy.signal
+
+from bollinger import get_position_scaling, get_position_scalings
+
+__author__ = 'Christophe'
+
+
+def scalar_scalings(signal_values, mu, sigma, limit=None):
+    current_scaling = 0.
+    scalings = numpy.empty(signal_values.size)
+    for index, signal_value in enumerate(signal_values):
+        current_scaling = get_position_scaling(signal_value, current_scaling, mu, sigma, limit=limit)
+        scalings[index] = current_scaling
+
+    return scalings
+
+
+def main():
+    count_rows = 10000000
+    count_scalar_rows = 200000
+    random = numpy.random.RandomState(0)
+    # mean-reverting tick-level spread
+    signal_values = scipy.signal.lfilter([0.01], [1., -0.9999], random.standard_normal(size=count_rows))
+
+    for limit in (None, 2):
+        started = time.time()
+        scalings = get_position_scalings(signal_values, 0., 0.1, limit=limit)
+        vectorized_elapsed = time.time() - started
+
+        started = time.time()
+        expected = scalar_scalings(signal_values[:count_scalar_rows], 0., 0.1, limit=limit)
+        scalar_elapsed = (time.time() - started) * count_rows / count_scalar_rows
+        parity = numpy.array_equal(expected, get_position_scalings(signal_values[:count_scalar_rows], 0., 0.1,
+                                                                   limit=limit))
+        logging.info('limit %s: vectorized %.2fs for %d rows, scalar loop %.2fs (extrapolated), parity %s, '
+                     '%d position changes', limit, vectorized_elapsed, count_rows, scalar_elapsed, parity,
+                     numpy.count_nonzero(numpy.diff(scalings)))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+    main()
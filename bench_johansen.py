@@ -0,0 +1,44 @@
+import logging
+import timeit
+
+import numpy
+import pandas
+
+from statsext import cointeg
+
+__author__ = 'Christophe'
+
+
+def random_levels(count_samples, count_dimensions, seed=0):
+    random = numpy.random.RandomState(seed)
+    trends = numpy.cumsum(random.normal(size=(count_samples, 1)), axis=0)
+    loadings = random.uniform(0.5, 2., size=(1, count_dimensions))
+    levels = trends * loadings + random.normal(size=(count_samples, count_dimensions))
+    return pandas.DataFrame(levels, columns=['s%d' % dimension for dimension in range(count_dimensions)])
+
+
+def main():
+    count_repeats = 20
+    rows = list()
+    for count_samples in (500, 5000):
+        for count_dimensions in range(2, 13):
+            levels = random_levels(count_samples, count_dimensions)
+            reference = cointeg.cointegration_johansen(levels, lag=1, method='pinv')
+            result = cointeg.cointegration_johansen(levels, lag=1, method='qr')
+            row = {'samples': count_samples, 'dimensions': count_dimensions,
+                   'max_eigenvalue_error': numpy.abs(reference['eigenvalues'] - result['eigenvalues']).max()}
+            for method in cointeg._JOHANSEN_METHODS:
+                elapsed = timeit.timeit(lambda: cointeg.cointegration_johansen(levels, lag=1, method=method),
+                                        number=count_repeats)
+                row[method + '_ms'] = 1000. * elapsed / count_repeats
+
+            rows.append(row)
+
+    results = pandas.DataFrame(rows, columns=['samples', 'dimensions', 'pinv_ms', 'qr_ms', 'max_eigenvalue_error'])
+    results['speedup'] = results['pinv_ms'] / results['qr_ms']
+    logging.info('johansen timings:\n%s', results.to_string(index=False))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+    main()
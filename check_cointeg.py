@@ -1,16 +1,13 @@
 import logging
-import os
 import numpy
 import pandas
 from datetime import datetime
 from matplotlib import pyplot
 from matplotlib import ticker
-from statsmodels.formula.api import ols
-import math
-from bollinger import get_position_scaling
 from mktdatadb import list_tickers, LoaderARCA, get_date_range
-from pnl import AverageCostProfitAndLoss
-from statsext import cointeg
+from mktdatadb.merge import align_quotes
+from pnl import fees
+from spreadstrategy import CFD_FEES, backtest, compute_scenarios, compute_trades, load_quotes, target_positions
 
 __author__ = 'Christophe'
 
@@ -36,10 +33,10 @@ def save_samples(ticker1, ticker2):
     nyse_arca = LoaderARCA()
     start_date = datetime(2015, 4, 1)
     end_date = datetime(2015, 5, 31)
-    book_states = nyse_arca.load_book_states('%s US Equity' % ticker1, start_date, end_date)
-    book_states.to_pickle('%s.pkl' % ticker1)
-    book_states = nyse_arca.load_book_states('%s US Equity' % ticker2, start_date, end_date)
-    book_states.to_pickle('%s.pkl' % ticker2)
+    book_states = nyse_arca.load_book_states_batch(['%s US Equity' % ticker for ticker in (ticker1, ticker2)],
+                                                   start_date, end_date)
+    for ticker in (ticker1, ticker2):
+        book_states['%s US Equity' % ticker].to_pickle('%s.pkl' % ticker)
 
 
 class IrregularDatetimeFormatter(ticker.Formatter):
@@ -57,145 +54,6 @@ class IrregularDatetimeFormatter(ticker.Formatter):
         return as_timestamp.strftime(self._format)
 
 
-class CoIntegration(object):
-    """
-    Generates a cointegrated signal.
-    """
-
-    def __init__(self, prices, calibration_start, calibration_end, backtest_end):
-        calibration_period = (prices.index >= calibration_start) & (prices.index < calibration_end)
-        backtest_period = (prices.index >= calibration_end) & (prices.index < backtest_end)
-        calibration_set = prices[calibration_period].groupby([(pandas.TimeGrouper('D'))]).ffill().dropna(axis=0)
-        self._backtest_set = prices[backtest_period]
-        self._signal = None
-        self._calibration = None
-        self._half_life = None
-        self._vector = None
-        cointeg_vectors = cointeg.get_johansen(calibration_set, lag=1)
-        if len(cointeg_vectors) > 0:
-            self._vector = cointeg_vectors[0]
-            self._calibration = pandas.DataFrame(calibration_set.dot(self._vector))
-            self._calibration.columns = ['signal']
-            delta_calibration = self._calibration - self._calibration.shift(periods=1)
-            delta_calibration.columns = ['dy']
-            delta_calibration['y'] = self._calibration.shift(1)
-            regress = ols(data=delta_calibration, formula='dy ~ y').fit()
-            logging.info('regression results: %s', regress.summary())
-            self._half_life = -int(math.log(2) / regress.params.y)
-
-    @property
-    def calibration(self):
-        return self._calibration
-
-    @property
-    def half_life(self):
-        return self._half_life
-
-    @property
-    def vector(self):
-        return self._vector
-
-    @property
-    def signal(self):
-        if self._signal is None:
-            self._signal = self._compute_signal(self._backtest_set)
-
-        return self._signal
-
-    def _compute_signal(self, input_ts):
-        """
-
-        :param input_ts:
-        :return:
-        """
-        by_day = input_ts.groupby([(pandas.TimeGrouper('D'))]).ffill()
-        return by_day.dot(self.vector).dropna()
-
-
-def calc_fees_cfd(quantity):
-    return max(1., 0.005 * quantity)
-
-
-def compute_trades(component):
-    trades = component[['shares']].diff()
-    trades.ix[0] = component['shares'].ix[0]
-    trades['cost'] = component['bid'].where(component['shares'] < 0, component['ask'])
-    update_pnl_globals = {'pnl_calc': AverageCostProfitAndLoss()}
-
-    def update_pnl(row):
-        pnl_calc = update_pnl_globals['pnl_calc']
-        quantity = row['shares']
-        realized_pnl = 0.
-        if quantity != 0:
-            pnl_calc.add_fill(fill_qty=quantity, fill_price=row['cost'])
-            realized_pnl = pnl_calc.realized_pnl - calc_fees_cfd(quantity)
-
-        unrealized_pnl = pnl_calc.get_unrealized_pnl(current_price=row['cost'])
-        return pandas.Series({'trade_realized': realized_pnl, 'unrealized': unrealized_pnl})
-
-    result = list()
-    for row in trades.itertuples(index=False):
-        result.append(update_pnl(dict(zip(trades.columns, row))))
-
-    trades = pandas.concat([trades, pandas.DataFrame(result, index=trades.index)], axis=1)
-    trades['realized'] = trades['trade_realized'].cumsum()
-    return trades[['realized', 'unrealized']]
-
-
-def backtest(prices_mid_securities, calibration_start, calibration_end, backtest_end):
-    securities = prices_mid_securities.keys()
-    prices_mid_list = [prices_mid_securities[security] for security in securities]
-    prices_mid = pandas.concat(prices_mid_list, axis=1)
-    prices_mid.columns = securities
-    logging.info('computing cointegration statistics')
-    cointegration = CoIntegration(prices_mid, calibration_start, calibration_end, backtest_end)
-    logging.info('half-life according to warm-up period: %d', cointegration.half_life)
-    return cointegration
-
-
-def bollinger(signal, threshold, half_life=None, ref_value=0.):
-    """
-
-    :param signal:
-    :param threshold:
-    :param half_life:
-    :param ref_value:
-    :return:
-    """
-    logging.info('computing ewma')
-    if half_life:
-        signal_ref = pandas.ewma(signal, halflife=half_life)
-
-    else:
-        ref = numpy.empty(len(signal))
-        ref.fill(ref_value)
-        signal_ref = pandas.Series(ref, index=signal.index)
-
-    compute_scale_globals = {'current_scaling': 0.}
-
-    def compute_scale(signal_level, ewma_level):
-        current_scaling = compute_scale_globals['current_scaling']
-        new_position_scaling = get_position_scaling(signal_level, current_scaling, ewma_level, threshold)
-        # updating for next step
-        compute_scale_globals['current_scaling'] = new_position_scaling
-        result = {
-            'band_inf': ewma_level + ((new_position_scaling - 1) * threshold),
-            'band_mid': ewma_level + (new_position_scaling * threshold),
-            'band_sup': ewma_level + ((new_position_scaling + 1) * threshold),
-            'scaling': -new_position_scaling
-        }
-        return result
-
-    logging.info('computing scaling')
-
-    result = list()
-    for signal_level, ewma_level in pandas.concat([signal, signal_ref], axis=1).itertuples(index=False):
-        result.append(compute_scale(signal_level, ewma_level))
-
-    bands = pandas.DataFrame(result, index=signal.index)
-    return bands[['band_inf', 'band_mid', 'band_sup']], bands['scaling']
-
-
 def main():
     logging.info('loading datasets...')
 
@@ -208,42 +66,24 @@ def main():
     CALIBRATION_END = '2015-05-01'  # excluded
     BACKTEST_END = '2015-06-01'  # excluded
 
-    prices_bid_ask_securities = dict()
-    prices_mid_securities = dict()
-    for security in SECURITIES:
-        quote = pandas.read_pickle(os.sep.join(['data', '%s.pkl' % security])).astype(float)
-        prices_bid_ask_securities[security] = quote
-        quote_mid = 0.5 * (quote['bid'] + quote['ask'])
-        prices_mid_securities[security] = quote_mid
-
+    prices_bid_ask_securities, prices_mid_securities = load_quotes(SECURITIES)
     logging.info('loaded datasets')
     cointegration = backtest(prices_mid_securities, CALIBRATION_START, CALIBRATION_END, BACKTEST_END)
 
     #signal.resample('10T', how='last')
 
-    threshold = STEP_SIZE * cointegration.calibration['signal'].std()
-    logging.info('size of threshold: %.2f', threshold)
-
-    bands, scaling = bollinger(cointegration.signal, threshold, half_life=EWMA_PERIOD * cointegration.half_life)
-    #bands, scaling = bollinger(cointegration.signal, threshold, ref_value=cointegration.calibration['signal'].mean())
-
-    shares = (scaling.values * cointegration.vector[:, None] * TRADE_SCALE).astype(int)
-    shares_df = pandas.DataFrame(shares.transpose(), index=[scaling.index], columns=SECURITIES)
+    bands, shares_df = target_positions(cointegration, SECURITIES, STEP_SIZE, EWMA_PERIOD, TRADE_SCALE)
 
-    pnl_securities = dict()
-    for security in SECURITIES:
-        logging.info('backtesting component: %s', security)
-        prices = pandas.concat([prices_bid_ask_securities[security]['bid'], prices_bid_ask_securities[security]['ask']], axis=1)
-        component = pandas.concat([prices, shares_df[security]], axis=1, join='inner')
-        component.columns = ['bid', 'ask', 'shares']
-        logging.info('analyzing trades for component: %s', security)
-        trades = compute_trades(component)
-        logging.info('displaying results for component %s', security)
-        logging.info('trades:\n%s', trades)
-        pnl_securities[security] = trades['realized'] + trades['unrealized']
+    logging.info('backtesting components: %s', SECURITIES)
+    bids, asks, shares_df = align_quotes(prices_bid_ask_securities, shares_df)
+    pnl_securities = compute_trades(bids, asks, shares_df)
+    logging.info('P&L per component:\n%s', pnl_securities)
+    fee_scenarios = [fees.PerShareFee(0., name='no fees'), CFD_FEES, CFD_FEES + fees.SpreadCrossingSlippage(0.5)]
+    scenarios = compute_scenarios(bids, asks, shares_df, fee_scenarios)
+    logging.info('final P&L per fee scenario:\n%s', scenarios.iloc[-1])
 
     fig, ax_pnls = pyplot.subplots()
-    pnls = pandas.DataFrame(pandas.concat([trades for trades in pnl_securities.values()], axis=1, join='inner').sum(axis=1))
+    pnls = pandas.DataFrame(pnl_securities.sum(axis=1))
     formatter = IrregularDatetimeFormatter(pnls.index.values)
     ax_pnls.xaxis.set_major_formatter(formatter)
     pnls.plot(ax=ax_pnls, x=numpy.arange(len(pnls)))
@@ -0,0 +1,34 @@
+import argparse
+import logging
+from datetime import datetime
+
+from mktdatadb import ingest, list_archived_tickers
+
+__author__ = 'Christophe'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts zipped tick archives into the columnar tick store.')
+    parser.add_argument('tickers', nargs='*', help='tickers to convert (default: all archives in the database)')
+    parser.add_argument('--db-name', default='equities')
+    parser.add_argument('--start-date', help='first date to convert (YYYY-MM-DD)')
+    parser.add_argument('--end-date', help='last date to convert (YYYY-MM-DD)')
+    parser.add_argument('--overwrite', action='store_true', help='re-converts days already in the store')
+    args = parser.parse_args()
+
+    start_date = None
+    if args.start_date:
+        start_date = datetime.strptime(args.start_date, '%Y-%m-%d').date()
+
+    end_date = None
+    if args.end_date:
+        end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date()
+
+    tickers = args.tickers or list_archived_tickers(args.db_name)
+    for ticker in tickers:
+        ingest(ticker, db_name=args.db_name, start_date=start_date, end_date=end_date, overwrite=args.overwrite)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)-15s %(levelname)s %(name)s - %(message)s', level=logging.INFO)
+    main()
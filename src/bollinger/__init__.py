@@ -1,5 +1,7 @@
 import math
 
+import numpy
+
 __author__ = 'Christophe'
 
 
@@ -28,4 +30,93 @@ def get_position_scaling(signal_value, current_scaling, mu, sigma, limit=None):
         if limit is None or abs(current_band + 1) <= abs(limit):
             new_scaling = current_band + 1
 
-    return new_scaling
\ No newline at end of file
+    return new_scaling
+
+
+def scaled_steps(values, step_length=1.):
+    """
+    Array version of scaled_step.
+
+    :param values: array of input values
+    :param step_length: scalar or array of step sizes
+    :return: float array of steps
+    """
+    return numpy.floor(numpy.asarray(values, dtype=float) / numpy.asarray(step_length, dtype=float))
+
+
+def _compose_clamps(lower, upper):
+    """
+    Cumulative composition of the clamps x -> min(max(x, lower[i]), upper[i]), by doubling steps: after the pass with
+    shift k, row i holds the composition of rows i - 2k + 1 to i.
+
+    :param lower:
+    :param upper:
+    :return: (lower, upper) bounds of the composed clamps
+    """
+    shift = 1
+    while shift < lower.size:
+        composed_lower = lower.copy()
+        composed_upper = upper.copy()
+        composed_lower[shift:] = numpy.minimum(numpy.maximum(lower[:-shift], lower[shift:]), upper[shift:])
+        composed_upper[shift:] = numpy.minimum(numpy.maximum(upper[:-shift], lower[shift:]), upper[shift:])
+        lower = composed_lower
+        upper = composed_upper
+        shift *= 2
+
+    return lower, upper
+
+
+def get_position_scalings(signal_values, mu, sigma, limit=None, current_scaling=0.):
+    """
+    Applies get_position_scaling over a whole signal, each row starting from the scaling of the previous row.
+
+    Each step of get_position_scaling is a clamp of the current scaling between the band and the band above (a bound
+    is dropped when it falls beyond the limit), so the scalings are obtained by composing clamps instead of looping
+    over rows. Consecutive rows with the same bounds are collapsed beforehand. Rows with a missing signal keep the
+    current scaling.
+
+    :param signal_values: array of input values
+    :param mu: scalar or array of reference values
+    :param sigma: scalar or array of step sizes
+    :param limit: limits absolute position to the indicated value
+    :param current_scaling: position size before the first row
+    :return: float array of position sizes
+    """
+    bands = numpy.ravel(scaled_steps(numpy.asarray(signal_values, dtype=float) - mu, step_length=sigma))
+    count_rows = bands.size
+    if count_rows == 0:
+        return numpy.empty(0)
+
+    lower = bands.copy()
+    upper = bands + 1.
+    undefined = numpy.isnan(bands)
+    if limit is not None:
+        lower[numpy.abs(lower) > abs(limit)] = -numpy.inf
+        upper[numpy.abs(upper) > abs(limit)] = numpy.inf
+
+    lower[undefined] = -numpy.inf
+    upper[undefined] = numpy.inf
+
+    changes = numpy.empty(count_rows, dtype=bool)
+    changes[0] = True
+    changes[1:] = (lower[1:] != lower[:-1]) | (upper[1:] != upper[:-1])
+    starts = numpy.flatnonzero(changes)
+    lower, upper = _compose_clamps(lower[starts], upper[starts])
+    scalings = numpy.minimum(numpy.maximum(float(current_scaling), lower), upper)
+    return numpy.repeat(scalings, numpy.diff(numpy.append(starts, count_rows)))
+
+
+def get_bands(signal_values, mu, sigma, limit=None, current_scaling=0.):
+    """
+    Bollinger bands around the reference, shifted along with the position size.
+
+    :param signal_values: array of input values
+    :param mu: scalar or array of reference values
+    :param sigma: scalar or array of step sizes
+    :param limit: limits absolute position to the indicated value
+    :param current_scaling: position size before the first row
+    :return: tuple of arrays (band_inf, band_mid, band_sup, position sizes)
+    """
+    scalings = get_position_scalings(signal_values, mu, sigma, limit=limit, current_scaling=current_scaling)
+    band_mid = numpy.asarray(mu, dtype=float) + scalings * numpy.asarray(sigma, dtype=float)
+    return band_mid - sigma, band_mid, band_mid + sigma, scalings
@@ -7,7 +7,7 @@ import sys
 from pandas.tslib import Timestamp
 from pandas.util import testing
 
-from bollinger import scaled_step, get_position_scaling
+from bollinger import scaled_step, get_position_scaling, scaled_steps, get_position_scalings, get_bands
 
 
 def geometric_brownian_motion(date_start, date_end, mu=0.1, sigma=0.01, scaling=20.):
@@ -155,3 +155,40 @@ class TestBollinger(unittest.TestCase):
                     Timestamp('2013-01-12 00:00:00'): 0.0}
         variations = df_diff[df_diff != 0.].cumsum()
         testing.assert_series_equal(pandas.Series(expected, name='position_scaling'), variations)
+
+    def test_step_function_vectorized(self):
+        values = numpy.array([-2.25, -2., -1., -0.75, -0.25, 0., 0.75, 1., 1.25, 2.])
+        expected = [scaled_step(value, step_length=2.) for value in values]
+        numpy.testing.assert_array_equal(expected, scaled_steps(values, step_length=2.))
+
+    def test_position_scalings(self):
+        prices = self.load_pandas('test_bollinger.pkl')
+        mu = prices.mean()
+        sigma = 0.8 * prices.std()
+        for limit in (None, 1, 2):
+            current_scaling = 0.
+            expected = list()
+            for price in prices.values:
+                current_scaling = get_position_scaling(price, current_scaling, mu, sigma, limit=limit)
+                expected.append(current_scaling)
+
+            numpy.testing.assert_array_equal(expected, get_position_scalings(prices.values, mu, sigma, limit=limit))
+
+        band_inf, band_mid, band_sup, scalings = get_bands(prices.values, mu, sigma)
+        numpy.testing.assert_allclose(mu + scalings * sigma, band_mid)
+        numpy.testing.assert_allclose(band_sup - band_inf, 2. * sigma)
+
+    def test_position_scalings_random(self):
+        random = numpy.random.RandomState(0)
+        for trial in range(50):
+            signal_values = numpy.cumsum(random.standard_normal(size=200))
+            mu = random.standard_normal(size=200)
+            limit = (None, 1, 2, 0)[trial % 4]
+            current_scaling = (0., 1., -3.)[trial % 3]
+            scalings = get_position_scalings(signal_values, mu, 0.5, limit=limit, current_scaling=current_scaling)
+            expected = list()
+            for signal_value, mu_value in zip(signal_values, mu):
+                current_scaling = get_position_scaling(signal_value, current_scaling, mu_value, 0.5, limit=limit)
+                expected.append(current_scaling)
+
+            numpy.testing.assert_array_equal(expected, scalings)
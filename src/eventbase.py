@@ -1,10 +1,18 @@
+import heapq
 import logging
-from collections import defaultdict
+import math
+from collections import deque
 from random import random, gauss
 from time import sleep
 from datetime import datetime
 import numpy
 import sys
+from scipy.signal import lfilter
+
+from bollinger import get_bands, get_position_scaling
+
+# rows per segment of the cumulative sums of rolling blocks in batch mode, bounding their magnitude
+_ROLLING_SEGMENT = 1024
 
 
 class Signal(object):
@@ -12,10 +20,17 @@ class Signal(object):
         self._name = name
         self._value = numpy.empty(dimension)
         self._timestamp = None
-        self._blocks = set()
+        self._timestamps = None
+        self._values = None
+        self._blocks = list()
 
     def add_block(self, block):
-        self._blocks.add(block)
+        if block not in self._blocks:
+            self._blocks.append(block)
+
+    @property
+    def blocks(self):
+        return tuple(self._blocks)
 
     @property
     def name(self):
@@ -27,24 +42,51 @@ class Signal(object):
 
     @value.setter
     def value(self, ts_value):
-        logging.info('updated signal %s: %s', self._name, ts_value)
         self._timestamp, self._value = ts_value
         for block in self._blocks:
             block.on_update(self._timestamp, self)
 
+    @property
+    def timestamps(self):
+        return self._timestamps
+
+    @property
+    def values(self):
+        return self._values
+
+    @values.setter
+    def values(self, ts_values):
+        """
+        Batch update, the last value becoming the current value.
+
+        :param ts_values: (timestamps, values) arrays, values having one row per timestamp
+        """
+        self._timestamps, self._values = ts_values
+        self._timestamp = self._timestamps[-1]
+        self._value = self._values[-1]
+        for block in self._blocks:
+            block.on_batch(self._timestamps, self)
+
     def __repr__(self):
         return '<Signal:%s:%s=%s>' % (self._timestamp, self._name, self._value)
 
 
 class TransferBlock(object):
+    # False for blocks emitting on some updates only, see ExecutionPlan
+    emits_each_update = True
+
     def __init__(self, name, count_inputs, dimension):
         self._name = name
         self._inputs = dict()
         self._output = None
         self._count_inputs = count_inputs
-        self.transfer = lambda x: numpy.empty(dimension)
+        self.transfer = lambda x: numpy.empty(numpy.shape(x)[:-1] + (dimension,))
+        self.transfer_batch = self._transfer_rows
         self._dimension = dimension
 
+    def _transfer_rows(self, values):
+        return self.transfer(values)
+
     def chain(self, block, input_name):
         assert block.output is not None, 'block signal undefined'
         assert len(self._inputs) < self._count_inputs
@@ -60,10 +102,21 @@ class TransferBlock(object):
     def emit(self, emit_ts, value):
         self.output.value = (emit_ts, value)
 
+    def emit_batch(self, emit_timestamps, values):
+        self.output.values = (emit_timestamps, values)
+
     def on_update(self, update_ts, signal):
         # triggers computation
         self.emit(update_ts, self.transfer(signal.value))
 
+    def on_batch(self, update_timestamps, signal):
+        """
+        Batch counterpart of on_update: transfer_batch maps the rows of the input values to the rows of the output
+        values, by default calling transfer on the whole array, transfer functions operating along the last axis.
+        Blocks override it with vectorized versions giving the same results.
+        """
+        self.emit_batch(update_timestamps, self.transfer_batch(signal.values))
+
     @property
     def output(self):
         return self._output
@@ -84,6 +137,7 @@ class TransferId(TransferBlock):
     def __init__(self, name, dimension):
         super(TransferId, self).__init__(name, count_inputs=1, dimension=dimension)
         self.transfer = lambda x: x
+        self.transfer_batch = lambda x: x
 
 
 class TransferLogger(TransferBlock):
@@ -93,15 +147,592 @@ class TransferLogger(TransferBlock):
     def on_update(self, update_ts, signal):
         logging.info('signal update: %s', signal)
 
+    def on_batch(self, update_timestamps, signal):
+        logging.info('signal batch update: %d value(s) from %s to %s, last %s', len(update_timestamps),
+                     update_timestamps[0], update_timestamps[-1], signal)
+
 
-# todo
 class TransferDelayed(TransferBlock):
-    def __init__(self, name, count_inputs, dimension):
-        super(TransferDelayed, self).__init__(name, count_inputs, dimension=dimension)
+    """
+    Input delayed by a fixed number of updates, kept in a ring buffer.
+
+    In tick mode the emitted array is reused across updates.
+    """
+
+    def __init__(self, name, dimension, delay=1, initial=numpy.nan):
+        """
+
+        :param name:
+        :param dimension:
+        :param delay: number of updates
+        :param initial: value emitted until the delay is reached
+        """
+        super(TransferDelayed, self).__init__(name, count_inputs=1, dimension=dimension)
+        assert delay > 0, 'delay must be positive'
+        self._buffer = numpy.empty((delay, dimension))
+        self._buffer.fill(initial)
+        self._position = 0
+        self._delayed = numpy.empty(dimension)
+
+    def on_update(self, update_ts, signal):
+        numpy.copyto(self._delayed, self._buffer[self._position])
+        self._buffer[self._position] = signal.value
+        self._position = (self._position + 1) % self._buffer.shape[0]
+        self.emit(update_ts, self._delayed)
+
+    def on_batch(self, update_timestamps, signal):
+        count_rows = len(update_timestamps)
+        delay = self._buffer.shape[0]
+        rows = numpy.reshape(signal.values, (count_rows, self._dimension))
+        history = numpy.concatenate([self._buffer[self._position:], self._buffer[:self._position], rows])
+        self._buffer[:] = history[-delay:]
+        self._position = 0
+        self.emit_batch(update_timestamps, history[:count_rows])
+
+
+class TransferSampler(TransferBlock):
+    """
+    Last value of each time interval, emitted at the end of the interval once an update of a later interval arrives.
+    Intervals without updates are skipped.
+    """
+    emits_each_update = False
+
+    def __init__(self, name, dimension, interval, origin=None):
+        """
+
+        :param name:
+        :param dimension:
+        :param interval: interval length, in timestamp units (timedelta for datetime timestamps)
+        :param origin: start of the first interval, defaults to the first timestamp
+        """
+        super(TransferSampler, self).__init__(name, count_inputs=1, dimension=dimension)
+        self._interval = interval
+        self._origin = origin
+        self._slot = None
+        self._last = numpy.empty(dimension)
+        self._sampled = numpy.empty(dimension)
+
+    def _slot_end(self, slot):
+        return self._origin + (slot + 1) * self._interval
 
+    def on_update(self, update_ts, signal):
+        if self._origin is None:
+            self._origin = update_ts
+
+        slot = (update_ts - self._origin) // self._interval
+        if self._slot is not None and slot != self._slot:
+            numpy.copyto(self._sampled, self._last)
+            self.emit(self._slot_end(self._slot), self._sampled)
+
+        self._slot = slot
+        self._last[:] = signal.value
+
+    def on_batch(self, update_timestamps, signal):
+        if self._origin is None:
+            self._origin = update_timestamps[0]
+
+        rows = numpy.reshape(signal.values, (len(update_timestamps), self._dimension))
+        slots = (update_timestamps - self._origin) // self._interval
+        last_rows = numpy.flatnonzero(slots[1:] != slots[:-1])
+        sampled_slots = slots[last_rows]
+        sampled = rows[last_rows]
+        if self._slot is not None and slots[0] != self._slot:
+            sampled_slots = numpy.concatenate([[self._slot], sampled_slots])
+            sampled = numpy.concatenate([self._last[None, :], sampled])
+
+        self._slot = slots[-1]
+        self._last[:] = rows[-1]
+        if len(sampled_slots) > 0:
+            self.emit_batch(self._slot_end(sampled_slots), sampled)
+
+    def flush(self):
+        """
+        Emits the last value of the current interval.
+        """
+        if self._slot is not None:
+            numpy.copyto(self._sampled, self._last)
+            self.emit(self._slot_end(self._slot), self._sampled)
+            self._slot = None
+
+
+class _RollingBlock(TransferBlock):
+    """
+    Mean and variance over the last window updates, updated in O(1) without allocation from a ring buffer of the
+    window values.
+    Non-finite values are treated as missing: as in pandas rolling, each dimension emits nan unless its window holds
+    at least min_periods valid values. In tick mode the emitted array is reused across updates.
+    """
+
+    def __init__(self, name, dimension, window, min_periods=None):
+        """
+
+        :param name:
+        :param dimension:
+        :param window: number of updates
+        :param min_periods: minimum number of valid values in the window, defaults to the window length
+        """
+        super(_RollingBlock, self).__init__(name, count_inputs=1, dimension=dimension)
+        assert window > 1, 'window too short'
+        if min_periods is None:
+            min_periods = window
+
+        assert 0 < min_periods <= window, 'min_periods must be in [1, window]'
+        self._window = window
+        self._min_periods = min_periods
+        self._buffer = numpy.zeros((window, dimension))
+        self._position = 0
+        self._count = 0
+        self._valid = numpy.zeros(dimension)
+        self._mean = numpy.zeros(dimension)
+        self._squares = numpy.zeros(dimension)
+        self._statistic = numpy.empty(dimension)
+        # rows of the window holding a non-finite value, the fast path applying when there is none
+        self._missing_rows = [False] * window
+        self._count_missing_rows = 0
+        # scratch buffers, so that tick updates do not allocate
+        self._finite = numpy.empty(dimension, dtype=bool)
+        self._finite_oldest = numpy.empty(dimension, dtype=bool)
+        self._undefined = numpy.empty(dimension, dtype=bool)
+        self._previous_mean = numpy.empty(dimension)
+        self._delta = numpy.empty(dimension)
+        self._term = numpy.empty(dimension)
+        self._divisor = numpy.empty(dimension)
+
+    def _replace(self, value, oldest):
+        # window full on both sides: oldest value replaced by the new one
+        numpy.copyto(self._previous_mean, self._mean)
+        numpy.subtract(value, oldest, out=self._delta)
+        numpy.divide(self._delta, self._window, out=self._term)
+        self._mean += self._term
+        numpy.subtract(value, self._mean, out=self._term)
+        self._term += oldest
+        self._term -= self._previous_mean
+        self._term *= self._delta
+        self._squares += self._term
+
+    def _add(self, value, finite):
+        # Welford update over the valid values only
+        numpy.add(self._valid, finite, out=self._valid)
+        numpy.subtract(value, self._mean, out=self._delta, where=finite)
+        numpy.divide(self._delta, self._valid, out=self._term, where=finite)
+        numpy.add(self._mean, self._term, out=self._mean, where=finite)
+        numpy.subtract(value, self._mean, out=self._term, where=finite)
+        numpy.multiply(self._term, self._delta, out=self._term, where=finite)
+        numpy.add(self._squares, self._term, out=self._squares, where=finite)
+
+    def _remove(self, value, finite):
+        numpy.subtract(self._valid, finite, out=self._valid)
+        numpy.maximum(self._valid, 1., out=self._divisor)
+        numpy.subtract(value, self._mean, out=self._delta, where=finite)
+        numpy.divide(self._delta, self._divisor, out=self._term, where=finite)
+        numpy.subtract(self._mean, self._term, out=self._mean, where=finite)
+        numpy.subtract(value, self._mean, out=self._term, where=finite)
+        numpy.multiply(self._term, self._delta, out=self._term, where=finite)
+        numpy.subtract(self._squares, self._term, out=self._squares, where=finite)
+        # emptied windows restart from zero
+        numpy.equal(self._valid, 0., out=self._undefined)
+        numpy.copyto(self._mean, 0., where=self._undefined)
+        numpy.copyto(self._squares, 0., where=self._undefined)
+
+    def _push(self, value):
+        oldest = self._buffer[self._position]
+        # a sum is finite when all its terms are (overflows only take the slow path)
+        all_finite = math.isfinite(numpy.add.reduce(value))
+        if self._count < self._window:
+            self._count += 1
+            numpy.isfinite(value, out=self._finite)
+            self._add(value, self._finite)
+
+        elif all_finite and self._count_missing_rows == 0:
+            self._replace(value, oldest)
+
+        else:
+            # oldest value leaving the window
+            numpy.isfinite(value, out=self._finite)
+            numpy.isfinite(oldest, out=self._finite_oldest)
+            self._remove(oldest, self._finite_oldest)
+            self._add(value, self._finite)
+
+        if self._missing_rows[self._position] == all_finite:
+            self._count_missing_rows += -1 if all_finite else 1
+            self._missing_rows[self._position] = not all_finite
+
+        oldest[:] = value
+        self._position = (self._position + 1) % self._window
+
+    def _complete(self):
+        # window full of valid values
+        return self._count == self._window and self._count_missing_rows == 0
+
+    def _compute(self, out):
+        raise NotImplementedError
+
+    def _compute_batch(self, counts, means, squares):
+        """
+        Vectorized counterpart of _compute.
+
+        :param counts: number of valid values of each window, one row per update
+        :param means: means of the valid values
+        :param squares: sums of the squared deviations of the valid values from their mean
+        :return: array of statistics, one row per update
+        """
+        raise NotImplementedError
+
+    def _reset(self, values):
+        # state recomputed from the last values, at most a window of them
+        count = len(values)
+        finite = numpy.isfinite(values)
+        centered = numpy.where(finite, values, 0.)
+        self._buffer[:count] = values
+        self._position = count % self._window
+        self._count = count
+        self._valid[:] = finite.sum(axis=0)
+        self._mean[:] = centered.sum(axis=0) / numpy.maximum(self._valid, 1.)
+        centered = numpy.where(finite, values - self._mean, 0.)
+        self._squares[:] = (centered * centered).sum(axis=0)
+        missing_rows = ~finite.all(axis=1)
+        self._missing_rows = list(missing_rows) + [False] * (self._window - count)
+        self._count_missing_rows = int(missing_rows.sum())
 
-# todo
-TransferSampler = TransferId
+    def on_update(self, update_ts, signal):
+        self._push(signal.value)
+        self._compute(self._statistic)
+        self.emit(update_ts, self._statistic)
+
+    def on_batch(self, update_timestamps, signal):
+        rows = numpy.reshape(numpy.asarray(signal.values, dtype=float), (len(update_timestamps), self._dimension))
+        # previous values of the window in arrival order, followed by the batch
+        values = numpy.concatenate([self._buffer[self._position:self._count], self._buffer[:self._position], rows])
+        first = len(values) - len(rows)
+        counts = numpy.empty_like(rows)
+        means = numpy.empty_like(rows)
+        squares = numpy.empty_like(rows)
+        for start in range(first, len(values), _ROLLING_SEGMENT):
+            end = min(start + _ROLLING_SEGMENT, len(values))
+            segment_start = max(start - self._window + 1, 0)
+            output = slice(start - first, end - first)
+            counts[output], means[output], squares[output] = _window_moments(values[segment_start:end], self._window,
+                                                                             start - segment_start)
+
+        self._reset(values[-self._window:])
+        self.emit_batch(update_timestamps, self._compute_batch(counts, means, squares))
+
+
+def _window_moments(values, window, skip):
+    """
+    Moments of the valid values of the windows ending at each row, from differences of cumulative sums.
+
+    :param values: array of values, one row per update
+    :param window: number of updates per window
+    :param skip: number of leading rows whose moments are not needed (only belonging to later windows)
+    :return: tuple (counts, means, squares) of arrays with one row per window, see _RollingBlock._compute_batch
+    """
+    finite = numpy.isfinite(values)
+    # values are shifted by the first valid value of each dimension to limit cancellation in the moments
+    first_valid = numpy.argmax(finite, axis=0)
+    shift = numpy.where(finite.any(axis=0), values[first_valid, numpy.arange(values.shape[1])], 0.)
+    shifted = numpy.where(finite, values - shift, 0.)
+    cumulated = numpy.zeros((3, len(values) + 1, values.shape[1]))
+    numpy.cumsum(finite, axis=0, out=cumulated[0, 1:])
+    numpy.cumsum(shifted, axis=0, out=cumulated[1, 1:])
+    numpy.cumsum(shifted * shifted, axis=0, out=cumulated[2, 1:])
+    ends = numpy.arange(skip, len(values)) + 1
+    starts = numpy.maximum(ends - window, 0)
+    counts, sums, sums_squares = cumulated[:, ends] - cumulated[:, starts]
+    divisors = numpy.maximum(counts, 1.)
+    means = shift + sums / divisors
+    squares = numpy.maximum(sums_squares - sums * sums / divisors, 0.)
+    return counts, means, squares
+
+
+class TransferRollingMean(_RollingBlock):
+    def _compute(self, out):
+        numpy.copyto(out, self._mean)
+        if self._complete():
+            return
+
+        numpy.less(self._valid, self._min_periods, out=self._undefined)
+        numpy.copyto(out, numpy.nan, where=self._undefined)
+
+    def _compute_batch(self, counts, means, squares):
+        return numpy.where(counts >= self._min_periods, means, numpy.nan)
+
+
+class TransferRollingVariance(_RollingBlock):
+    """
+    Sample variance (n - 1 denominator, n being the number of valid values) over the last window updates.
+    """
+
+    def _compute(self, out):
+        if self._complete():
+            numpy.divide(self._squares, self._window - 1, out=out)
+            numpy.maximum(out, 0., out=out)
+            return
+
+        numpy.subtract(self._valid, 1., out=self._divisor)
+        numpy.maximum(self._divisor, 1., out=self._divisor)
+        numpy.divide(self._squares, self._divisor, out=out)
+        numpy.maximum(out, 0., out=out)
+        numpy.less(self._valid, max(self._min_periods, 2), out=self._undefined)
+        numpy.copyto(out, numpy.nan, where=self._undefined)
+
+    def _compute_batch(self, counts, means, squares):
+        variances = numpy.maximum(squares / numpy.maximum(counts - 1., 1.), 0.)
+        return numpy.where(counts >= max(self._min_periods, 2), variances, numpy.nan)
+
+
+def _ewma_alpha(alpha, halflife):
+    assert (alpha is None) != (halflife is None), 'either alpha or halflife expected'
+    if alpha is None:
+        alpha = 1. - math.exp(-math.log(2.) / halflife)
+
+    return alpha
+
+
+class _ExponentialAverage(object):
+    """
+    State of an exponentially weighted moving average, same values as pandas ewm(alpha=alpha, adjust=adjust,
+    ignore_na=ignore_na).mean() (up to rounding). Non-finite values are treated as missing: the average is carried
+    over, the weights of the previous values still decaying unless ignore_na is set. Each dimension is nan until its
+    first valid value.
+    """
+
+    def __init__(self, dimension, alpha, adjust=True, ignore_na=False):
+        self._decay = 1. - alpha
+        self._new_weight = 1. if adjust else alpha
+        self._adjust = adjust
+        self._ignore_na = ignore_na
+        self._average = numpy.empty(dimension)
+        self._average.fill(numpy.nan)
+        self._old_weight = numpy.ones(dimension)
+        # weight shared by all the dimensions once they have a valid value, None otherwise (see _old_weight)
+        self._weight = None
+        # scratch buffers, so that updates do not allocate
+        self._finite = numpy.empty(dimension, dtype=bool)
+        self._updated = numpy.empty(dimension, dtype=bool)
+        self._first = numpy.empty(dimension, dtype=bool)
+        self._term = numpy.empty(dimension)
+        self._total_weight = numpy.empty(dimension)
+
+    def update(self, value, out):
+        if self._weight is not None and math.isfinite(numpy.add.reduce(value)):
+            # average += (value - average) * new weight / (decayed weight + new weight)
+            total_weight = self._weight * self._decay + self._new_weight
+            numpy.subtract(value, self._average, out=self._term)
+            self._term *= self._new_weight / total_weight
+            self._average += self._term
+            self._weight = total_weight if self._adjust else 1.
+            numpy.copyto(out, self._average)
+            return
+
+        if self._weight is not None:
+            self._old_weight.fill(self._weight)
+            self._weight = None
+
+        numpy.isfinite(value, out=self._finite)
+        # dimensions with a valid value so far
+        numpy.isnan(self._average, out=self._updated)
+        numpy.logical_not(self._updated, out=self._updated)
+        numpy.logical_and(self._finite, self._updated, out=self._first)
+        numpy.multiply(self._old_weight, self._decay, out=self._old_weight,
+                       where=self._first if self._ignore_na else self._updated)
+        numpy.logical_and(self._finite, self._updated, out=self._updated)
+        numpy.greater(self._finite, self._first, out=self._first)
+        numpy.multiply(self._average, self._old_weight, out=self._average, where=self._updated)
+        numpy.multiply(value, self._new_weight, out=self._term, where=self._updated)
+        numpy.add(self._average, self._term, out=self._average, where=self._updated)
+        numpy.add(self._old_weight, self._new_weight, out=self._total_weight, where=self._updated)
+        numpy.divide(self._average, self._total_weight, out=self._average, where=self._updated)
+        numpy.copyto(self._old_weight, self._total_weight if self._adjust else 1., where=self._updated)
+        numpy.copyto(self._average, value, where=self._first)
+        self._share_weight()
+        numpy.copyto(out, self._average)
+
+    def _share_weight(self):
+        if self._old_weight.min() == self._old_weight.max() and not math.isnan(numpy.add.reduce(self._average)):
+            self._weight = float(self._old_weight[0])
+
+    def _filter(self, rows, finite):
+        """
+        Weighted sums of the values and weights along the rows, starting from the current state: linear recurrences
+        computed by lfilter, missing values getting no weight.
+
+        :return: tuple (weighted sums, weights) arrays, averages being their ratio
+        """
+        started = ~numpy.isnan(self._average)
+        weights = numpy.where(started, self._old_weight, 0.)
+        sums = numpy.where(started, self._average * weights, 0.)
+        values = numpy.where(finite, rows, 0.) * self._new_weight
+        filter_coefficients = ([1.], [1., -self._decay])
+        sums = lfilter(*filter_coefficients, values, axis=0, zi=self._decay * sums[None, :])[0]
+        weights = lfilter(*filter_coefficients, finite * self._new_weight, axis=0,
+                          zi=self._decay * weights[None, :])[0]
+        return sums, weights
+
+    def update_batch(self, rows):
+        """
+        Vectorized counterpart of update.
+
+        :param rows: array of values, one row per update
+        :return: array of averages, one row per update
+        """
+        rows = numpy.reshape(numpy.asarray(rows, dtype=float), (len(rows), len(self._average)))
+        if self._weight is not None:
+            self._old_weight.fill(self._weight)
+            self._weight = None
+
+        averages = numpy.empty_like(rows)
+        if len(rows) == 0:
+            return averages
+
+        finite = numpy.isfinite(rows)
+        if not self._ignore_na and not self._adjust:
+            # the weight of the previous average is reset after each value: a linear recurrence only without gaps
+            started = ~numpy.isnan(self._average)
+            if not finite.all() or (self._old_weight[started] != 1.).any():
+                for row, out in zip(rows, averages):
+                    self.update(row, out)
+
+                return averages
+
+            # first row giving a start to every dimension
+            self.update(rows[0], averages[0])
+            self._old_weight.fill(1.)
+            self._weight = None
+            rows = rows[1:]
+            finite = finite[1:]
+            averages_rest = averages[1:]
+
+        else:
+            averages_rest = averages
+
+        if len(rows) == 0:
+            self._share_weight()
+            return averages
+
+        if not self._ignore_na:
+            sums, weights = self._filter(rows, finite)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                averages_rest[:] = numpy.where(weights > 0., sums / weights, numpy.nan)
+
+            started = weights[-1] > 0.
+            self._average[started] = averages_rest[-1, started]
+            self._old_weight[started] = weights[-1, started] if self._adjust else 1.
+
+        else:
+            # weights only decay on valid values: recurrences over the valid values of each dimension
+            for dimension in range(rows.shape[1]):
+                valid = finite[:, dimension]
+                previous = self._average[dimension]
+                values = rows[valid, dimension]
+                column = numpy.empty(len(values))
+                filtered = 0
+                if len(values) > 0 and math.isnan(previous):
+                    self._average[dimension] = column[0] = values[0]
+                    self._old_weight[dimension] = 1.
+                    filtered = 1
+
+                if len(values) > filtered:
+                    state = _ExponentialAverage(1, 1. - self._decay, adjust=self._adjust)
+                    state._average[0] = self._average[dimension]
+                    state._old_weight[0] = self._old_weight[dimension]
+                    sums, weights = state._filter(values[filtered:, None], numpy.ones((len(values) - filtered, 1),
+                                                                                      dtype=bool))
+                    column[filtered:] = sums[:, 0] / weights[:, 0]
+                    self._average[dimension] = column[-1]
+                    self._old_weight[dimension] = weights[-1, 0] if self._adjust else 1.
+
+                # averages carried over missing values, the previous one until the first valid value
+                positions = numpy.cumsum(valid) - 1
+                carried = numpy.concatenate([[previous], column])
+                averages_rest[:, dimension] = carried[positions + 1]
+
+        self._share_weight()
+        return averages
+
+
+class TransferEWMA(TransferBlock):
+    """
+    Exponentially weighted moving average, in O(1) per update without allocation. In tick mode the emitted array is
+    reused across updates.
+    """
+
+    def __init__(self, name, dimension, alpha=None, halflife=None, adjust=True, ignore_na=False):
+        """
+
+        :param name:
+        :param dimension:
+        :param alpha: smoothing factor
+        :param halflife: half-life in number of updates, alternative to alpha
+        :param adjust: see pandas ewm
+        :param ignore_na: see pandas ewm, non-finite values being treated as missing
+        """
+        super(TransferEWMA, self).__init__(name, count_inputs=1, dimension=dimension)
+        self._average = _ExponentialAverage(dimension, _ewma_alpha(alpha, halflife), adjust=adjust,
+                                            ignore_na=ignore_na)
+        self._smoothed = numpy.empty(dimension)
+
+    def on_update(self, update_ts, signal):
+        self._average.update(signal.value, self._smoothed)
+        self.emit(update_ts, self._smoothed)
+
+    def on_batch(self, update_timestamps, signal):
+        rows = numpy.reshape(signal.values, (len(update_timestamps), self._dimension))
+        self.emit_batch(update_timestamps, self._average.update_batch(rows))
+
+
+class TransferBollinger(TransferBlock):
+    """
+    Bollinger bands of a scalar signal around its EWMA (or a constant reference), shifted along with the position
+    scaling as in bollinger.get_bands. Emits [band_inf, band_mid, band_sup, scaling].
+    """
+
+    def __init__(self, name, sigma, halflife=None, reference=0., limit=None, current_scaling=0.):
+        """
+
+        :param name:
+        :param sigma: step size
+        :param halflife: half-life of the EWMA reference in number of updates, None for a constant reference
+        :param reference: constant reference, when halflife is None
+        :param limit: limits absolute position to the indicated value
+        :param current_scaling: initial position size
+        """
+        super(TransferBollinger, self).__init__(name, count_inputs=1, dimension=4)
+        self._sigma = sigma
+        self._limit = limit
+        self._scaling = current_scaling
+        self._average = None
+        if halflife is not None:
+            self._average = _ExponentialAverage(1, _ewma_alpha(None, halflife))
+
+        self._reference = numpy.empty(1)
+        self._reference.fill(reference)
+        self._bands = numpy.empty(4)
+
+    def on_update(self, update_ts, signal):
+        value = float(numpy.ravel(signal.value)[0])
+        if self._average is not None:
+            self._average.update(value, self._reference)
+
+        mu = self._reference[0]
+        self._scaling = get_position_scaling(value, self._scaling, mu, self._sigma, limit=self._limit)
+        band_mid = mu + self._scaling * self._sigma
+        self._bands[:] = (band_mid - self._sigma, band_mid, band_mid + self._sigma, self._scaling)
+        self.emit(update_ts, self._bands)
+
+    def on_batch(self, update_timestamps, signal):
+        values = numpy.reshape(signal.values, len(update_timestamps)).astype(float)
+        if self._average is None:
+            mu = numpy.repeat(self._reference, len(values))
+
+        else:
+            mu = self._average.update_batch(values[:, None])[:, 0]
+            self._reference[0] = mu[-1]
+
+        band_inf, band_mid, band_sup, scalings = get_bands(values, mu, self._sigma, limit=self._limit,
+                                                           current_scaling=self._scaling)
+        self._scaling = scalings[-1]
+        self.emit_batch(update_timestamps, numpy.column_stack([band_inf, band_mid, band_sup, scalings]))
 
 
 class Generator(TransferBlock):
@@ -136,31 +767,470 @@ class DictGenerator(Generator):
     def __init__(self, sequencer, name, dict_stream):
         super(DictGenerator, self).__init__(sequencer, name, dimension=1)
         self._dict_stream = dict_stream
+        items = ((dict_ts, self._dict_stream[dict_ts]) for dict_ts in sorted(self._dict_stream.keys()))
+        self.sequencer.subscribe(items, self.emit)
 
-        def sequencer_callback(seq_ts):
-            value = self._dict_stream[seq_ts]
-            self.emit(seq_ts, value)
 
-        for dict_ts in sorted(self._dict_stream.keys()):
-            self.sequencer.expect(dict_ts, sequencer_callback)
+class StreamGenerator(Generator):
+    """
+    Emits the values of a timestamp-ordered iterator of (timestamp, value), pulled one at a time by the sequencer.
+    """
+
+    def __init__(self, sequencer, name, stream, dimension=1):
+        super(StreamGenerator, self).__init__(sequencer, name, dimension=dimension)
+        self.sequencer.subscribe(stream, self.emit)
+
+
+class RecordGenerator(Generator):
+    """
+    Emits fields of timestamped records as float arrays, such as the book states yielded by
+    mktdatadb.load_book_states or LoaderARCA.stream_book_states (missing values become nan).
+    """
+
+    def __init__(self, sequencer, name, records, fields=('bid', 'ask'), key=None):
+        super(RecordGenerator, self).__init__(sequencer, name, dimension=len(fields))
+        if key is None:
+            key = _record_timestamp
+
+        def items():
+            for record in records:
+                yield key(record), numpy.array([record[field] for field in fields], dtype=float)
+
+        self.sequencer.subscribe(items(), self.emit)
+
+
+def _record_timestamp(record):
+    return record['ts']
+
+
+class BatchGenerator(Generator):
+    """
+    Emits batches of values for replaying histories (see StreamSequencer.subscribe_batches).
+    """
+
+    def __init__(self, sequencer, name, batches, dimension=1):
+        """
+
+        :param sequencer:
+        :param name:
+        :param batches: iterator of (timestamps, values) arrays sorted by timestamp, values having one row per timestamp
+        :param dimension:
+        """
+        super(BatchGenerator, self).__init__(sequencer, name, dimension=dimension)
+        self.sequencer.subscribe_batches(batches, self.emit_batch)
+
+
+def frame_batches(frame, fields=('bid', 'ask'), batch_size=100000):
+    """
+    Splits a frame indexed by timestamp, such as the book states of LoaderARCA.load_book_states, into batches.
+
+    :param frame: pandas.DataFrame sorted by timestamp
+    :param fields: columns making the values
+    :param batch_size: maximum number of rows per batch
+    :return: generator of (timestamps, values) arrays
+    """
+    timestamps = frame.index.values
+    values = frame[list(fields)].values.astype(float)
+    for start in range(0, len(timestamps), batch_size):
+        yield timestamps[start:start + batch_size], values[start:start + batch_size]
 
 
 class StreamSequencer(object):
+    """
+    Replays scheduled callbacks in timestamp order.
+
+    Pending events are kept in a heap holding at most one event per subscribed stream, the next one being pulled
+    only once the previous one is dispatched. Events sharing a timestamp are dispatched in the order their source was
+    registered (subscribe or expect call), then in their order within the stream.
+
+    Batch streams are split so that each dispatched batch only holds events coming before every other pending event:
+    blocks then see their updates in the same order as when replaying tick by tick.
+    """
+
     def __init__(self):
-        self._expecting = defaultdict(set)
+        self._queue = list()
+        self._count_sources = 0
+        self._closing_ts = None
+        self._closing = list()
+
+    def _next_rank(self):
+        self._count_sources += 1
+        return self._count_sources
 
     def start(self):
-        while self._expecting:
-            next_deadline = min(self._expecting.keys())
-            next_callbacks_in_line = self._expecting[next_deadline]
-            for callback in next_callbacks_in_line:
-                callback(next_deadline)
+        queue = self._queue
+        if not queue:
+            return
 
-            self._expecting.pop(next_deadline, None)
+        entry = heapq.heappop(queue)
+        while True:
+            if self._closing and (entry[5] or entry[0] != self._closing_ts):
+                self._close()
+                if queue and entry > queue[0]:
+                    entry = heapq.heapreplace(queue, entry)
+
+            sequencer_ts, rank, callback, value, stream, batched = entry
+            if batched:
+                entry = self._dispatch_batch(entry)
+
+            elif stream is None:
+                callback(sequencer_ts)
+                entry = None
+
+            else:
+                callback(sequencer_ts, value)
+                entry = None
+                for sequencer_ts, value in stream:
+                    entry = (sequencer_ts, rank, callback, value, stream, False)
+                    break
+
+            if entry is not None:
+                # the next item is dispatched right away when it comes before every other pending event
+                if queue and entry > queue[0]:
+                    entry = heapq.heapreplace(queue, entry)
+
+                continue
+
+            if not queue:
+                self._close()
+                if not queue:
+                    break
+
+            entry = heapq.heappop(queue)
+
+    def _close(self):
+        closing = self._closing
+        self._closing = list()
+        for callback in closing:
+            callback(self._closing_ts)
+
+    def _dispatch_batch(self, entry):
+        sequencer_ts, rank, callback, batch, stream, batched = entry
+        timestamps, values, start = batch
+        end = len(timestamps)
+        if self._queue:
+            next_ts, next_rank = self._queue[0][:2]
+            side = 'right' if rank < next_rank else 'left'
+            end = start + numpy.searchsorted(timestamps[start:], next_ts, side=side)
+
+        callback(timestamps[start:end], values[start:end])
+        if end < len(timestamps):
+            return timestamps[end], rank, callback, (timestamps, values, end), stream, True
+
+        return self._next_batch(rank, callback, stream)
+
+    @staticmethod
+    def _next_batch(rank, callback, stream):
+        for timestamps, values in stream:
+            if len(timestamps) > 0:
+                return timestamps[0], rank, callback, (timestamps, values, 0), stream, True
+
+        return None
 
     def expect(self, sequencer_ts, callback):
-        logging.info('new expect received: %s', sequencer_ts)
-        self._expecting[sequencer_ts].add(callback)
+        """
+        Schedules a single call.
+
+        :param sequencer_ts:
+        :param callback: function called with the timestamp
+        """
+        logging.debug('new expect received: %s', sequencer_ts)
+        heapq.heappush(self._queue, (sequencer_ts, self._next_rank(), callback, None, None, False))
+
+    def expect_closing(self, sequencer_ts, callback):
+        """
+        Schedules a call once all the events of a timestamp have been dispatched (before any batch).
+
+        :param sequencer_ts: timestamp of the event being dispatched
+        :param callback: function called with the timestamp
+        """
+        if self._closing and sequencer_ts != self._closing_ts:
+            self._close()
+
+        self._closing_ts = sequencer_ts
+        self._closing.append(callback)
+
+    def subscribe(self, stream, callback):
+        """
+        Schedules a call for each item of a stream, items being pulled lazily.
+
+        :param stream: iterator of (timestamp, value) sorted by timestamp
+        :param callback: function called with the timestamp and the value
+        """
+        stream = iter(stream)
+        for sequencer_ts, value in stream:
+            heapq.heappush(self._queue, (sequencer_ts, self._next_rank(), callback, value, stream, False))
+            break
+
+    def subscribe_batches(self, batches, callback):
+        """
+        Schedules a call for each run of items of a batch stream coming before the pending events of the other
+        streams, batches being pulled lazily.
+
+        :param batches: iterator of (timestamps, values) arrays sorted by timestamp
+        :param callback: function called with the timestamps and the values of each run
+        """
+        entry = self._next_batch(self._next_rank(), callback, iter(batches))
+        if entry is not None:
+            heapq.heappush(self._queue, entry)
+
+
+class _PlanInput(object):
+    """
+    Replaces the blocks attached to a generator signal in a compiled graph.
+    """
+
+    def __init__(self, plan, position, sequencer):
+        self._plan = plan
+        self._position = position
+        self._sequencer = sequencer
+
+    def on_update(self, update_ts, signal):
+        if self._sequencer is None:
+            self._plan.run(self._position, update_ts)
+
+        else:
+            self._plan.notify(self._position, update_ts, self._sequencer)
+
+    def on_batch(self, update_timestamps, signal):
+        self._plan.run_batch(self._position, update_timestamps)
+
+
+def _passes_value(block):
+    # blocks relying on the default on_update only apply their transfer function and can be fused
+    return type(block).on_update is TransferBlock.on_update and type(block).on_batch is TransferBlock.on_batch
+
+
+def _fused_step(input_signal, links):
+    def step(update_ts):
+        value = input_signal._value
+        for transfer, output in links:
+            if transfer is not None:
+                value = transfer(value)
+
+            output._timestamp = update_ts
+            output._value = value
+
+    return step
+
+
+def _fused_batch_step(input_signal, links):
+    def step(update_timestamps):
+        values = input_signal._values
+        for transfer, output in links:
+            if transfer is not None:
+                values = transfer(values)
+
+            output._timestamps = update_timestamps
+            output._values = values
+            output._timestamp = update_timestamps[-1]
+            output._value = values[-1]
+
+    return step
+
+
+class ExecutionPlan(object):
+    """
+    Compiled network of blocks fed by generators.
+
+    Blocks are sorted topologically and each block is computed at most once per timestamp, after all its inputs,
+    whatever the number of paths leading to it. Tick updates of several generators sharing a timestamp are processed
+    together once the sequencer has dispatched all the events of that timestamp. A block with several updated inputs
+    receives the one computed last. Linear chains of blocks that only apply their transfer function (such as TransferId
+    passthroughs) are fused into a single step, only setting the intermediate signals.
+
+    Blocks emitting on some updates only (such as TransferSampler) feed their consumers through their own steps. When
+    they emit while the graph is being computed, these steps are deferred until the current ones are done, so that
+    their consumers see the values of the other blocks for the same update.
+
+    Compiling takes over the propagation: the signals of the graph no longer notify their blocks themselves.
+    """
+
+    def __init__(self, generators):
+        """
+
+        :param generators: generators feeding the network, with attached output signals
+        """
+        self._generators = list(generators)
+        producers = dict()
+        consumers = dict()
+        discovered = list()
+        pending = deque(self._generators)
+        while pending:
+            block = pending.popleft()
+            if block in consumers:
+                continue
+
+            assert block.output is not None, 'block %s has no output signal' % block
+            producers[block.output] = block
+            discovered.append(block)
+            consumers[block] = [consumer for consumer in block.output.blocks if not isinstance(consumer, _PlanInput)]
+            for consumer in consumers[block]:
+                if consumer.output is None:
+                    # sink such as a TransferLogger
+                    if consumer not in consumers:
+                        discovered.append(consumer)
+                        consumers[consumer] = list()
+
+                else:
+                    pending.append(consumer)
+
+        self._order = self._sort(discovered, consumers)
+        self._rank = {block: rank for rank, block in enumerate(self._order)}
+        self._consumers = consumers
+        self._producers = producers
+        for block in discovered:
+            if block.output is not None:
+                block.output._blocks = list()
+
+        # generators, then blocks emitting on some updates only
+        self._sources = self._generators + [block for block in self._order
+                                            if not block.emits_each_update and block not in self._generators]
+        for position, source in enumerate(self._sources):
+            sequencer = source.sequencer if source in self._generators else None
+            source.output._blocks = [_PlanInput(self, position, sequencer)]
+
+        self._steps = dict()
+        self._batch_steps = dict()
+        self._pending = list()
+        self._pending_ts = None
+        self._scheduled = deque()
+        self._running = False
+
+    @staticmethod
+    def _sort(blocks, consumers):
+        counts_inputs = dict((block, 0) for block in blocks)
+        for block in blocks:
+            for consumer in consumers[block]:
+                counts_inputs[consumer] += 1
+
+        ready = deque(block for block in blocks if counts_inputs[block] == 0)
+        order = list()
+        while ready:
+            block = ready.popleft()
+            order.append(block)
+            for consumer in consumers[block]:
+                counts_inputs[consumer] -= 1
+                if counts_inputs[consumer] == 0:
+                    ready.append(consumer)
+
+        cycle = [block for block in blocks if counts_inputs[block] > 0]
+        assert not cycle, 'cycle detected between blocks: %s' % cycle
+        return order
+
+    @property
+    def order(self):
+        return list(self._order)
+
+    def _updated_blocks(self, positions):
+        sources = set(self._sources[position] for position in positions)
+        updated = set(sources)
+        for block in self._order:
+            if block in updated and (block.emits_each_update or block in sources):
+                updated.update(self._consumers[block])
+
+        return [block for block in self._order if block in updated and block not in sources]
+
+    def _updated_input(self, block, updated):
+        inputs = [signal for signal in block._inputs.values() if self._producers.get(signal) in updated]
+        return max(inputs, key=lambda signal: self._rank[self._producers[signal]])
+
+    def _compile(self, positions, batch):
+        blocks = self._updated_blocks(positions)
+        updated = set(block for block in blocks if block.emits_each_update)
+        updated.update(self._sources[position] for position in positions)
+        steps = list()
+        chains = dict()
+        for block in blocks:
+            signal = self._updated_input(block, updated)
+            if _passes_value(block) and block.output is not None:
+                transfer = None
+                if not isinstance(block, TransferId):
+                    transfer = block.transfer_batch if batch else block.transfer
+
+                producer = self._producers[signal]
+                if producer in chains and len(self._consumers[producer]) == 1 and len(block._inputs) == 1:
+                    # extends the chain of the producer, computed at the position of its first block
+                    chains[block] = chains[producer]
+                    chains[block][1].append((transfer, block.output))
+
+                else:
+                    chains[block] = (signal, [(transfer, block.output)])
+                    steps.append(chains[block])
+
+            elif batch:
+                steps.append(lambda update_timestamps, block=block, signal=signal: block.on_batch(update_timestamps,
+                                                                                                 signal))
+
+            else:
+                steps.append(lambda update_ts, block=block, signal=signal: block.on_update(update_ts, signal))
+
+        fused_step = _fused_batch_step if batch else _fused_step
+        return [fused_step(*step) if isinstance(step, tuple) else step for step in steps]
+
+    def notify(self, position, update_ts, sequencer):
+        """
+        Records a tick update of a generator, the graph being computed once all the events sharing its timestamp
+        have been dispatched.
+        """
+        if self._pending and update_ts != self._pending_ts:
+            self.flush(self._pending_ts)
+
+        if not self._pending:
+            self._pending_ts = update_ts
+            sequencer.expect_closing(update_ts, self.flush)
+
+        if position not in self._pending:
+            self._pending.append(position)
+
+    def flush(self, update_ts):
+        """
+        Computes the blocks depending on the generators updated at the given timestamp.
+        """
+        pending = self._pending
+        if not pending or update_ts != self._pending_ts:
+            return
+
+        self._pending = list()
+        positions = tuple(pending) if len(pending) == 1 else tuple(sorted(pending))
+        self._execute(positions, update_ts, batch=False)
+
+    def run(self, position, update_ts):
+        """
+        Computes the blocks depending on a source updated by a tick.
+        """
+        self._execute((position,), update_ts, batch=False)
+
+    def run_batch(self, position, update_timestamps):
+        """
+        Computes the blocks depending on a source updated by a batch.
+        """
+        self._execute((position,), update_timestamps, batch=True)
+
+    def _execute(self, positions, update, batch):
+        self._scheduled.append((positions, update, batch))
+        if self._running:
+            # a source emitting from one of the steps being run
+            return
+
+        self._running = True
+        try:
+            while self._scheduled:
+                positions, update, batch = self._scheduled.popleft()
+                compiled = self._batch_steps if batch else self._steps
+                steps = compiled.get(positions)
+                if steps is None:
+                    steps = compiled[positions] = self._compile(positions, batch=batch)
+
+                for step in steps:
+                    step(update)
+
+        finally:
+            self._running = False
+            self._scheduled.clear()
+
+    def __repr__(self):
+        return '<ExecutionPlan:%s>' % ' -> '.join(block.name for block in self._order)
 
 
 def go_rxpy():
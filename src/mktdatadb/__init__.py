@@ -1,21 +1,28 @@
 from collections import OrderedDict
 from decimal import Decimal
-import glob
 import logging
 import os
 from urllib.parse import quote, unquote
-from zipfile import ZipFile
 from datetime import timedelta, datetime
 import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy
 import pandas
 import pytz
 
+from mktdatadb import books, merge, store, zipindex
+
 __author__ = 'Christophe'
 
 ON_TIME_NYSEARCA = '093000'
 OFF_TIME_NYSEARCA = '160000'
 TZ_NYSEARCA = 'US/Eastern'
 
+_CSV_COLUMNS = ['ts', 'type', 'price', 'size', 'conditions']
+_CSV_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+_QUOTE_SIDES = ['BEST_BID', 'BEST_ASK']
+
 
 def _date_range(start_date, end_date):
     for n in range(int((end_date - start_date).days) + 1):
@@ -26,12 +33,38 @@ def _get_db_path(db_name):
     return os.sep.join(['G:', 'mktdata', db_name])
 
 
+def _get_store_path(db_name):
+    return os.sep.join([_get_db_path(db_name), 'columnar'])
+
+
+def _get_books_path(ticker, db_name):
+    return os.sep.join([_get_db_path(db_name), 'books', quote(ticker) + '.bin'])
+
+
 def _get_file_path(ticker, db_name):
     encoded_ticker = quote(ticker)
     file_path = os.sep.join([_get_db_path(db_name), encoded_ticker + '.zip'])
     return file_path
 
 
+def _get_index_dir(db_name):
+    return os.sep.join([_get_db_path(db_name), 'index'])
+
+
+def _get_index_path(ticker, db_name):
+    return os.sep.join([_get_index_dir(db_name), quote(ticker) + '.json'])
+
+
+def _day_index(ticker, db_name):
+    """
+
+    :param ticker:
+    :param db_name:
+    :return: day index of the ticker archive (see mktdatadb.zipindex)
+    """
+    return zipindex.load_index(_get_file_path(ticker, db_name), _get_index_path(ticker, db_name))
+
+
 def _ticks_from_zip(ticker, start_time, end_time, db_name, pattern='BEST'):
     """
 
@@ -42,23 +75,20 @@ def _ticks_from_zip(ticker, start_time, end_time, db_name, pattern='BEST'):
     :return:
     """
     file_path = _get_file_path(ticker, db_name)
-    start_date = start_time.date()
-    end_date = end_time.date()
-    with ZipFile(file_path, 'r') as zip_ticks:
-        logging.info('loading data from zip file %s', file_path)
-        files_list = zip_ticks.namelist()
-        for current_date in _date_range(start_date, end_date):
-            current_file = current_date.strftime('%Y%m%d') + '.csv'
-            if current_file not in files_list:
-                logging.warning('source file %s not found: ignoring', current_file)
-                continue
-
-            with zip_ticks.open(current_file, mode='r') as ticks_file:
-                for line in ticks_file:
-                    line = line.decode('UTF-8')
-                    if pattern in line:
-                        parsed = line.strip().split(',')
-                        yield parsed
+    days = _day_index(ticker, db_name)
+    logging.info('loading data from zip file %s', file_path)
+    for current_date in _date_range(start_time.date(), end_time.date()):
+        entry = days.get(current_date.strftime('%Y%m%d'))
+        if entry is None:
+            logging.warning('source file %s.csv not found: ignoring', current_date.strftime('%Y%m%d'))
+            continue
+
+        with zipindex.open_member(file_path, entry) as ticks_file:
+            for line in ticks_file:
+                line = line.decode('UTF-8')
+                if pattern in line:
+                    parsed = line.strip().split(',')
+                    yield parsed
 
 
 def ticks_trades(ticker, start_time, end_time, db_name='equities'):
@@ -104,8 +134,223 @@ def _ticks_quotes(ticker, start_time, end_time, db_name='equities'):
             current_ask_second = None
 
 
+def _parse_csv(ticks_file):
+    """
+    Parses a whole daily CSV member in one go into columns.
+
+    :param ticks_file: binary or text file object for a daily CSV file
+    :return: pandas.DataFrame with columns ts (int64 epoch-ns, UTC), type (categorical), price, size (int32), conditions
+    """
+    df = pandas.read_csv(ticks_file, header=None, names=_CSV_COLUMNS, dtype={'type': str, 'conditions': str},
+                         keep_default_na=False)
+    return _columnar(df)
+
+
+def _columnar(df):
+    columns = OrderedDict()
+    timestamps = pandas.to_datetime(df['ts'], format=_CSV_TIMESTAMP_FORMAT)
+    columns['ts'] = timestamps.values.astype('datetime64[ns]').view(numpy.int64)
+    columns['type'] = pandas.Categorical(df['type'].values)
+    columns['price'] = df['price'].values.astype(numpy.float64)
+    columns['size'] = df['size'].values.astype(numpy.int32)
+    columns['conditions'] = df['conditions'].values
+    return pandas.DataFrame(columns)
+
+
+def _select(ticks, pattern='BEST', price_scale=None):
+    """
+
+    :param ticks: columnar ticks as returned by _parse_csv
+    :param pattern: 'BEST' for bid-ask, 'TRADE' for trades
+    :param price_scale: None for float64 prices, otherwise prices are stored as int64 multiples of 1 / price_scale
+    :return:
+    """
+    selected = ticks[ticks['type'].astype(str).str.contains(pattern, regex=False).values].reset_index(drop=True)
+    if price_scale is not None:
+        selected['price'] = numpy.round(selected['price'].values * price_scale).astype(numpy.int64)
+
+    return selected
+
+
+def _frame_from_csv(ticks_file, pattern='BEST', price_scale=None):
+    return _select(_parse_csv(ticks_file), pattern=pattern, price_scale=price_scale)
+
+
+def _frames_from_zip(ticker, start_time, end_time, db_name, pattern='BEST', price_scale=None):
+    """
+    Bulk counterpart of _ticks_from_zip: yields one columnar frame per daily file.
+    Days already present in the columnar store are read from there, the zip archive is only opened for missing days.
+
+    :param ticker:
+    :param start_time: start time (UTC)
+    :param end_time: end time (UTC)
+    :param pattern: 'BEST' for bid-ask, 'TRADE' for trades
+    :param price_scale: see _select
+    :return:
+    """
+    file_path = _get_file_path(ticker, db_name)
+    store_path = _get_store_path(db_name)
+    days = None
+    for current_date in _date_range(start_time.date(), end_time.date()):
+        if store.has_partition(store_path, ticker, current_date):
+            ticks = store.read_partition(store_path, ticker, current_date)
+            yield _select(ticks, pattern=pattern, price_scale=price_scale)
+            continue
+
+        if days is None:
+            days = _day_index(ticker, db_name)
+
+        entry = days.get(current_date.strftime('%Y%m%d'))
+        if entry is None:
+            logging.warning('source file %s.csv not found: ignoring', current_date.strftime('%Y%m%d'))
+            continue
+
+        with zipindex.open_member(file_path, entry) as ticks_file:
+            yield _frame_from_csv(ticks_file, pattern=pattern, price_scale=price_scale)
+
+
+def _available_dates(ticker, start_date, end_date, db_name):
+    """
+
+    :param ticker:
+    :param start_date: included
+    :param end_date: included
+    :param db_name:
+    :return: sorted list of dates with data, either in the columnar store or in the zip archive
+    """
+    stored = [current_date for current_date in store.list_partitions(_get_store_path(db_name), ticker)
+              if start_date <= current_date <= end_date]
+    archived = zipindex.dates_in_range(_day_index(ticker, db_name), start_date, end_date)
+    return sorted(set(stored) | set(archived))
+
+
+def plan_load(ticker, start_date, end_date, db_name='equities'):
+    """
+    Estimates the cost of loading a date range from the day index, without reading any tick.
+
+    :param ticker:
+    :param start_date: included
+    :param end_date: included
+    :param db_name:
+    :return: pandas.DataFrame indexed by date with columns source, rows, compress_size, file_size, first_ts, last_ts
+    """
+    store_path = _get_store_path(db_name)
+    days = _day_index(ticker, db_name)
+    plan = list()
+    for current_date in _available_dates(ticker, start_date, end_date, db_name):
+        entry = days.get(current_date.strftime('%Y%m%d'), dict())
+        source = 'store' if store.has_partition(store_path, ticker, current_date) else 'zip'
+        plan.append(OrderedDict([
+            ('date', current_date),
+            ('source', source),
+            ('rows', entry.get('rows')),
+            ('compress_size', entry.get('compress_size')),
+            ('file_size', entry.get('file_size')),
+            ('first_ts', entry.get('first_ts')),
+            ('last_ts', entry.get('last_ts')),
+        ]))
+
+    columns = ['date', 'source', 'rows', 'compress_size', 'file_size', 'first_ts', 'last_ts']
+    return pandas.DataFrame(plan, columns=columns).set_index('date')
+
+
+def _concat_frames(frames):
+    frames = list(frames)
+    if not frames:
+        return _columnar(pandas.DataFrame(columns=_CSV_COLUMNS))
+
+    return pandas.concat(frames, ignore_index=True)
+
+
+def _concat_reduced(frames):
+    frames = list(frames)
+    if not frames:
+        return _last_quotes_per_second(_concat_frames(frames), drop_last=False)
+
+    return pandas.concat(frames, ignore_index=True)
+
+
+def ticks_trades_frame(ticker, start_time, end_time, db_name='equities', price_scale=None):
+    """
+    Columnar equivalent of ticks_trades.
+
+    :return: pandas.DataFrame with columns ts, price, size, conditions
+    """
+    trades = _concat_frames(_frames_from_zip(ticker, start_time, end_time, db_name, pattern='TRADE',
+                                             price_scale=price_scale))
+    return trades[['ts', 'price', 'size', 'conditions']]
+
+
+def _last_quotes_per_second(quotes, drop_last=True):
+    """
+    Keeps the last bid and the last ask of each run of identical timestamps, bid first, as _ticks_quotes does.
+
+    :param quotes: columnar quotes as returned by _frame_from_csv
+    :param drop_last: drops the final run, matching the pairwise iteration of the generator
+    :return:
+    """
+    timestamps = quotes['ts'].values
+    runs = numpy.cumsum(numpy.r_[True, timestamps[1:] != timestamps[:-1]]) if len(timestamps) else timestamps
+    side = pandas.Categorical(quotes['type'].astype(str), categories=_QUOTE_SIDES)
+    selected = pandas.DataFrame({'run': runs, 'side': side.codes, 'position': numpy.arange(len(quotes))})
+    selected = selected[selected['side'] >= 0]
+    if drop_last:
+        selected = selected[selected['run'] != selected['run'].max()]
+
+    selected = selected.drop_duplicates(subset=['run', 'side'], keep='last')
+    selected = selected.sort_values(['run', 'side'], kind='mergesort')
+    result = quotes.iloc[selected['position'].values][['ts', 'type', 'price', 'size']]
+    result = result.rename(columns={'type': 'side'}).reset_index(drop=True)
+    result['side'] = pandas.Categorical(result['side'].astype(str), categories=_QUOTE_SIDES)
+    return result
+
+
+def ticks_quotes_frame(ticker, start_time, end_time, db_name='equities', price_scale=None):
+    """
+    Columnar equivalent of _ticks_quotes: same rows, parsed in bulk.
+
+    :param ticker:
+    :param start_time:
+    :param end_time:
+    :param db_name:
+    :param price_scale: see _frame_from_csv
+    :return: pandas.DataFrame with columns ts (int64 epoch-ns), side (categorical), price, size (int32)
+    """
+    quotes = _concat_frames(_frames_from_zip(ticker, start_time, end_time, db_name, pattern='BEST',
+                                             price_scale=price_scale))
+    return _last_quotes_per_second(quotes)
+
+
+def _session_bounds(local_date, market_on_time, market_off_time, timezone_local):
+    """
+    Trading session of one local day, using the DST rules of the market timezone.
+
+    :param local_date:
+    :param market_on_time: string representing trading start time ('HHMMSS')
+    :param market_off_time: string representing trading end time ('HHMMSS')
+    :param timezone_local: pytz timezone
+    :return: tuple (start, end) as naive UTC datetimes
+    """
+    bounds = list()
+    for local_time in (market_on_time, market_off_time):
+        local_datetime = datetime.combine(local_date, datetime.strptime(local_time, '%H%M%S').time())
+        utc_datetime = timezone_local.localize(local_datetime).astimezone(pytz.UTC)
+        bounds.append(utc_datetime.replace(tzinfo=None))
+
+    return tuple(bounds)
+
+
+def _session_bounds_around(utc_date, market_on_time, market_off_time, timezone_local):
+    """
+    Sessions of the local days that may contain ticks of the given UTC day.
+    """
+    return [_session_bounds(utc_date + timedelta(offset), market_on_time, market_off_time, timezone_local)
+            for offset in (-1, 0, 1)]
+
+
 def _time_filter(ticks_data, start_time_local_str, end_time_local_str, timezone_local):
     """
+    Session bounds are computed once per UTC day and compared to the timestamp strings directly.
 
     :param ticks_data:
     :param start_time_local_str: start time as a string ('%H%M%S')
@@ -113,15 +358,22 @@ def _time_filter(ticks_data, start_time_local_str, end_time_local_str, timezone_
     :param timezone_local:
     :return:
     """
+    bounds_by_utc_day = dict()
     for tick_data in ticks_data:
-        tick_year_utc, tick_month_utc, tick_day_utc = [int(value) for value in tick_data[0][:10].split('-')]
-        tick_hour_utc, tick_minute_utc, tick_second_utc = [int(value) for value in tick_data[0][11:19].split(':')]
-        tick_datetime_utc = datetime(tick_year_utc, tick_month_utc, tick_day_utc, tick_hour_utc, tick_minute_utc,
-                                     tick_second_utc, tzinfo=pytz.UTC)
-        tick_datetime_local = tick_datetime_utc.astimezone(timezone_local)
-        tick_datetime_local_str = tick_datetime_local.strftime('%H%M%S')
-        if start_time_local_str <= tick_datetime_local_str < end_time_local_str:
-            yield tick_data
+        utc_day = tick_data[0][:10]
+        bounds = bounds_by_utc_day.get(utc_day)
+        if bounds is None:
+            utc_date = datetime.strptime(utc_day, '%Y-%m-%d').date()
+            sessions = _session_bounds_around(utc_date, start_time_local_str, end_time_local_str, timezone_local)
+            bounds = [(start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+                      for start, end in sessions]
+            bounds_by_utc_day[utc_day] = bounds
+
+        tick_time = tick_data[0][:19]
+        for start, end in bounds:
+            if start <= tick_time < end:
+                yield tick_data
+                break
 
 
 def load_tick_data(ticker, start_datetime, end_datetime, market_on_time, market_off_time, market_timezone):
@@ -161,26 +413,188 @@ def load_book_states(ticker, start_datetime, end_datetime, market_on_time, marke
         yield book_state.copy()
 
 
+def _session_mask(timestamps, market_on_time, market_off_time, market_timezone):
+    """
+    Vectorized session filter: session bounds are computed once per day, then located by binary search.
+
+    :param timestamps: int64 epoch-ns array (UTC)
+    :param market_on_time: string representing trading start time ('HHMMSS')
+    :param market_off_time: string representing trading end time ('HHMMSS')
+    :param market_timezone: timezone name or pytz timezone
+    :return: boolean array, True for timestamps within the trading session
+    """
+    timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+    mask = numpy.zeros(len(timestamps), dtype=bool)
+    if len(timestamps) == 0 or market_on_time >= market_off_time:
+        return mask
+
+    timezone_local = market_timezone
+    if isinstance(timezone_local, str):
+        timezone_local = pytz.timezone(timezone_local)
+
+    first_date = pandas.Timestamp(timestamps.min()).date() - timedelta(1)
+    last_date = pandas.Timestamp(timestamps.max()).date() + timedelta(1)
+    sessions = [_session_bounds(local_date, market_on_time, market_off_time, timezone_local)
+                for local_date in _date_range(first_date, last_date)]
+    starts = numpy.array([pandas.Timestamp(start).value for start, end in sessions], dtype=numpy.int64)
+    ends = numpy.array([pandas.Timestamp(end).value for start, end in sessions], dtype=numpy.int64)
+    session_index = numpy.searchsorted(starts, timestamps, side='right') - 1
+    candidates = session_index >= 0
+    mask[candidates] = timestamps[candidates] < ends[session_index[candidates]]
+    return mask
+
+
+def _book_states_from_quotes(quotes):
+    """
+    Columnar equivalent of the book state accumulation in load_book_states.
+
+    :param quotes: quotes as returned by ticks_quotes_frame
+    :return: pandas.DataFrame with columns ts, v_bid, bid, ask, v_ask
+    """
+    is_bid = (quotes['side'].astype(str) == 'BEST_BID').values
+    prices = quotes['price'].values.astype(numpy.float64)
+    sizes = quotes['size'].values.astype(numpy.float64)
+    book_states = pandas.DataFrame(OrderedDict([
+        ('ts', quotes['ts'].values),
+        ('v_bid', numpy.where(is_bid, sizes, numpy.nan)),
+        ('bid', numpy.where(is_bid, prices, numpy.nan)),
+        ('ask', numpy.where(is_bid, numpy.nan, prices)),
+        ('v_ask', numpy.where(is_bid, numpy.nan, sizes)),
+    ]))
+    book_columns = ['v_bid', 'bid', 'ask', 'v_ask']
+    book_states[book_columns] = book_states[book_columns].ffill()
+    return book_states
+
+
+def book_states_frame(ticker, start_datetime, end_datetime, market_on_time, market_off_time, market_timezone,
+                      db_name='equities'):
+    """
+    Bulk counterpart of load_book_states.
+
+    :param ticker:
+    :param start_datetime:
+    :param end_datetime:
+    :param market_on_time: string representing trading start time ('HHMMSS')
+    :param market_off_time: string representing trading end time ('HHMMSS')
+    :param market_timezone:
+    :param db_name:
+    :return: pandas.DataFrame with columns ts (int64 epoch-ns), v_bid, bid, ask, v_ask
+    """
+    quotes = _concat_frames(_frames_from_zip(ticker, start_datetime, end_datetime, db_name, pattern='BEST'))
+    return _book_states_from_ticks(quotes, market_on_time, market_off_time, market_timezone)
+
+
+def _book_states_from_ticks(quotes, market_on_time, market_off_time, market_timezone):
+    quotes = _last_quotes_per_second(quotes, drop_last=False)
+    return _book_states_from_reduced(quotes, market_on_time, market_off_time, market_timezone)
+
+
+def _book_states_from_reduced(quotes, market_on_time, market_off_time, market_timezone):
+    """
+    Book states from quotes already reduced to the last bid and ask per second, day by day.
+    Since days never share a second, reducing each day separately only differs from reducing the whole range by the
+    final second, which is dropped here.
+
+    :param quotes: concatenation of per-day results of _last_quotes_per_second(drop_last=False)
+    :param market_on_time:
+    :param market_off_time:
+    :param market_timezone:
+    :return:
+    """
+    timestamps = quotes['ts'].values
+    if len(timestamps):
+        quotes = quotes[timestamps != timestamps[-1]]
+
+    in_session = _session_mask(quotes['ts'].values, market_on_time, market_off_time, market_timezone)
+    return _book_states_from_quotes(quotes[in_session])
+
+
+def _load_quotes_day(ticker, current_date, db_name):
+    """
+    Unit of work for parallel loading: decodes the quotes of one ticker-day and reduces them to one bid and one ask
+    per second.
+
+    :param ticker:
+    :param current_date:
+    :param db_name:
+    :return: tuple (ticker, date, reduced quotes, elapsed seconds, worker process id)
+    """
+    started = time.time()
+    day_start = datetime(current_date.year, current_date.month, current_date.day)
+    quotes = _concat_frames(_frames_from_zip(ticker, day_start, day_start, db_name, pattern='BEST'))
+    quotes = _last_quotes_per_second(quotes, drop_last=False)
+    return ticker, current_date, quotes, time.time() - started, os.getpid()
+
+
+def ingest(ticker, db_name='equities', start_date=None, end_date=None, overwrite=False):
+    """
+    Converts the daily CSV files of a ticker archive into columnar store partitions.
+
+    :param ticker:
+    :param db_name:
+    :param start_date: first date to convert (included), None for no lower bound
+    :param end_date: last date to convert (included), None for no upper bound
+    :param overwrite: when False, days already in the store are skipped
+    :return: list of converted dates
+    """
+    file_path = _get_file_path(ticker, db_name)
+    store_path = _get_store_path(db_name)
+    days = _day_index(ticker, db_name)
+    converted = list()
+    logging.info('ingesting zip file %s', file_path)
+    for current_date in zipindex.dates_in_range(days, start_date, end_date):
+        if not overwrite and store.has_partition(store_path, ticker, current_date):
+            continue
+
+        with zipindex.open_member(file_path, days[current_date.strftime('%Y%m%d')]) as ticks_file:
+            ticks = _parse_csv(ticks_file)
+
+        store.write_partition(store_path, ticker, current_date, ticks)
+        converted.append(current_date)
+
+    logging.info('ingested %d day(s) for %s', len(converted), ticker)
+    return converted
+
+
 def list_tickers(db_name):
-    tickers = list()
-    for filename in glob.glob(os.sep.join([_get_db_path(db_name), '*.zip'])):
-        ticker = unquote(os.path.basename(filename).split('.')[0])
-        tickers.append(ticker)
+    """
+    Tickers with a day index or with partitions in the columnar store, without listing the archives themselves:
+    archives are indexed when first loaded or ingested.
+
+    :param db_name:
+    :return: sorted list of tickers
+    """
+    tickers = set(store.list_tickers(_get_store_path(db_name)))
+    index_dir = _get_index_dir(db_name)
+    if os.path.isdir(index_dir):
+        tickers.update(unquote(filename[:-len('.json')]) for filename in os.listdir(index_dir)
+                       if filename.endswith('.json'))
 
     return sorted(tickers)
 
 
+def list_archived_tickers(db_name):
+    """
+    Tickers having a zip archive, indexed or not: scans the database directory, for discovering new archives.
+
+    :param db_name:
+    :return: sorted list of tickers
+    """
+    return sorted(unquote(filename[:-len('.zip')]) for filename in os.listdir(_get_db_path(db_name))
+                  if filename.endswith('.zip'))
+
+
 def get_date_range(ticker, db_name):
-    file_path = _get_file_path(ticker, db_name)
-    with ZipFile(file_path, 'r') as zip_ticks:
-        logging.debug('loading data from zip file %s', file_path)
-        files_list = sorted(zip_ticks.namelist())
+    dates = sorted(set(store.list_partitions(_get_store_path(db_name), ticker)) |
+                   set(zipindex.dates_in_range(_day_index(ticker, db_name), None, None)))
+    return dates[0].strftime('%Y-%m-%d'), dates[-1].strftime('%Y-%m-%d')
 
-    start_date = files_list[0][:-4]
-    end_date = files_list[-1][:-4]
-    start_date_split = '%s-%s-%s' % (start_date[:4], start_date[4:6], start_date[6:8])
-    end_date_split = '%s-%s-%s' % (end_date[:4], end_date[4:6], end_date[6:8])
-    return start_date_split, end_date_split
+
+def _indexed_by_timestamp(book_states):
+    df = book_states.copy()
+    df['ts'] = pandas.to_datetime(df['ts'])
+    df.set_index('ts', inplace=True)
+    return df
 
 
 class LoaderARCA(object):
@@ -188,16 +602,21 @@ class LoaderARCA(object):
     Loading equities from NYSE ARCA.
     """
 
-    def __init__(self):
+    def __init__(self, cache=None):
+        """
+
+        :param cache: optional mktdatadb.cache.BookStateCache, loads then only decode the days missing from the cache
+        """
         self._on_time = ON_TIME_NYSEARCA
         self._off_time = OFF_TIME_NYSEARCA
         self._timezone = TZ_NYSEARCA
         self._db_name = 'equities'
+        self._cache = cache
 
     def list_tickers(self):
         return list_tickers(self._db_name)
 
-    def load_book_states(self, ticker, start_date=None, end_date=None):
+    def _full_date_range(self, ticker, start_date, end_date):
         full_start_date, full_end_date = get_date_range(ticker, self._db_name)
         if start_date is None:
             start_date = datetime.strptime(full_start_date, '%Y-%m-%d')
@@ -205,10 +624,168 @@ class LoaderARCA(object):
         if end_date is None:
             end_date = datetime.strptime(full_end_date, '%Y-%m-%d')
 
+        return start_date, end_date
+
+    def _book_states_frame(self, ticker, start_date, end_date):
+        start_date, end_date = self._full_date_range(ticker, start_date, end_date)
         logging.info('loading %s for date range: %s through %s', ticker, start_date, end_date)
-        book_states = load_book_states(ticker, start_date, end_date, self._on_time, self._off_time, self._timezone)
-        df = pandas.DataFrame.from_dict(list(book_states))
-        df['ts'] = pandas.to_datetime(df['ts'])
-        df.drop_duplicates(subset='ts', keep='last', inplace=True)
-        df.set_index('ts', inplace=True)
-        return df
+        df = book_states_frame(ticker, start_date, end_date, self._on_time, self._off_time, self._timezone,
+                               db_name=self._db_name)
+        return df.drop_duplicates(subset='ts', keep='last')
+
+    def load_book_states(self, ticker, start_date=None, end_date=None):
+        if self._cache is not None:
+            return self.load_book_states_batch([ticker], start_date, end_date, processes=1)[ticker]
+
+        return _indexed_by_timestamp(self._book_states_frame(ticker, start_date, end_date))
+
+    def stream_book_states(self, tickers, start_date=None, end_date=None):
+        """
+        Lazy book states of several tickers, one generator per ticker (see load_book_states).
+
+        :param tickers:
+        :param start_date: None for the start of the data available for each ticker
+        :param end_date: None for the end of the data available for each ticker
+        :return: dict ticker -> generator of book states
+        """
+        streams = OrderedDict()
+        for ticker in tickers:
+            ticker_start_date, ticker_end_date = self._full_date_range(ticker, start_date, end_date)
+            streams[ticker] = load_book_states(ticker, ticker_start_date, ticker_end_date, self._on_time,
+                                               self._off_time, self._timezone)
+
+        return streams
+
+    def build_book_states_file(self, ticker, start_date=None, end_date=None, append=False):
+        """
+        Writes the book states of a ticker to its fixed-width binary file.
+
+        :param ticker:
+        :param start_date:
+        :param end_date:
+        :param append: when True, only states more recent than the end of the existing file are added
+        :return: number of records written
+        """
+        df = self._book_states_frame(ticker, start_date, end_date)
+        file_path = _get_books_path(ticker, self._db_name)
+        if append:
+            return books.append_book_states(file_path, df)
+
+        return books.write_book_states(file_path, df)
+
+    def map_book_states(self, ticker):
+        """
+
+        :param ticker:
+        :return: read-only numpy.memmap over the book states file of the ticker (see mktdatadb.books)
+        """
+        return books.map_book_states(_get_books_path(ticker, self._db_name))
+
+    def map_panel(self, tickers, start_date=None, end_date=None):
+        """
+        Memory-mapped book states for several tickers, sliced by time without copying.
+
+        :param tickers:
+        :param start_date: included, None for no lower bound
+        :param end_date: excluded, None for no upper bound
+        :return: dict ticker -> view on the mapped records
+        """
+        mapped_by_ticker = {ticker: self.map_book_states(ticker) for ticker in tickers}
+        return books.slice_panel(mapped_by_ticker, start_date, end_date)
+
+    def load_book_states_batch(self, tickers, start_date=None, end_date=None, processes=None, aligned=False):
+        """
+        Loads several tickers at once, decoding ticker-days across a process pool.
+        When the loader has a cache, only the ticker-days missing from the cache are decoded, then added to it.
+
+        :param tickers:
+        :param start_date: None for the start of the data available for each ticker
+        :param end_date: None for the end of the data available for each ticker
+        :param processes: size of the process pool, None for one process per CPU, 1 for loading in-process
+        :param aligned: when True, returns a single frame with columns (ticker, field) aligned on timestamps
+        :return: dict ticker -> book states, or aligned panel
+        """
+        dates_by_ticker = OrderedDict()
+        for ticker in tickers:
+            ticker_start_date, ticker_end_date = self._full_date_range(ticker, start_date, end_date)
+            dates_by_ticker[ticker] = _available_dates(ticker, ticker_start_date.date(), ticker_end_date.date(),
+                                                       self._db_name)
+
+        tasks = list()
+        for ticker, dates in dates_by_ticker.items():
+            if self._cache is not None:
+                dates = self._cache.missing_dates(ticker, dates)
+
+            tasks.extend((ticker, current_date, self._db_name) for current_date in dates)
+
+        count_days = sum(len(dates) for dates in dates_by_ticker.values())
+        logging.info('loading %d ticker-day(s) for %d ticker(s), %d from cache', count_days, len(tickers),
+                     count_days - len(tasks))
+        started = time.time()
+        quotes_by_ticker_day = dict()
+        timing_by_worker = dict()
+
+        def collect(result):
+            ticker, current_date, quotes, elapsed, worker = result
+            quotes_by_ticker_day[(ticker, current_date)] = quotes
+            if self._cache is not None:
+                self._cache.write(ticker, current_date, quotes)
+
+            count_tasks, total_elapsed = timing_by_worker.get(worker, (0, 0.))
+            timing_by_worker[worker] = count_tasks + 1, total_elapsed + elapsed
+            logging.info('[%d/%d] worker %d loaded %s %s (%d quotes) in %.3fs', len(quotes_by_ticker_day), len(tasks),
+                         worker, ticker, current_date, len(quotes), elapsed)
+
+        if processes == 1:
+            for task in tasks:
+                collect(_load_quotes_day(*task))
+
+        elif tasks:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(_load_quotes_day, *task) for task in tasks]
+                for future in as_completed(futures):
+                    collect(future.result())
+
+        for worker in sorted(timing_by_worker):
+            count_tasks, total_elapsed = timing_by_worker[worker]
+            logging.info('worker %d: %d ticker-day(s) in %.3fs', worker, count_tasks, total_elapsed)
+
+        logging.info('loaded %d ticker-day(s) in %.3fs', len(tasks), time.time() - started)
+        book_states_by_ticker = OrderedDict()
+        for ticker, dates in dates_by_ticker.items():
+            quotes_list = list()
+            for current_date in dates:
+                quotes = quotes_by_ticker_day.get((ticker, current_date))
+                if quotes is None:
+                    quotes = self._cache.read(ticker, current_date)
+
+                quotes_list.append(quotes)
+
+            quotes = _concat_reduced(quotes_list)
+            df = _book_states_from_reduced(quotes, self._on_time, self._off_time, self._timezone)
+            book_states_by_ticker[ticker] = _indexed_by_timestamp(df.drop_duplicates(subset='ts', keep='last'))
+
+        if self._cache is not None:
+            self._cache.evict(keep=[(ticker, current_date) for ticker, dates in dates_by_ticker.items()
+                                    for current_date in dates])
+
+        if not aligned:
+            return book_states_by_ticker
+
+        return merge.asof_panel(book_states_by_ticker, fields=['v_bid', 'bid', 'ask', 'v_ask'])
+
+    def plan_load(self, tickers, start_date=None, end_date=None):
+        """
+        Cost of loading the tickers over the date range, per ticker-day, as given by the day indexes.
+
+        :param tickers:
+        :param start_date:
+        :param end_date:
+        :return: pandas.DataFrame indexed by (ticker, date)
+        """
+        plans = OrderedDict()
+        for ticker in tickers:
+            ticker_start_date, ticker_end_date = self._full_date_range(ticker, start_date, end_date)
+            plans[ticker] = plan_load(ticker, ticker_start_date.date(), ticker_end_date.date(), self._db_name)
+
+        return pandas.concat(plans, names=['ticker', 'date'])
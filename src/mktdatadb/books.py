@@ -0,0 +1,162 @@
+"""
+Fixed-width binary book-state files, one per ticker, exposed through numpy.memmap.
+
+Each record holds ts (int64 epoch-ns, UTC), bid, ask (float64, NaN when unknown) and v_bid, v_ask (int32, 0 when
+unknown). Records are sorted by timestamp so that time slices are obtained by binary search, as views on the mapping.
+"""
+import logging
+import os
+
+import numpy
+import pandas
+
+__author__ = 'Christophe'
+
+BOOK_STATE_DTYPE = numpy.dtype([
+    ('ts', '<i8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+    ('v_bid', '<i4'),
+    ('v_ask', '<i4'),
+])
+
+
+def _to_records(book_states):
+    """
+
+    :param book_states: pandas.DataFrame with columns ts (int64 epoch-ns), v_bid, bid, ask, v_ask
+    :return: numpy structured array of BOOK_STATE_DTYPE
+    """
+    records = numpy.empty(len(book_states), dtype=BOOK_STATE_DTYPE)
+    records['ts'] = book_states['ts'].values.astype(numpy.int64)
+    records['bid'] = book_states['bid'].values.astype(numpy.float64)
+    records['ask'] = book_states['ask'].values.astype(numpy.float64)
+    records['v_bid'] = numpy.nan_to_num(book_states['v_bid'].values.astype(numpy.float64)).astype(numpy.int32)
+    records['v_ask'] = numpy.nan_to_num(book_states['v_ask'].values.astype(numpy.float64)).astype(numpy.int32)
+    return records
+
+
+def _to_nanoseconds(timestamp):
+    if timestamp is None:
+        return None
+
+    return pandas.Timestamp(timestamp).value
+
+
+def _search_left(timestamps, value):
+    """
+    Binary search over a possibly strided column, avoiding the contiguous copy numpy.searchsorted would make.
+    """
+    low = 0
+    high = len(timestamps)
+    while low < high:
+        middle = (low + high) // 2
+        if timestamps[middle] < value:
+            low = middle + 1
+
+        else:
+            high = middle
+
+    return low
+
+
+def write_book_states(file_path, book_states):
+    """
+    Writes book states to a fixed-width binary file, replacing any existing content.
+
+    :param file_path:
+    :param book_states: pandas.DataFrame with columns ts (int64 epoch-ns), v_bid, bid, ask, v_ask, sorted by ts
+    :return: number of records written
+    """
+    if not os.path.isdir(os.path.dirname(file_path)):
+        os.makedirs(os.path.dirname(file_path))
+
+    records = _to_records(book_states)
+    temp_path = file_path + '.tmp'
+    records.tofile(temp_path)
+    os.replace(temp_path, file_path)
+    logging.debug('written %d book states to %s', len(records), file_path)
+    return len(records)
+
+
+def append_book_states(file_path, book_states):
+    """
+    Appends book states more recent than the last record of the file.
+
+    :param file_path:
+    :param book_states: pandas.DataFrame with columns ts (int64 epoch-ns), v_bid, bid, ask, v_ask, sorted by ts
+    :return: number of records appended
+    """
+    if not os.path.isfile(file_path):
+        return write_book_states(file_path, book_states)
+
+    records = _to_records(book_states)
+    mapped = map_book_states(file_path)
+    if len(mapped) > 0:
+        records = records[records['ts'] > mapped['ts'][-1]]
+
+    del mapped
+    with open(file_path, mode='ab') as book_file:
+        records.tofile(book_file)
+
+    return len(records)
+
+
+def map_book_states(file_path):
+    """
+
+    :param file_path:
+    :return: read-only numpy.memmap of BOOK_STATE_DTYPE records
+    """
+    if os.path.getsize(file_path) == 0:
+        return numpy.empty(0, dtype=BOOK_STATE_DTYPE)
+
+    return numpy.memmap(file_path, dtype=BOOK_STATE_DTYPE, mode='r')
+
+
+def slice_book_states(mapped, start_time=None, end_time=None):
+    """
+    Selects records with start_time <= ts < end_time without copying.
+
+    :param mapped: records as returned by map_book_states
+    :param start_time: anything pandas.Timestamp accepts, None for no lower bound
+    :param end_time: anything pandas.Timestamp accepts, None for no upper bound
+    :return: view on the mapped records
+    """
+    start_index = 0
+    end_index = len(mapped)
+    if start_time is not None:
+        start_index = _search_left(mapped['ts'], _to_nanoseconds(start_time))
+
+    if end_time is not None:
+        end_index = _search_left(mapped['ts'], _to_nanoseconds(end_time))
+
+    return mapped[start_index:end_index]
+
+
+def slice_panel(mapped_by_ticker, start_time=None, end_time=None):
+    """
+
+    :param mapped_by_ticker: dict ticker -> records as returned by map_book_states
+    :param start_time:
+    :param end_time:
+    :return: dict ticker -> view on the records within [start_time, end_time)
+    """
+    return {ticker: slice_book_states(mapped, start_time, end_time) for ticker, mapped in mapped_by_ticker.items()}
+
+
+def to_frame(records):
+    """
+    Materializes records as a DataFrame indexed by timestamp, same layout as LoaderARCA.load_book_states.
+
+    :param records:
+    :return:
+    """
+    df = pandas.DataFrame({
+        'v_bid': records['v_bid'],
+        'bid': records['bid'],
+        'ask': records['ask'],
+        'v_ask': records['v_ask'],
+    }, columns=['v_bid', 'bid', 'ask', 'v_ask'], index=pandas.to_datetime(records['ts']))
+    df.index.name = 'ts'
+    return df
@@ -0,0 +1,161 @@
+"""
+Append-only cache of per-day reduced quotes (last bid and last ask of each second), keyed by ticker and date:
+
+    <cache path>/<encoded ticker>/<YYYYMMDD>.npz
+
+Days are written once and never modified. Reading a day refreshes its modification time, which is used to evict the
+least recently used days when the cache grows beyond its size limit.
+"""
+import logging
+import os
+from urllib.parse import quote
+
+import numpy
+import pandas
+
+__author__ = 'Christophe'
+
+_DAY_EXTENSION = '.npz'
+_QUOTE_SIDES = ['BEST_BID', 'BEST_ASK']
+
+
+class BookStateCache(object):
+    """
+    Per ticker-day cache used by LoaderARCA.
+    """
+
+    def __init__(self, cache_path, max_bytes=None):
+        """
+
+        :param cache_path: root directory of the cache
+        :param max_bytes: size limit of the cache directory, None for unbounded
+        """
+        self._cache_path = cache_path
+        self._max_bytes = max_bytes
+
+    @property
+    def cache_path(self):
+        return self._cache_path
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def _day_path(self, ticker, current_date):
+        return os.sep.join([self._cache_path, quote(ticker), current_date.strftime('%Y%m%d') + _DAY_EXTENSION])
+
+    def contains(self, ticker, current_date):
+        return os.path.isfile(self._day_path(ticker, current_date))
+
+    def missing_dates(self, ticker, dates):
+        """
+
+        :param ticker:
+        :param dates: requested dates
+        :return: requested dates not in the cache, in the same order
+        """
+        return [current_date for current_date in dates if not self.contains(ticker, current_date)]
+
+    def write(self, ticker, current_date, quotes):
+        """
+
+        :param ticker:
+        :param current_date:
+        :param quotes: reduced quotes with columns ts (int64 epoch-ns), side, price, size
+        :return:
+        """
+        day_path = self._day_path(ticker, current_date)
+        if os.path.isfile(day_path):
+            return
+
+        if not os.path.isdir(os.path.dirname(day_path)):
+            os.makedirs(os.path.dirname(day_path))
+
+        sides = pandas.Categorical(quotes['side'].astype(str), categories=_QUOTE_SIDES)
+        temp_path = day_path + '.tmp'
+        with open(temp_path, mode='wb') as day_file:
+            numpy.savez(day_file,
+                        ts=quotes['ts'].values.astype(numpy.int64),
+                        side=sides.codes.astype(numpy.int8),
+                        price=quotes['price'].values.astype(numpy.float64),
+                        size=quotes['size'].values.astype(numpy.int32))
+
+        os.replace(temp_path, day_path)
+
+    def read(self, ticker, current_date):
+        """
+
+        :param ticker:
+        :param current_date:
+        :return: reduced quotes with columns ts (int64 epoch-ns), side (categorical), price, size
+        """
+        day_path = self._day_path(ticker, current_date)
+        with numpy.load(day_path) as data:
+            quotes = pandas.DataFrame({
+                'ts': data['ts'],
+                'side': pandas.Categorical.from_codes(data['side'], categories=_QUOTE_SIDES),
+                'price': data['price'],
+                'size': data['size'],
+            }, columns=['ts', 'side', 'price', 'size'])
+
+        os.utime(day_path, None)
+        return quotes
+
+    def _entries(self):
+        entries = list()
+        if not os.path.isdir(self._cache_path):
+            return entries
+
+        for ticker_dir in os.listdir(self._cache_path):
+            ticker_path = os.sep.join([self._cache_path, ticker_dir])
+            if not os.path.isdir(ticker_path):
+                continue
+
+            for filename in os.listdir(ticker_path):
+                if filename.endswith(_DAY_EXTENSION):
+                    day_path = os.sep.join([ticker_path, filename])
+                    day_stat = os.stat(day_path)
+                    entries.append((day_stat.st_mtime, day_stat.st_size, day_path))
+
+        return entries
+
+    def size(self):
+        """
+
+        :return: total size in bytes of the cached days
+        """
+        return sum(day_size for day_mtime, day_size, day_path in self._entries())
+
+    def evict(self, max_bytes=None, keep=None):
+        """
+        Removes least recently used days until the cache fits the size limit.
+
+        :param max_bytes: size limit, defaults to the limit of the cache
+        :param keep: (ticker, date) pairs that must not be evicted
+        :return: number of evicted days
+        """
+        if max_bytes is None:
+            max_bytes = self._max_bytes
+
+        if max_bytes is None:
+            return 0
+
+        kept_paths = set(self._day_path(ticker, current_date) for ticker, current_date in (keep or list()))
+        entries = sorted(self._entries())
+        total_size = sum(day_size for day_mtime, day_size, day_path in entries)
+        count_evicted = 0
+        for day_mtime, day_size, day_path in entries:
+            if total_size <= max_bytes:
+                break
+
+            if day_path in kept_paths:
+                continue
+
+            os.remove(day_path)
+            total_size -= day_size
+            count_evicted += 1
+
+        if count_evicted:
+            logging.info('evicted %d day(s) from cache %s', count_evicted, self._cache_path)
+
+        return count_evicted
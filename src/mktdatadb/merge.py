@@ -0,0 +1,146 @@
+"""
+Merging of per-ticker timestamped records: lazy k-way merge of streams into a single timestamp-ordered stream, and
+vectorized as-of alignment of arrays on a common timeline.
+"""
+import heapq
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+__author__ = 'Christophe'
+
+_NANOSECONDS_PER_SECOND = 1000000000
+_NANOSECONDS_PER_DAY = 86400 * _NANOSECONDS_PER_SECOND
+
+
+def _record_timestamp(record):
+    return record['ts']
+
+
+def _decorated(stream, position, key):
+    for record in stream:
+        yield key(record), position, record
+
+
+def merge_streams(streams, key=None):
+    """
+    Lazy k-way merge of timestamp-ordered streams, keeping a single pending record per stream.
+    Records with the same timestamp come out in the order of the streams, then in their order within each stream.
+
+    :param streams: dict name -> iterator of records sorted by timestamp, such as load_book_states generators
+    :param key: function returning the timestamp of a record, defaults to record['ts']
+    :return: generator of (timestamp, name, record)
+    """
+    if key is None:
+        key = _record_timestamp
+
+    names = list(streams.keys())
+    decorated_streams = [_decorated(streams[name], position, key) for position, name in enumerate(names)]
+    for timestamp, position, record in heapq.merge(*decorated_streams, key=lambda item: item[:2]):
+        yield timestamp, names[position], record
+
+
+def _columns(book_states, fields):
+    """
+
+    :param book_states: pandas.DataFrame indexed by timestamp, or records with a ts field (int64 epoch-ns)
+    :param fields:
+    :return: tuple (int64 epoch-ns timestamps, dict field -> values)
+    """
+    if isinstance(book_states, pandas.DataFrame):
+        timestamps = book_states.index.values.astype('datetime64[ns]').view(numpy.int64)
+        return timestamps, {field: book_states[field].values for field in fields}
+
+    return numpy.asarray(book_states['ts'], dtype=numpy.int64), {field: book_states[field] for field in fields}
+
+
+def asof_panel(book_states_by_ticker, fields=('bid', 'ask'), sample_every=None, start_time=None, end_time=None,
+               same_day=False, complete=False, sampling_times=None):
+    """
+    Aligns several tickers on a common timeline, each ticker taking its last known value at each point, without
+    building the sparse union frame.
+
+    :param book_states_by_ticker: dict ticker -> pandas.DataFrame indexed by timestamp or records with a ts field
+    (such as mapped book states), sorted by timestamp
+    :param fields: fields to align
+    :param sample_every: sampling period in seconds, None for sampling on any change of any ticker
+    :param start_time: first sampling time when sampling periodically, defaults to the first timestamp
+    :param end_time: sampling times are strictly before end_time, defaults to after the last timestamp
+    :param same_day: when True, values are only carried forward within the same (UTC) day
+    :param complete: when True, drops the points where a ticker has no value yet
+    :param sampling_times: explicit sorted sampling times (such as the index of a signal), overrides sample_every,
+    start_time and end_time
+    :return: pandas.DataFrame with columns (ticker, field), indexed by sampling time
+    """
+    tickers = list(book_states_by_ticker.keys())
+    columns_by_ticker = {ticker: _columns(book_states_by_ticker[ticker], fields) for ticker in tickers}
+    all_timestamps = [timestamps for timestamps, values in columns_by_ticker.values() if len(timestamps) > 0]
+    if sampling_times is not None:
+        grid = pandas.DatetimeIndex(sampling_times).values.astype('datetime64[ns]').view(numpy.int64)
+
+    elif sample_every is None:
+        grid = numpy.unique(numpy.concatenate(all_timestamps)) if all_timestamps else numpy.empty(0, numpy.int64)
+        if start_time is not None:
+            grid = grid[grid >= pandas.Timestamp(start_time).value]
+
+        if end_time is not None:
+            grid = grid[grid < pandas.Timestamp(end_time).value]
+
+    else:
+        step = int(sample_every * _NANOSECONDS_PER_SECOND)
+        first = last = 0
+        if start_time is not None:
+            first = pandas.Timestamp(start_time).value
+
+        elif all_timestamps:
+            first = min(timestamps[0] for timestamps in all_timestamps) // step * step
+
+        if end_time is not None:
+            last = pandas.Timestamp(end_time).value
+
+        elif all_timestamps:
+            last = max(timestamps[-1] for timestamps in all_timestamps) + 1
+
+        grid = numpy.arange(first, last, step, dtype=numpy.int64)
+
+    data = OrderedDict()
+    available = numpy.ones(len(grid), dtype=bool)
+    for ticker in tickers:
+        timestamps, values = columns_by_ticker[ticker]
+        positions = numpy.searchsorted(timestamps, grid, side='right') - 1
+        valid = positions >= 0
+        if same_day:
+            valid[valid] = timestamps[positions[valid]] // _NANOSECONDS_PER_DAY == grid[valid] // _NANOSECONDS_PER_DAY
+
+        available &= valid
+        for field in fields:
+            column = numpy.full(len(grid), numpy.nan)
+            column[valid] = values[field][positions[valid]]
+            data[(ticker, field)] = column
+
+    panel = pandas.DataFrame(data, index=pandas.to_datetime(grid))
+    panel.index.name = 'ts'
+    if complete:
+        panel = panel[available]
+
+    return panel
+
+
+def align_quotes(quotes_by_ticker, positions):
+    """
+    Aligns the quotes of each leg as-of onto the timestamps of target positions, each leg taking its last quote of
+    the same day. Timestamps where a leg has no quote yet that day are dropped.
+
+    :param quotes_by_ticker: dict ticker -> pandas.DataFrame of bid and ask quotes indexed by timestamp
+    :param positions: pandas.DataFrame of target positions, one column per ticker, indexed by timestamp
+    :return: tuple of bids, asks and target positions over the retained timestamps
+    """
+    tickers = list(positions.columns)
+    panel = asof_panel(OrderedDict((ticker, quotes_by_ticker[ticker]) for ticker in tickers), fields=('bid', 'ask'),
+                       same_day=True, sampling_times=positions.index)
+    available = panel.notna().values.all(axis=1)
+    index = positions.index[available]
+    bids = pandas.DataFrame(panel.xs('bid', axis=1, level=1).values[available], index=index, columns=tickers)
+    asks = pandas.DataFrame(panel.xs('ask', axis=1, level=1).values[available], index=index, columns=tickers)
+    return bids, asks, positions[available]
@@ -0,0 +1,104 @@
+"""
+On-disk columnar tick store, one compressed numpy archive per ticker and day:
+
+    <store path>/<encoded ticker>/<YYYYMMDD>.npz
+"""
+import logging
+import os
+from urllib.parse import quote, unquote
+from datetime import datetime
+
+import numpy
+import pandas
+
+__author__ = 'Christophe'
+
+_PARTITION_EXTENSION = '.npz'
+
+
+def _get_ticker_path(store_path, ticker):
+    return os.sep.join([store_path, quote(ticker)])
+
+
+def partition_path(store_path, ticker, current_date):
+    return os.sep.join([_get_ticker_path(store_path, ticker), current_date.strftime('%Y%m%d') + _PARTITION_EXTENSION])
+
+
+def has_partition(store_path, ticker, current_date):
+    return os.path.isfile(partition_path(store_path, ticker, current_date))
+
+
+def list_partitions(store_path, ticker):
+    """
+
+    :param store_path:
+    :param ticker:
+    :return: sorted list of dates available in the store for the specified ticker
+    """
+    ticker_path = _get_ticker_path(store_path, ticker)
+    if not os.path.isdir(ticker_path):
+        return list()
+
+    dates = list()
+    for filename in os.listdir(ticker_path):
+        if filename.endswith(_PARTITION_EXTENSION):
+            dates.append(datetime.strptime(filename[:-len(_PARTITION_EXTENSION)], '%Y%m%d').date())
+
+    return sorted(dates)
+
+
+def list_tickers(store_path):
+    if not os.path.isdir(store_path):
+        return list()
+
+    return sorted(unquote(name) for name in os.listdir(store_path)
+                  if os.path.isdir(os.sep.join([store_path, name])))
+
+
+def write_partition(store_path, ticker, current_date, ticks):
+    """
+    Writes one day of columnar ticks, atomically replacing any existing partition.
+
+    :param store_path:
+    :param ticker:
+    :param current_date:
+    :param ticks: pandas.DataFrame with columns ts, type (categorical), price, size, conditions
+    :return: path of the written partition
+    """
+    target_path = partition_path(store_path, ticker, current_date)
+    if not os.path.isdir(os.path.dirname(target_path)):
+        os.makedirs(os.path.dirname(target_path))
+
+    types = pandas.Categorical(ticks['type'])
+    temp_path = target_path + '.tmp'
+    with open(temp_path, mode='wb') as partition_file:
+        numpy.savez_compressed(partition_file,
+                               ts=ticks['ts'].values.astype(numpy.int64),
+                               type_codes=types.codes.astype(numpy.int8),
+                               type_categories=numpy.array(types.categories, dtype=str),
+                               price=ticks['price'].values.astype(numpy.float64),
+                               size=ticks['size'].values.astype(numpy.int32),
+                               conditions=numpy.array(ticks['conditions'].values, dtype=str))
+
+    os.replace(temp_path, target_path)
+    logging.debug('written partition %s (%d rows)', target_path, len(ticks))
+    return target_path
+
+
+def read_partition(store_path, ticker, current_date):
+    """
+
+    :param store_path:
+    :param ticker:
+    :param current_date:
+    :return: pandas.DataFrame with columns ts, type (categorical), price, size, conditions
+    """
+    with numpy.load(partition_path(store_path, ticker, current_date)) as data:
+        types = pandas.Categorical.from_codes(data['type_codes'], categories=list(data['type_categories']))
+        return pandas.DataFrame({
+            'ts': data['ts'],
+            'type': types,
+            'price': data['price'],
+            'size': data['size'],
+            'conditions': data['conditions'].astype(object),
+        }, columns=['ts', 'type', 'price', 'size', 'conditions'])
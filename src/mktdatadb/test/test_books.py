@@ -0,0 +1,62 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from unittest.mock import patch
+
+import numpy
+
+from mktdatadb import books, LoaderARCA
+
+from mktdatadb.test.test_store import build_test_archive
+
+_TICKER = 'HYG US Equity'
+
+
+class TestBookStatesFile(unittest.TestCase):
+    def setUp(self):
+        self._db_path = tempfile.mkdtemp()
+        build_test_archive(self._db_path)
+        self._db_patch = patch('mktdatadb._get_db_path', return_value=self._db_path)
+        self._db_patch.start()
+
+    def tearDown(self):
+        self._db_patch.stop()
+        shutil.rmtree(self._db_path)
+
+    def test_round_trip(self):
+        loader = LoaderARCA()
+        start_date = datetime(2015, 3, 2)
+        end_date = datetime(2015, 4, 2)
+        expected = loader.load_book_states(_TICKER, start_date, end_date)
+        self.assertEqual(len(expected), loader.build_book_states_file(_TICKER, start_date, end_date))
+        mapped = loader.map_book_states(_TICKER)
+        self.assertIsInstance(mapped, numpy.memmap)
+        self.assertEqual(len(expected), len(mapped))
+        frame = books.to_frame(mapped)
+        numpy.testing.assert_array_equal(expected.index.values, frame.index.values)
+        numpy.testing.assert_array_equal(expected['bid'].values, frame['bid'].values)
+        numpy.testing.assert_array_equal(expected['ask'].values, frame['ask'].values)
+        numpy.testing.assert_array_equal(numpy.nan_to_num(expected['v_ask'].values), frame['v_ask'].values)
+
+    def test_slice(self):
+        loader = LoaderARCA()
+        loader.build_book_states_file(_TICKER, datetime(2015, 3, 2), datetime(2015, 3, 2))
+        self.assertEqual(0, loader.build_book_states_file(_TICKER, datetime(2015, 3, 2), datetime(2015, 3, 2),
+                                                          append=True))
+        self.assertLess(0, loader.build_book_states_file(_TICKER, datetime(2015, 4, 2), datetime(2015, 4, 2),
+                                                         append=True))
+        panel = loader.map_panel([_TICKER], '2015-04-02 13:30:00', '2015-04-02 13:31:00')
+        records = panel[_TICKER]
+        self.assertIsInstance(records, numpy.memmap)
+        self.assertEqual(numpy.datetime64('2015-04-02T13:30:00'), records['ts'][0].astype('datetime64[ns]'))
+        self.assertEqual(numpy.datetime64('2015-04-02T13:30:59'), records['ts'][-1].astype('datetime64[ns]'))
+        mapped = loader.map_book_states(_TICKER)
+        self.assertTrue(numpy.all(numpy.diff(mapped['ts']) > 0))
+        self.assertEqual(0, len(books.slice_book_states(mapped, '2016-01-01')))
+
+
+if __name__ == '__main__':
+    unittest.main()
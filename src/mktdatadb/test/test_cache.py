@@ -0,0 +1,61 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime, date
+
+from unittest.mock import patch
+
+import numpy
+
+import mktdatadb
+from mktdatadb import LoaderARCA
+from mktdatadb.cache import BookStateCache
+
+from mktdatadb.test.test_store import build_test_archive
+
+_TICKER = 'HYG US Equity'
+
+
+class TestBookStateCache(unittest.TestCase):
+    def setUp(self):
+        self._db_path = tempfile.mkdtemp()
+        self._cache_path = os.sep.join([self._db_path, 'cache'])
+        build_test_archive(self._db_path)
+        self._db_patch = patch('mktdatadb._get_db_path', return_value=self._db_path)
+        self._db_patch.start()
+
+    def tearDown(self):
+        self._db_patch.stop()
+        shutil.rmtree(self._db_path)
+
+    def test_incremental(self):
+        expected = LoaderARCA().load_book_states(_TICKER, datetime(2015, 3, 2), datetime(2015, 4, 2))
+        cache = BookStateCache(self._cache_path)
+        loader = LoaderARCA(cache=cache)
+        with patch('mktdatadb._load_quotes_day', wraps=mktdatadb._load_quotes_day) as day_loader:
+            loader.load_book_states(_TICKER, datetime(2015, 3, 2), datetime(2015, 3, 31))
+            self.assertEqual(1, day_loader.call_count)
+            book_states = loader.load_book_states(_TICKER, datetime(2015, 3, 2), datetime(2015, 4, 2))
+            self.assertEqual(2, day_loader.call_count)
+            loader.load_book_states(_TICKER, datetime(2015, 3, 2), datetime(2015, 4, 2))
+            self.assertEqual(2, day_loader.call_count)
+
+        self.assertEqual([], cache.missing_dates(_TICKER, [date(2015, 3, 2), date(2015, 4, 2)]))
+        numpy.testing.assert_array_equal(expected.index.values, book_states.index.values)
+        numpy.testing.assert_array_equal(expected['bid'].values, book_states['bid'].values)
+        numpy.testing.assert_array_equal(expected['v_ask'].values, book_states['v_ask'].values)
+
+    def test_eviction(self):
+        cache = BookStateCache(self._cache_path)
+        LoaderARCA(cache=cache).load_book_states(_TICKER, datetime(2015, 3, 2), datetime(2015, 4, 2))
+        full_size = cache.size()
+        os.utime(os.sep.join([self._cache_path, 'HYG%20US%20Equity', '20150402.npz']), (0, 0))
+        cache.read(_TICKER, date(2015, 3, 2))
+        self.assertEqual(1, cache.evict(max_bytes=full_size - 1))
+        self.assertEqual([date(2015, 4, 2)], cache.missing_dates(_TICKER, [date(2015, 3, 2), date(2015, 4, 2)]))
+        self.assertEqual(0, cache.evict(max_bytes=0, keep=[(_TICKER, date(2015, 3, 2))]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+from mktdatadb import books
+from mktdatadb.merge import merge_streams, asof_panel, align_quotes
+
+
+def random_frame(random, start, count):
+    seconds = numpy.unique(random.randint(0, 3 * 86400, size=count))
+    index = pandas.Timestamp(start) + pandas.to_timedelta(seconds, unit='s')
+    bids = 100. + numpy.cumsum(random.standard_normal(size=len(seconds)))
+    frame = pandas.DataFrame({'bid': bids, 'ask': bids + 0.01}, index=index, columns=['bid', 'ask'])
+    frame.index.name = 'ts'
+    return frame
+
+
+class TestMerge(unittest.TestCase):
+    def test_merge_streams(self):
+        streams = {
+            'A': iter([{'ts': '2015-03-02 14:30:00.000000', 'bid': 1}, {'ts': '2015-03-02 14:30:02.000000', 'bid': 2},
+                       {'ts': '2015-03-02 14:30:02.000000', 'bid': 3}]),
+            'B': iter([{'ts': '2015-03-02 14:30:01.000000', 'bid': 4}, {'ts': '2015-03-02 14:30:02.000000', 'bid': 5}]),
+            'C': iter([]),
+        }
+        merged = [(timestamp[-9:-7], name, record['bid']) for timestamp, name, record in merge_streams(streams)]
+        self.assertEqual([('00', 'A', 1), ('01', 'B', 4), ('02', 'A', 2), ('02', 'A', 3), ('02', 'B', 5)], merged)
+
+    def test_merge_streams_lazy(self):
+        def endless(name):
+            count = 0
+            while True:
+                yield {'ts': count, 'name': name}
+                count += 1
+
+        merged = merge_streams({'A': endless('A'), 'B': endless('B')})
+        self.assertEqual([(0, 'A'), (0, 'B'), (1, 'A')], [(next(merged)[:2]) for count in range(3)])
+
+    def test_asof_panel(self):
+        random = numpy.random.RandomState(0)
+        frames = OrderedDict([('A', random_frame(random, '2015-03-02 14:00', 300)),
+                              ('B', random_frame(random, '2015-03-02 18:00', 200))])
+        union = pandas.concat(frames, axis=1, sort=True)
+
+        panel = asof_panel(frames)
+        self.assertEqual(list(union.columns), list(panel.columns))
+        numpy.testing.assert_array_equal(union.index.values.astype('datetime64[ns]'), panel.index.values)
+        numpy.testing.assert_array_equal(union.ffill().values, panel.values)
+
+        panel = asof_panel(frames, same_day=True, complete=True)
+        expected = union.groupby(pandas.Grouper(freq='D')).ffill().dropna()
+        numpy.testing.assert_array_equal(expected.index.values.astype('datetime64[ns]'), panel.index.values)
+        numpy.testing.assert_array_equal(expected.values, panel.values)
+
+        panel = asof_panel(frames, sample_every=60, start_time='2015-03-03', end_time='2015-03-04')
+        grid = pandas.date_range('2015-03-03', '2015-03-04', freq='60s', inclusive='left')
+        expected = union.ffill().reindex(grid, method='ffill')
+        self.assertEqual(1440, len(panel))
+        numpy.testing.assert_array_equal(expected.values, panel.values)
+
+    def test_asof_panel_records(self):
+        random = numpy.random.RandomState(1)
+        frames = OrderedDict([('A', random_frame(random, '2015-03-02', 100)),
+                              ('B', random_frame(random, '2015-03-02', 100))])
+        records = OrderedDict()
+        for ticker, frame in frames.items():
+            records[ticker] = numpy.zeros(len(frame), dtype=books.BOOK_STATE_DTYPE)
+            records[ticker]['ts'] = frame.index.values.astype('datetime64[ns]').view(numpy.int64)
+            records[ticker]['bid'] = frame['bid'].values
+            records[ticker]['ask'] = frame['ask'].values
+
+        expected = asof_panel(frames, sample_every=5)
+        panel = asof_panel(records, sample_every=5)
+        numpy.testing.assert_array_equal(expected.index.values, panel.index.values)
+        numpy.testing.assert_array_equal(expected.values, panel.values)
+
+    def test_asof_panel_sampling_times(self):
+        random = numpy.random.RandomState(2)
+        frames = OrderedDict([('A', random_frame(random, '2015-03-02', 100)),
+                              ('B', random_frame(random, '2015-03-02', 100))])
+        union = pandas.concat(frames, axis=1, sort=True)
+        sampling_times = pandas.date_range('2015-03-02 12:00', periods=50, freq='1h')
+        panel = asof_panel(frames, sampling_times=sampling_times)
+        numpy.testing.assert_array_equal(sampling_times.values, panel.index.values)
+        numpy.testing.assert_array_equal(union.ffill().reindex(sampling_times, method='ffill').values, panel.values)
+
+    def test_align_quotes(self):
+        # legs updating at different seconds: each leg keeps its last quote of the day
+        index_a = pandas.to_datetime(['2015-03-02 14:30:00', '2015-03-02 14:30:02', '2015-03-03 14:30:00'])
+        index_b = pandas.to_datetime(['2015-03-02 14:30:01', '2015-03-02 14:30:03', '2015-03-03 14:30:05'])
+        quotes = {'A': pandas.DataFrame({'bid': [1., 2., 3.], 'ask': [1.5, 2.5, 3.5]}, index=index_a),
+                  'B': pandas.DataFrame({'bid': [10., 20., 30.], 'ask': [11., 21., 31.]}, index=index_b)}
+        signal_index = pandas.to_datetime(['2015-03-02 14:30:00', '2015-03-02 14:30:01', '2015-03-02 14:30:02',
+                                           '2015-03-02 14:30:04', '2015-03-03 14:30:01', '2015-03-03 14:30:06'])
+        positions = pandas.DataFrame({'A': numpy.arange(6.), 'B': -numpy.arange(6.)}, index=signal_index,
+                                     columns=['A', 'B'])
+        bids, asks, shares = align_quotes(quotes, positions)
+        expected_index = signal_index[[1, 2, 3, 5]]
+        for frame in (bids, asks, shares):
+            self.assertEqual(['A', 'B'], list(frame.columns))
+            numpy.testing.assert_array_equal(expected_index.values, frame.index.values)
+
+        numpy.testing.assert_array_equal([[1., 10.], [2., 10.], [2., 20.], [3., 30.]], bids.values)
+        numpy.testing.assert_array_equal([[1.5, 11.], [2.5, 11.], [2.5, 21.], [3.5, 31.]], asks.values)
+        numpy.testing.assert_array_equal(positions.values[[1, 2, 3, 5]], shares.values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+from datetime import datetime, date
+from zipfile import ZipFile
+
+from unittest.mock import patch
+
+import numpy
+
+from mktdatadb import store, ingest, ticks_quotes_frame, book_states_frame, load_book_states, ON_TIME_NYSEARCA, \
+    OFF_TIME_NYSEARCA, TZ_NYSEARCA, _get_file_path, LoaderARCA, list_tickers, list_archived_tickers, get_date_range, \
+    ticks_trades
+
+from mktdatadb.test.test_ticks_loader import load_mktdata_func
+
+_TICKER = 'HYG US Equity'
+
+
+def build_test_archive(db_path):
+    path_to_test_data = os.sep.join([os.path.dirname(os.path.realpath(__file__)), 'testdata'])
+    with patch('mktdatadb._get_db_path', return_value=db_path):
+        archive_path = _get_file_path(_TICKER, 'equities')
+
+    with ZipFile(archive_path, 'w') as archive:
+        for filename in ('HYG-20150302', 'HYG-20150402'):
+            with gzip.open(os.sep.join([path_to_test_data, filename + '.csv.gz']), mode='r') as test_data:
+                archive.writestr(filename[-8:] + '.csv', test_data.read())
+
+    return archive_path
+
+
+class TestTicksStore(unittest.TestCase):
+    def setUp(self):
+        self._db_path = tempfile.mkdtemp()
+        self._archive_path = build_test_archive(self._db_path)
+        self._db_patch = patch('mktdatadb._get_db_path', return_value=self._db_path)
+        self._db_patch.start()
+
+    def tearDown(self):
+        self._db_patch.stop()
+        shutil.rmtree(self._db_path)
+
+    def test_ingest(self):
+        store_path = os.sep.join([self._db_path, 'columnar'])
+        self.assertEqual([date(2015, 3, 2), date(2015, 4, 2)], ingest(_TICKER))
+        self.assertEqual([date(2015, 3, 2), date(2015, 4, 2)], store.list_partitions(store_path, _TICKER))
+        self.assertEqual([_TICKER], store.list_tickers(store_path))
+        self.assertEqual([], ingest(_TICKER))
+        self.assertEqual([date(2015, 4, 2)], ingest(_TICKER, start_date=date(2015, 4, 1), overwrite=True))
+
+    def test_list_tickers(self):
+        # archives are listed once indexed, stored tickers even without archive
+        self.assertEqual([], list_tickers('equities'))
+        self.assertEqual([_TICKER], list_archived_tickers('equities'))
+        self.assertEqual(('2015-03-02', '2015-04-02'), get_date_range(_TICKER, 'equities'))
+        self.assertEqual([_TICKER], list_tickers('equities'))
+        ingest(_TICKER, start_date=date(2015, 4, 1))
+        shutil.rmtree(os.sep.join([self._db_path, 'index']))
+        os.remove(self._archive_path)
+        self.assertEqual([_TICKER], list_tickers('equities'))
+        self.assertEqual(('2015-04-02', '2015-04-02'), get_date_range(_TICKER, 'equities'))
+
+    def test_missing_days(self):
+        with self.assertLogs(level='WARNING') as logs:
+            trades = list(ticks_trades(_TICKER, datetime(2015, 3, 2, 0, 0), datetime(2015, 3, 3, 23, 59)))
+
+        self.assertGreater(len(trades), 0)
+        self.assertEqual(1, len(logs.output))
+        self.assertIn('20150303.csv not found', logs.output[0])
+
+    def test_store_preferred(self):
+        start_time = datetime(2015, 3, 2, 0, 0)
+        end_time = datetime(2015, 4, 2, 23, 59)
+        from_zip = ticks_quotes_frame(_TICKER, start_time, end_time)
+        ingest(_TICKER)
+        os.remove(self._archive_path)
+        from_store = ticks_quotes_frame(_TICKER, start_time, end_time)
+        numpy.testing.assert_array_equal(from_zip['ts'].values, from_store['ts'].values)
+        numpy.testing.assert_array_equal(from_zip['side'].astype(str).values, from_store['side'].astype(str).values)
+        numpy.testing.assert_array_equal(from_zip['price'].values, from_store['price'].values)
+        numpy.testing.assert_array_equal(from_zip['size'].values, from_store['size'].values)
+
+    @patch('mktdatadb._ticks_from_zip')
+    def test_book_states(self, data_loader):
+        data_loader.side_effect = load_mktdata_func('HYG-20150402')
+        start_time = datetime(2015, 4, 2, 0, 0)
+        end_time = datetime(2015, 4, 2, 23, 59)
+        expected = list(load_book_states(_TICKER, start_time, end_time, ON_TIME_NYSEARCA, OFF_TIME_NYSEARCA,
+                                         TZ_NYSEARCA))
+        ingest(_TICKER)
+        book_states = book_states_frame(_TICKER, start_time, end_time, ON_TIME_NYSEARCA, OFF_TIME_NYSEARCA,
+                                        TZ_NYSEARCA)
+        self.assertEqual(len(expected), len(book_states))
+        for column in ('v_bid', 'bid', 'ask', 'v_ask'):
+            expected_values = [numpy.nan if state[column] is None else float(state[column]) for state in expected]
+            numpy.testing.assert_array_almost_equal(expected_values, book_states[column].values)
+
+    def test_load_batch(self):
+        loader = LoaderARCA()
+        start_date = datetime(2015, 3, 2)
+        end_date = datetime(2015, 4, 2)
+        expected = loader.load_book_states(_TICKER, start_date, end_date)
+        book_states = loader.load_book_states_batch([_TICKER], start_date, end_date, processes=1)
+        self.assertEqual([_TICKER], list(book_states.keys()))
+        numpy.testing.assert_array_equal(expected.index.values, book_states[_TICKER].index.values)
+        numpy.testing.assert_array_equal(expected['bid'].values, book_states[_TICKER]['bid'].values)
+        panel = loader.load_book_states_batch([_TICKER], start_date, end_date, processes=1, aligned=True)
+        numpy.testing.assert_array_equal(expected['ask'].values, panel[(_TICKER, 'ask')].values)
+
+    def test_load_batch_processes(self):
+        loader = LoaderARCA()
+        start_date = datetime(2015, 3, 2)
+        end_date = datetime(2015, 4, 2)
+        expected = loader.load_book_states_batch([_TICKER], start_date, end_date, processes=1)[_TICKER]
+        book_states = loader.load_book_states_batch([_TICKER], start_date, end_date, processes=2)[_TICKER]
+        numpy.testing.assert_array_equal(expected.index.values, book_states.index.values)
+        for column in ('v_bid', 'bid', 'ask', 'v_ask'):
+            numpy.testing.assert_array_equal(expected[column].values, book_states[column].values)
+
+
+if __name__ == '__main__':
+    unittest.main()
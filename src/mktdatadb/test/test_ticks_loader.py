@@ -8,10 +8,12 @@ import gzip
 from unittest.mock import patch
 
 import io
+import numpy
+import pandas
 import pytz
 
 from mktdatadb import _ticks_quotes, _time_filter, load_book_states, load_tick_data, ON_TIME_NYSEARCA, TZ_NYSEARCA, \
-    OFF_TIME_NYSEARCA
+    OFF_TIME_NYSEARCA, _frame_from_csv, ticks_quotes_frame, ticks_trades_frame, ticks_trades, _session_mask
 
 
 def load_mktdata_func(filename):
@@ -28,6 +30,22 @@ def load_mktdata_func(filename):
     return load_test
 
 
+def load_mktdata_frames_func(filename):
+    def load_test(ticker, start_time, end_time, db_name, pattern, price_scale=None):
+        path_to_test_data = os.path.dirname(os.path.realpath(__file__))
+        test_data_filename = os.sep.join([path_to_test_data, 'testdata', filename + '.csv.gz'])
+        logging.info('loading test data file %s', test_data_filename)
+        with gzip.open(test_data_filename, mode='r') as test_data:
+            yield _frame_from_csv(test_data, pattern=pattern, price_scale=price_scale)
+
+    return load_test
+
+
+def frame_to_ticks(df):
+    timestamps = pandas.to_datetime(df['ts'].values).strftime('%Y-%m-%d %H:%M:%S.%f')
+    return list(zip(timestamps, df.iloc[:, 1].astype(str), df['price'].values, df['size'].values))
+
+
 class TestTicksLoader(unittest.TestCase):
     @patch('mktdatadb._ticks_from_zip')
     def test_quotes(self, data_loader):
@@ -130,6 +148,70 @@ class TestTicksLoader(unittest.TestCase):
         self.assertEqual(expected_first, book_states[0])
         self.assertEqual(expected_last, book_states[-1])
 
+    def test_session_mask(self):
+        timestamps = pandas.date_range('2015-03-06', '2015-03-10', freq='7min').append(
+            pandas.date_range('2015-10-30', '2015-11-03', freq='7min'))
+        timezone = pytz.timezone(TZ_NYSEARCA)
+        expected = list()
+        for timestamp in timestamps:
+            local_time = pytz.UTC.localize(timestamp.to_pydatetime()).astimezone(timezone).strftime('%H%M%S')
+            expected.append(ON_TIME_NYSEARCA <= local_time < OFF_TIME_NYSEARCA)
+
+        mask = _session_mask(timestamps.values.astype('datetime64[ns]').view(numpy.int64), ON_TIME_NYSEARCA,
+                             OFF_TIME_NYSEARCA, TZ_NYSEARCA)
+        self.assertEqual(expected, list(mask))
+        self.assertEqual(0, len(_session_mask(numpy.array([], dtype=numpy.int64), ON_TIME_NYSEARCA,
+                                              OFF_TIME_NYSEARCA, TZ_NYSEARCA)))
+
+
+class TestColumnarParser(unittest.TestCase):
+    def assert_same_ticks(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for expected_tick, actual_tick in zip(expected, actual):
+            self.assertEqual(expected_tick[0], actual_tick[0])
+            self.assertEqual(expected_tick[1], actual_tick[1])
+            self.assertAlmostEqual(float(expected_tick[2]), actual_tick[2], places=8)
+            self.assertEqual(expected_tick[3], actual_tick[3])
+
+    def test_quotes_parity(self):
+        for filename, day in (('HYG-20150302', 2), ('HYG-20150402', 2)):
+            month = int(filename[-4:-2])
+            start_time = datetime(2015, month, day, 0, 0)
+            end_time = datetime(2015, month, day, 23, 59)
+            with patch('mktdatadb._ticks_from_zip') as data_loader:
+                data_loader.side_effect = load_mktdata_func(filename)
+                expected = list(_ticks_quotes('HYG US Equity', start_time, end_time))
+
+            with patch('mktdatadb._frames_from_zip') as frames_loader:
+                frames_loader.side_effect = load_mktdata_frames_func(filename)
+                quotes = ticks_quotes_frame('HYG US Equity', start_time, end_time)
+
+            self.assertEqual(numpy.int64, quotes['ts'].dtype)
+            self.assertEqual(numpy.int32, quotes['size'].dtype)
+            self.assert_same_ticks(expected, frame_to_ticks(quotes))
+
+    @patch('mktdatadb._ticks_from_zip')
+    @patch('mktdatadb._frames_from_zip')
+    def test_trades_parity(self, frames_loader, data_loader):
+        data_loader.side_effect = load_mktdata_func('HYG-20150302')
+        frames_loader.side_effect = load_mktdata_frames_func('HYG-20150302')
+        start_time = datetime(2015, 3, 2, 0, 0)
+        end_time = datetime(2015, 3, 2, 23, 59)
+        expected = list(ticks_trades('HYG US Equity', start_time, end_time))
+        trades = ticks_trades_frame('HYG US Equity', start_time, end_time)
+        self.assertEqual([trade[3] for trade in expected], list(trades['conditions']))
+        self.assert_same_ticks([(trade[0], trade[3], trade[1], trade[2]) for trade in expected],
+                               frame_to_ticks(trades[['ts', 'conditions', 'price', 'size']]))
+
+    @patch('mktdatadb._frames_from_zip')
+    def test_scaled_prices(self, frames_loader):
+        frames_loader.side_effect = load_mktdata_frames_func('HYG-20150402')
+        start_time = datetime(2015, 4, 2, 0, 0)
+        end_time = datetime(2015, 4, 2, 23, 59)
+        quotes = ticks_quotes_frame('HYG US Equity', start_time, end_time, price_scale=10000)
+        self.assertEqual(numpy.int64, quotes['price'].dtype)
+        self.assertIn(903800, quotes['price'].values)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
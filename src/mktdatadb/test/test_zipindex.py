@@ -0,0 +1,64 @@
+import unittest
+import os
+import gzip
+import shutil
+import tempfile
+from datetime import datetime, date
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from unittest.mock import patch
+
+from mktdatadb import zipindex, get_date_range, plan_load, ingest, LoaderARCA
+
+from mktdatadb.test.test_store import build_test_archive
+
+_TICKER = 'HYG US Equity'
+
+
+class TestDayIndex(unittest.TestCase):
+    def setUp(self):
+        self._db_path = tempfile.mkdtemp()
+        self._archive_path = build_test_archive(self._db_path)
+        self._db_patch = patch('mktdatadb._get_db_path', return_value=self._db_path)
+        self._db_patch.start()
+
+    def tearDown(self):
+        self._db_patch.stop()
+        shutil.rmtree(self._db_path)
+
+    def test_index(self):
+        index_path = os.sep.join([self._db_path, 'index', 'test.json'])
+        days = zipindex.load_index(self._archive_path, index_path)
+        self.assertEqual(['20150302', '20150402'], sorted(days))
+        self.assertEqual(77025, days['20150302']['rows'])
+        self.assertEqual('2015-03-02 09:00:00.000000', days['20150302']['first_ts'])
+        self.assertEqual('2015-03-02 23:40:04.000000', days['20150302']['last_ts'])
+        self.assertTrue(os.path.isfile(index_path))
+        self.assertEqual([date(2015, 4, 2)], zipindex.dates_in_range(days, date(2015, 3, 3), None))
+
+    def test_open_member_deflated(self):
+        path_to_test_data = os.sep.join([os.path.dirname(os.path.realpath(__file__)), 'testdata'])
+        with gzip.open(os.sep.join([path_to_test_data, 'HYG-20150402.csv.gz']), mode='r') as test_data:
+            content = test_data.read()
+
+        archive_path = os.sep.join([self._db_path, 'deflated.zip'])
+        with ZipFile(archive_path, 'w', compression=ZIP_DEFLATED) as archive:
+            archive.writestr('20150402.csv', content)
+
+        days = zipindex.load_index(archive_path, os.sep.join([self._db_path, 'index', 'deflated.json']))
+        with zipindex.open_member(archive_path, days['20150402']) as member:
+            self.assertEqual(content, member.read())
+
+    def test_date_range_and_plan(self):
+        self.assertEqual(('2015-03-02', '2015-04-02'), get_date_range(_TICKER, 'equities'))
+        ingest(_TICKER, start_date=date(2015, 4, 1))
+        plan = plan_load(_TICKER, date(2015, 3, 1), date(2015, 4, 30))
+        self.assertEqual([date(2015, 3, 2), date(2015, 4, 2)], list(plan.index))
+        self.assertEqual(['zip', 'store'], list(plan['source']))
+        self.assertEqual(77025, plan['rows'].iloc[0])
+        plans = LoaderARCA().plan_load([_TICKER], datetime(2015, 3, 1), datetime(2015, 3, 31))
+        self.assertEqual(1, len(plans))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Per-archive day index: maps each daily CSV member of a ticker zip archive to its location in the archive, along with
+row count and first/last timestamps. The index is persisted as JSON next to the archives and cached in memory, it is
+rebuilt whenever the archive size or modification time changes.
+"""
+import io
+import json
+import logging
+import os
+import struct
+import zlib
+from datetime import datetime
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+
+__author__ = 'Christophe'
+
+_LOCAL_HEADER_FORMAT = '<IHHHHHIIIHH'
+_LOCAL_HEADER_SIZE = struct.calcsize(_LOCAL_HEADER_FORMAT)
+
+_INDEX_CACHE = dict()
+
+
+def _archive_stamp(file_path):
+    file_stat = os.stat(file_path)
+    return [file_stat.st_size, file_stat.st_mtime]
+
+
+def _describe_member(zip_ticks, info):
+    with zip_ticks.open(info, mode='r') as ticks_file:
+        lines = ticks_file.read().splitlines()
+
+    lines = [line for line in lines if line.strip()]
+    entry = {
+        'member': info.filename,
+        'header_offset': info.header_offset,
+        'compress_type': info.compress_type,
+        'compress_size': info.compress_size,
+        'file_size': info.file_size,
+        'rows': len(lines),
+        'first_ts': None,
+        'last_ts': None,
+    }
+    if lines:
+        entry['first_ts'] = lines[0].split(b',', 1)[0].decode('UTF-8')
+        entry['last_ts'] = lines[-1].split(b',', 1)[0].decode('UTF-8')
+
+    return entry
+
+
+def build_index(file_path):
+    """
+    Scans every daily member of the archive once.
+
+    :param file_path: path to the ticker zip archive
+    :return: dict 'YYYYMMDD' -> member description
+    """
+    logging.info('building day index for zip file %s', file_path)
+    days = dict()
+    with ZipFile(file_path, 'r') as zip_ticks:
+        for info in zip_ticks.infolist():
+            if not info.filename.endswith('.csv'):
+                continue
+
+            days[info.filename[:-4]] = _describe_member(zip_ticks, info)
+
+    return days
+
+
+def load_index(file_path, index_path):
+    """
+    Day index of an archive, from memory, from its JSON file or built from the archive, in that order.
+
+    :param file_path: path to the ticker zip archive
+    :param index_path: path to the JSON index file
+    :return: dict 'YYYYMMDD' -> member description, empty when the archive does not exist
+    """
+    if not os.path.isfile(file_path):
+        return dict()
+
+    stamp = _archive_stamp(file_path)
+    cached = _INDEX_CACHE.get(file_path)
+    if cached is not None and cached['stamp'] == stamp:
+        return cached['days']
+
+    index = None
+    if os.path.isfile(index_path):
+        with open(index_path, mode='r') as index_file:
+            index = json.load(index_file)
+
+        if index.get('stamp') != stamp:
+            index = None
+
+    if index is None:
+        index = {'stamp': stamp, 'days': build_index(file_path)}
+        if not os.path.isdir(os.path.dirname(index_path)):
+            os.makedirs(os.path.dirname(index_path))
+
+        temp_path = index_path + '.tmp'
+        with open(temp_path, mode='w') as index_file:
+            json.dump(index, index_file)
+
+        os.replace(temp_path, index_path)
+
+    _INDEX_CACHE[file_path] = index
+    return index['days']
+
+
+def dates_in_range(days, start_date, end_date):
+    """
+
+    :param days: day index as returned by load_index
+    :param start_date: included, None for no lower bound
+    :param end_date: included, None for no upper bound
+    :return: sorted list of dates available in the index
+    """
+    keys = sorted(days)
+    if start_date is not None:
+        keys = [key for key in keys if key >= start_date.strftime('%Y%m%d')]
+
+    if end_date is not None:
+        keys = [key for key in keys if key <= end_date.strftime('%Y%m%d')]
+
+    return [datetime.strptime(key, '%Y%m%d').date() for key in keys]
+
+
+def open_member(file_path, entry):
+    """
+    Reads a single member by seeking to its offset, without loading the archive central directory.
+
+    :param file_path: path to the ticker zip archive
+    :param entry: member description from the day index
+    :return: binary file object over the uncompressed member content
+    """
+    if entry['compress_type'] not in (ZIP_STORED, ZIP_DEFLATED):
+        with ZipFile(file_path, 'r') as zip_ticks:
+            return io.BytesIO(zip_ticks.read(entry['member']))
+
+    with open(file_path, mode='rb') as archive:
+        archive.seek(entry['header_offset'])
+        header = struct.unpack(_LOCAL_HEADER_FORMAT, archive.read(_LOCAL_HEADER_SIZE))
+        name_length, extra_length = header[-2:]
+        archive.seek(name_length + extra_length, os.SEEK_CUR)
+        content = archive.read(entry['compress_size'])
+
+    if entry['compress_type'] == ZIP_DEFLATED:
+        content = zlib.decompress(content, -zlib.MAX_WBITS)
+
+    return io.BytesIO(content)
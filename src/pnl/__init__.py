@@ -1,16 +1,20 @@
 import logging
 import math
 
+import numpy
+
 
 class AverageCostProfitAndLoss(object):
     """
     Computes P&L based on weighted average cost method.
     """
+    __slots__ = ('_quantity', '_cost', '_realized_pnl', '_fees')
 
-    def __init__(self, quantity=0, cost=0., realized_pnl=0):
+    def __init__(self, quantity=0, cost=0., realized_pnl=0, fees=0.):
         self._quantity = quantity
         self._cost = cost
         self._realized_pnl = realized_pnl
+        self._fees = fees
 
     @property
     def realized_pnl(self):
@@ -24,6 +28,10 @@ class AverageCostProfitAndLoss(object):
     def quantity(self):
         return self._quantity
 
+    @property
+    def fees(self):
+        return self._fees
+
     @property
     def average_price(self):
         return self._cost / self._quantity
@@ -35,7 +43,7 @@ class AverageCostProfitAndLoss(object):
         return self.get_market_value(current_price) - self.cost
 
     def get_total_pnl(self, current_price):
-        return self.realized_pnl + self.get_unrealized_pnl(current_price)
+        return self.realized_pnl + self.get_unrealized_pnl(current_price) - self.fees
 
     def add_fill(self, fill_qty, fill_price, fees=None):
         """
@@ -43,10 +51,13 @@ class AverageCostProfitAndLoss(object):
 
         :param fill_qty:
         :param fill_price:
-        :param fees: a dict containing fees that apply on the trade
+        :param fees: a dict containing fees that apply on the trade, accumulated separately from the realized P&L
         :return:
         """
         logging.debug('adding fill: %s at %s', fill_qty, fill_price)
+        if fees:
+            self._fees += sum(fees.values())
+
         old_qty = self._quantity
         old_cost = self._cost
         old_realized = self._realized_pnl
@@ -65,3 +76,175 @@ class AverageCostProfitAndLoss(object):
             self._quantity = old_qty + fill_qty
             self._cost = old_cost + (opening_qty * fill_price) + (closing_qty * old_cost / old_qty)
             self._realized_pnl = old_realized + closing_qty * (old_cost / old_qty - fill_price)
+
+    def add_fills(self, fill_quantities, fill_prices, mark_prices=None):
+        """
+        Adding a sequence of fills at once, see average_cost_paths.
+
+        :param fill_quantities: array of fill quantities, zero for no fill
+        :param fill_prices: array of fill prices
+        :param mark_prices: array of prices used for the unrealized P&L, defaults to fill prices
+        :return: dict of arrays quantity, cost, realized_pnl, unrealized_pnl, one value after each fill
+        """
+        paths = average_cost_paths(fill_quantities, fill_prices, mark_prices=mark_prices, quantity=self._quantity,
+                                   cost=self._cost, realized_pnl=self._realized_pnl)
+        if len(paths['quantity']) > 0:
+            self._quantity = paths['quantity'][-1]
+            self._cost = paths['cost'][-1]
+            self._realized_pnl = paths['realized_pnl'][-1]
+
+        return paths
+
+
+def _affine_scan(slopes, intercepts, initial_value):
+    """
+    Values of the recurrence x[i] = slopes[i] * x[i - 1] + intercepts[i], by composing the affine maps with doubling
+    steps.
+
+    :param slopes:
+    :param intercepts:
+    :param initial_value: x[-1]
+    :return: array of x values
+    """
+    slopes = numpy.array(slopes, dtype=float)
+    intercepts = numpy.array(intercepts, dtype=float)
+    shift = 1
+    while shift < slopes.size:
+        composed_intercepts = intercepts.copy()
+        composed_intercepts[shift:] += slopes[shift:] * intercepts[:-shift]
+        composed_slopes = slopes.copy()
+        composed_slopes[shift:] *= slopes[:-shift]
+        slopes = composed_slopes
+        intercepts = composed_intercepts
+        shift *= 2
+
+    return slopes * initial_value + intercepts
+
+
+def average_cost_paths(fill_quantities, fill_prices, mark_prices=None, quantity=0, cost=0., realized_pnl=0.):
+    """
+    Array version of AverageCostProfitAndLoss.add_fill: P&L values after each fill of a sequence, without looping
+    over fills.
+
+    Same weighted average cost rules as add_fill, including partial closes, flips and the reset of the realized P&L
+    when a position is opened from flat. The realized P&L of all the round trips is kept in cumulative_realized_pnl.
+    Rows with a zero quantity are not fills and leave the state unchanged. Two-dimensional inputs hold one instrument
+    per column, all columns being processed at once.
+
+    :param fill_quantities: array of fill quantities, zero for no fill
+    :param fill_prices: array of fill prices
+    :param mark_prices: array of prices used for the unrealized P&L, defaults to fill prices
+    :param quantity: initial quantity, scalar or one value per column
+    :param cost: initial cost, scalar or one value per column
+    :param realized_pnl: initial realized P&L, scalar or one value per column
+    :return: dict of arrays quantity, cost, realized_pnl, cumulative_realized_pnl, unrealized_pnl, one row after each
+    fill
+    """
+    fill_quantities = numpy.asarray(fill_quantities)
+    fill_prices = numpy.asarray(fill_prices, dtype=float)
+    if mark_prices is None:
+        mark_prices = fill_prices
+
+    initial_shape = fill_quantities.shape[1:]
+    quantity = numpy.broadcast_to(quantity, initial_shape)
+    cost = numpy.broadcast_to(numpy.asarray(cost, dtype=float), initial_shape)
+    realized_pnl = numpy.broadcast_to(numpy.asarray(realized_pnl, dtype=float), initial_shape)
+    quantities = numpy.cumsum(numpy.concatenate([quantity[None], fill_quantities]), axis=0)
+    old_quantities = quantities[:-1]
+    quantities = quantities[1:]
+    is_fill = fill_quantities != 0
+    from_flat = is_fill & (old_quantities == 0)
+    crossing = is_fill & ~from_flat & (numpy.sign(old_quantities) != numpy.sign(fill_quantities))
+    closing_quantities = numpy.where(crossing, numpy.minimum(numpy.abs(old_quantities), numpy.abs(fill_quantities)) *
+                                     numpy.sign(fill_quantities), 0.)
+    opening_quantities = numpy.where(is_fill, fill_quantities - closing_quantities, 0.)
+    safe_old_quantities = numpy.where(old_quantities == 0, 1., old_quantities)
+
+    # cost[i] = (1 + closing / old quantity) * cost[i - 1] + opening * price, restarting from flat
+    cost_slopes = numpy.where(from_flat, 0., 1. + closing_quantities / safe_old_quantities)
+    costs = _affine_scan(cost_slopes, opening_quantities * fill_prices, cost)
+
+    old_costs = numpy.concatenate([cost[None], costs[:-1]])
+    realized_increments = closing_quantities * (old_costs / safe_old_quantities - fill_prices)
+    realized = _affine_scan(numpy.where(from_flat, 0., 1.), numpy.where(from_flat, 0., realized_increments),
+                            realized_pnl)
+    return {
+        'quantity': quantities,
+        'cost': costs,
+        'realized_pnl': realized,
+        'cumulative_realized_pnl': realized_pnl + numpy.cumsum(realized_increments, axis=0),
+        'unrealized_pnl': quantities * numpy.asarray(mark_prices, dtype=float) - costs,
+    }
+
+
+class PortfolioProfitAndLoss(object):
+    """
+    Weighted average cost P&L of several instruments, stored as one array per state variable.
+    """
+    __slots__ = ('_instruments', '_quantities', '_costs', '_realized_pnls')
+
+    def __init__(self, instruments):
+        """
+
+        :param instruments: instrument names, in the column order of the fills
+        """
+        self._instruments = list(instruments)
+        self._quantities = numpy.zeros(len(self._instruments))
+        self._costs = numpy.zeros(len(self._instruments))
+        self._realized_pnls = numpy.zeros(len(self._instruments))
+
+    @property
+    def instruments(self):
+        return self._instruments
+
+    @property
+    def quantities(self):
+        return self._quantities
+
+    @property
+    def costs(self):
+        return self._costs
+
+    @property
+    def realized_pnls(self):
+        return self._realized_pnls
+
+    def get_position(self, instrument):
+        """
+
+        :param instrument:
+        :return: the state of a single instrument as an AverageCostProfitAndLoss instance
+        """
+        index = self._instruments.index(instrument)
+        return AverageCostProfitAndLoss(quantity=self._quantities[index], cost=self._costs[index],
+                                        realized_pnl=self._realized_pnls[index])
+
+    def get_unrealized_pnls(self, current_prices):
+        return self._quantities * numpy.asarray(current_prices, dtype=float) - self._costs
+
+    def get_total_pnl(self, current_prices):
+        return (self._realized_pnls + self.get_unrealized_pnls(current_prices)).sum()
+
+    def add_fills(self, fill_quantities, fill_prices, mark_prices=None):
+        """
+        Applies fills of all instruments in a single pass over timestamps.
+
+        :param fill_quantities: array (count timestamps, count instruments) of fill quantities, zero for no fill
+        :param fill_prices: array (count timestamps, count instruments) of fill prices
+        :param mark_prices: array (count timestamps, count instruments) of prices used for the unrealized P&L,
+        defaults to fill prices
+        :return: dict of per-instrument arrays quantity, cost, realized_pnl, unrealized_pnl, and of the aggregate
+        array total_pnl, one row per timestamp
+        """
+        fill_quantities = numpy.asarray(fill_quantities)
+        assert fill_quantities.ndim == 2 and fill_quantities.shape[1] == len(self._instruments), \
+            'expected one column of fills per instrument'
+        paths = average_cost_paths(fill_quantities, fill_prices, mark_prices=mark_prices, quantity=self._quantities,
+                                   cost=self._costs, realized_pnl=self._realized_pnls)
+        if fill_quantities.shape[0] > 0:
+            self._quantities = paths['quantity'][-1].astype(float)
+            self._costs = paths['cost'][-1].copy()
+            self._realized_pnls = paths['realized_pnl'][-1].copy()
+
+        paths['total_pnl'] = (paths['realized_pnl'] + paths['unrealized_pnl']).sum(axis=1)
+        return paths
@@ -0,0 +1,133 @@
+"""
+Fee and slippage models, evaluated on whole arrays of fills.
+
+A fee model maps arrays of fill quantities and prices (and optionally the bid and ask prevailing at each fill) to the
+array of costs paid on each fill, zero quantities being no fill. Fees do not affect the weighted average cost of a
+position, so a single pass over the fills gives the P&L under any number of fee scenarios.
+"""
+import numpy
+
+from pnl import average_cost_paths
+
+__author__ = 'Christophe'
+
+
+class FeeModel(object):
+    def __init__(self, name):
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+    def get_fees(self, fill_quantities, fill_prices, bids=None, asks=None):
+        """
+
+        :param fill_quantities: array of fill quantities, zero for no fill
+        :param fill_prices: array of fill prices
+        :param bids: array of bid prices at the time of the fills
+        :param asks: array of ask prices at the time of the fills
+        :return: array of fees paid on each fill, zero where there is no fill
+        """
+        raise NotImplementedError
+
+    def __add__(self, other):
+        return CompositeFee(self, other)
+
+    def __repr__(self):
+        return self._name
+
+
+class PerShareFee(FeeModel):
+    def __init__(self, rate, name=None):
+        super(PerShareFee, self).__init__(name or 'per share %s' % rate)
+        self._rate = rate
+
+    def get_fees(self, fill_quantities, fill_prices, bids=None, asks=None):
+        return self._rate * numpy.abs(numpy.asarray(fill_quantities, dtype=float))
+
+
+class PerNotionalFee(FeeModel):
+    def __init__(self, rate, name=None):
+        super(PerNotionalFee, self).__init__(name or 'per notional %s' % rate)
+        self._rate = rate
+
+    def get_fees(self, fill_quantities, fill_prices, bids=None, asks=None):
+        notionals = numpy.abs(numpy.asarray(fill_quantities, dtype=float) * numpy.asarray(fill_prices, dtype=float))
+        return self._rate * notionals
+
+
+class MinimumTicketFee(FeeModel):
+    """
+    Applies a minimum amount per fill to an underlying fee model.
+    """
+
+    def __init__(self, fee_model, minimum, name=None):
+        super(MinimumTicketFee, self).__init__(name or '%s (min %s)' % (fee_model, minimum))
+        self._fee_model = fee_model
+        self._minimum = minimum
+
+    def get_fees(self, fill_quantities, fill_prices, bids=None, asks=None):
+        fees = self._fee_model.get_fees(fill_quantities, fill_prices, bids=bids, asks=asks)
+        return numpy.where(numpy.asarray(fill_quantities) != 0, numpy.maximum(fees, self._minimum), 0.)
+
+
+class SpreadCrossingSlippage(FeeModel):
+    """
+    Cost of crossing a fraction of the bid-ask spread on each fill.
+    """
+
+    def __init__(self, fraction=0.5, name=None):
+        super(SpreadCrossingSlippage, self).__init__(name or 'spread crossing %s' % fraction)
+        self._fraction = fraction
+
+    def get_fees(self, fill_quantities, fill_prices, bids=None, asks=None):
+        assert bids is not None and asks is not None, 'spread crossing requires bid and ask prices'
+        spreads = numpy.asarray(asks, dtype=float) - numpy.asarray(bids, dtype=float)
+        return self._fraction * spreads * numpy.abs(numpy.asarray(fill_quantities, dtype=float))
+
+
+class CompositeFee(FeeModel):
+    def __init__(self, *fee_models):
+        super(CompositeFee, self).__init__(' + '.join(str(fee_model) for fee_model in fee_models))
+        self._fee_models = fee_models
+
+    def get_fees(self, fill_quantities, fill_prices, bids=None, asks=None):
+        return sum(fee_model.get_fees(fill_quantities, fill_prices, bids=bids, asks=asks)
+                   for fee_model in self._fee_models)
+
+
+def get_fees(fee_models, fill_quantities, fill_prices, bids=None, asks=None):
+    """
+    Fees of several scenarios on the same fills.
+
+    :param fee_models: list of FeeModel instances, one per scenario
+    :param fill_quantities: array of fill quantities, zero for no fill
+    :param fill_prices: array of fill prices
+    :param bids: array of bid prices at the time of the fills
+    :param asks: array of ask prices at the time of the fills
+    :return: array (count scenarios,) + shape of the fills
+    """
+    fill_quantities = numpy.asarray(fill_quantities)
+    return numpy.array([numpy.broadcast_to(fee_model.get_fees(fill_quantities, fill_prices, bids=bids, asks=asks),
+                                           fill_quantities.shape) for fee_model in fee_models])
+
+
+def scenario_paths(fee_models, fill_quantities, fill_prices, mark_prices=None, bids=None, asks=None):
+    """
+    P&L paths under several fee scenarios, from a single pass over the fills.
+
+    :param fee_models: list of FeeModel instances, one per scenario
+    :param fill_quantities: array of fill quantities, zero for no fill, one column per instrument if two-dimensional
+    :param fill_prices: array of fill prices
+    :param mark_prices: array of prices used for the unrealized P&L, defaults to fill prices
+    :param bids: array of bid prices at the time of the fills
+    :param asks: array of ask prices at the time of the fills
+    :return: dict of average_cost_paths arrays, plus per-scenario arrays fees (cumulative fees) and total_pnl
+    (cumulative realized + unrealized - cumulative fees), of shape (count scenarios,) + shape of the fills
+    """
+    paths = average_cost_paths(fill_quantities, fill_prices, mark_prices=mark_prices)
+    fees = numpy.cumsum(get_fees(fee_models, fill_quantities, fill_prices, bids=bids, asks=asks), axis=1)
+    paths['fees'] = fees
+    paths['total_pnl'] = (paths['cumulative_realized_pnl'] + paths['unrealized_pnl'])[None] - fees
+    return paths
@@ -1,6 +1,9 @@
 import unittest
 
-from pnl import AverageCostProfitAndLoss
+import numpy
+
+from pnl import AverageCostProfitAndLoss, average_cost_paths, PortfolioProfitAndLoss
+from pnl import fees
 
 
 class TestProfitAndLoss(unittest.TestCase):
@@ -163,5 +166,115 @@ class TestProfitAndLoss(unittest.TestCase):
         self.assertAlmostEqual(pos.realized_pnl, 203. * (38.7950 - 38.8443))
         self.assertAlmostEqual(pos.get_unrealized_pnl(38.8443), 0.)
 
+    def test_add_fills(self):
+        pos = AverageCostProfitAndLoss()
+        paths = pos.add_fills([-100, -25, 50, 100, -25], [5.0, 5.5, 4., 4.75, 4.50])
+        numpy.testing.assert_array_equal([-100, -125, -75, 25, 0], paths['quantity'])
+        numpy.testing.assert_allclose([-500., -637.5, -382.5, 118.75, 0.], paths['cost'])
+        numpy.testing.assert_allclose([0., 0., 55., 81.25, 75.], paths['realized_pnl'])
+        self.assertEqual(0, pos.quantity)
+        self.assertAlmostEqual(75., pos.realized_pnl)
+
+        pos = AverageCostProfitAndLoss()
+        pos.add_fills([1, -3, -2], [80.0, 102.0, 98.0])
+        paths = pos.add_fills([3, -2], [90.0, 100.0], mark_prices=[101., 101.])
+        self.assertEqual(-3, pos.quantity)
+        self.assertAlmostEqual(-300., pos.cost)
+        self.assertAlmostEqual(52., pos.realized_pnl)
+        self.assertAlmostEqual(-3., paths['unrealized_pnl'][-1])
+
+    def test_average_cost_paths(self):
+        random = numpy.random.RandomState(0)
+        for trial in range(20):
+            fill_quantities = random.randint(-5, 6, size=200) * 10
+            fill_quantities[random.rand(200) < 0.2] = 0
+            fill_prices = 50. + numpy.cumsum(random.standard_normal(size=200))
+            pos = AverageCostProfitAndLoss()
+            expected = list()
+            for fill_qty, fill_price in zip(fill_quantities, fill_prices):
+                if fill_qty != 0:
+                    pos.add_fill(fill_qty, fill_price)
+
+                expected.append((pos.quantity, pos.cost, pos.realized_pnl, pos.get_unrealized_pnl(fill_price)))
+
+            expected = numpy.array(expected)
+            paths = average_cost_paths(fill_quantities, fill_prices)
+            for column, key in enumerate(['quantity', 'cost', 'realized_pnl', 'unrealized_pnl']):
+                numpy.testing.assert_allclose(expected[:, column], paths[key], rtol=1e-9, atol=1e-7)
+
+    def test_portfolio(self):
+        random = numpy.random.RandomState(1)
+        fill_quantities = random.randint(-3, 4, size=(300, 3)) * 100
+        fill_prices = 20. + numpy.cumsum(random.standard_normal(size=(300, 3)), axis=0)
+        mark_prices = fill_prices + 0.01
+        portfolio = PortfolioProfitAndLoss(['EWA', 'EWC', 'GLD'])
+        paths = portfolio.add_fills(fill_quantities[:100], fill_prices[:100], mark_prices[:100])
+        paths = portfolio.add_fills(fill_quantities[100:], fill_prices[100:], mark_prices[100:])
+        self.assertEqual((200, 3), paths['unrealized_pnl'].shape)
+        total_pnl = 0.
+        for column, instrument in enumerate(portfolio.instruments):
+            pos = AverageCostProfitAndLoss()
+            for fill_qty, fill_price in zip(fill_quantities[:, column], fill_prices[:, column]):
+                if fill_qty != 0:
+                    pos.add_fill(fill_qty, fill_price)
+
+            self.assertEqual(pos.quantity, portfolio.get_position(instrument).quantity)
+            self.assertAlmostEqual(pos.cost, portfolio.get_position(instrument).cost)
+            self.assertAlmostEqual(pos.realized_pnl, paths['realized_pnl'][-1, column])
+            total_pnl += pos.get_total_pnl(mark_prices[-1, column])
+
+        self.assertAlmostEqual(total_pnl, paths['total_pnl'][-1])
+        self.assertAlmostEqual(total_pnl, portfolio.get_total_pnl(mark_prices[-1]))
+
+    def test_fees(self):
+        pos = AverageCostProfitAndLoss()
+        pos.add_fill(100, 5.0, fees={'commission': 1., 'exchange': 0.25})
+        pos.add_fill(-100, 6.0, fees={'commission': 1.})
+        self.assertAlmostEqual(100.0, pos.realized_pnl)
+        self.assertAlmostEqual(2.25, pos.fees)
+        self.assertAlmostEqual(97.75, pos.get_total_pnl(6.0))
+
+    def test_fee_models(self):
+        fill_quantities = numpy.array([100, 0, -300, 200])
+        fill_prices = numpy.array([5., 5.1, 5.2, 5.])
+        bids = fill_prices - 0.01
+        asks = fill_prices + 0.01
+        models = [fees.PerShareFee(0.005), fees.MinimumTicketFee(fees.PerShareFee(0.005), 1.),
+                  fees.PerNotionalFee(0.001), fees.PerShareFee(0.005) + fees.SpreadCrossingSlippage()]
+        result = fees.get_fees(models, fill_quantities, fill_prices, bids=bids, asks=asks)
+        numpy.testing.assert_allclose([0.5, 0., 1.5, 1.], result[0])
+        numpy.testing.assert_allclose([1., 0., 1.5, 1.], result[1])
+        numpy.testing.assert_allclose([0.5, 0., 1.56, 1.], result[2])
+        numpy.testing.assert_allclose([1.5, 0., 4.5, 3.], result[3])
+
+        paths = fees.scenario_paths(models, fill_quantities, fill_prices, bids=bids, asks=asks)
+        gross_paths = average_cost_paths(fill_quantities, fill_prices)
+        self.assertEqual((4, 4), paths['total_pnl'].shape)
+        numpy.testing.assert_allclose(gross_paths['realized_pnl'] + gross_paths['unrealized_pnl'] - [1., 1., 2.5, 3.5],
+                                      paths['total_pnl'][1])
+
+
+    def test_round_trips(self):
+        # short round trip then long round trip, realized P&L accumulated across the reset from flat
+        fill_quantities = numpy.array([-100, 0, -50, 150, 0, 200, -200])
+        fill_prices = numpy.array([10., 9.8, 9.9, 9.5, 9.6, 9.7, 10.1])
+        models = [fees.PerShareFee(0.01)]
+        paths = fees.scenario_paths(models, fill_quantities, fill_prices)
+        pos = AverageCostProfitAndLoss()
+        closed_pnl = 0.
+        for fill_qty, fill_price, total_pnl in zip(fill_quantities, fill_prices, paths['total_pnl'][0]):
+            if fill_qty != 0:
+                if pos.quantity == 0:
+                    closed_pnl += pos.get_total_pnl(fill_price)
+                    pos = AverageCostProfitAndLoss()
+
+                pos.add_fill(fill_qty, fill_price, fees={'commission': 0.01 * abs(fill_qty)})
+
+            self.assertAlmostEqual(closed_pnl + pos.get_total_pnl(fill_price), total_pnl)
+
+        self.assertAlmostEqual(100. * 0.5 + 50. * 0.4 + 200. * 0.4 - 7., paths['total_pnl'][0, -1])
+        numpy.testing.assert_allclose([0., 0., 0., 70., 70., 70., 150.], paths['cumulative_realized_pnl'])
+
+
 if __name__ == '__main__':
     unittest.main()
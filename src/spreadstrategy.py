@@ -0,0 +1,211 @@
+"""
+Cointegrated spread strategy: calibration of the spread, Bollinger band positions and P&L of the legs.
+"""
+import logging
+import math
+import os
+from collections import OrderedDict
+
+import numpy
+import pandas
+
+from bollinger import get_bands
+from mktdatadb.merge import asof_panel
+from pnl import fees
+from statsext import cointeg, ou, spread
+
+__author__ = 'Christophe'
+
+
+class CoIntegration(object):
+    """
+    Generates a cointegrated signal.
+    """
+
+    def __init__(self, prices, calibration_start, calibration_end, backtest_end, vector=None, half_life=None,
+                 regression_summary=False):
+        """
+
+        :param prices: pandas.DataFrame of prices, one column per security
+        :param calibration_start: included
+        :param calibration_end: excluded
+        :param backtest_end: excluded
+        :param vector: cointegration vector computed beforehand, skips the Johansen estimation when provided
+        :param half_life: half-life of the spread computed beforehand, skips the regression when provided
+        :param regression_summary: when True, logs the statsmodels summary of the half-life regression (slow)
+        """
+        calibration_period = (prices.index >= calibration_start) & (prices.index < calibration_end)
+        backtest_period = (prices.index >= calibration_end) & (prices.index < backtest_end)
+        calibration_set = prices[calibration_period].groupby(pandas.Grouper(freq='D')).ffill().dropna(axis=0)
+        self._backtest_set = prices[backtest_period]
+        self._signal = None
+        self._calibration = None
+        self._half_life = half_life
+        self._vector = vector
+        if self._vector is None:
+            cointeg_vectors = cointeg.get_johansen(calibration_set, lag=1)
+            if len(cointeg_vectors) > 0:
+                self._vector = cointeg_vectors[0]
+
+        if self._vector is not None:
+            self._calibration = pandas.DataFrame(calibration_set.dot(self._vector))
+            self._calibration.columns = ['signal']
+
+        if self._vector is not None and self._half_life is None:
+            regress = ou.fit_ar1(self._calibration['signal'].values, summary=regression_summary)
+            if regression_summary:
+                logging.info('regression results: %s', regress['summary'])
+
+            self._half_life = -int(math.log(2) / regress['slope'])
+
+    @property
+    def calibration(self):
+        return self._calibration
+
+    @property
+    def half_life(self):
+        return self._half_life
+
+    @property
+    def vector(self):
+        return self._vector
+
+    @property
+    def signal(self):
+        if self._signal is None:
+            self._signal = self._compute_signal(self._backtest_set)
+
+        return self._signal
+
+    def stream_signal(self, book_states_by_security):
+        """
+        Signal computed incrementally from book state streams, see statsext.spread.stream_spread.
+
+        :param book_states_by_security: dict security -> iterator of book states, in the order of the vector
+        :return: generator of (timestamp, signal value)
+        """
+        return spread.stream_spread(book_states_by_security, self.vector)
+
+    def _compute_signal(self, input_ts):
+        """
+
+        :param input_ts:
+        :return:
+        """
+        by_day = input_ts.groupby(pandas.Grouper(freq='D')).ffill()
+        return by_day.dot(self.vector).dropna()
+
+
+CFD_FEES = fees.MinimumTicketFee(fees.PerShareFee(0.005), 1., name='cfd')
+
+
+def _trade_pnls(bids, asks, shares, fee_models):
+    trades = shares.diff()
+    trades.iloc[0] = shares.iloc[0]
+    quantities = trades.values
+    costs = numpy.where(shares.values < 0, bids.values, asks.values)
+    return fees.scenario_paths(fee_models, quantities, costs, bids=bids.values, asks=asks.values)['total_pnl']
+
+
+def compute_trades(bids, asks, shares, fee_model=CFD_FEES):
+    """
+    P&L of every leg of a portfolio, in one pass over aligned timestamps.
+
+    :param bids: pandas.DataFrame of bid prices, one column per security
+    :param asks: pandas.DataFrame of ask prices, one column per security
+    :param shares: pandas.DataFrame of target positions, one column per security
+    :param fee_model: pnl.fees.FeeModel instance
+    :return: pandas.DataFrame of P&L (realized + unrealized - fees) per security
+    """
+    pnls = _trade_pnls(bids, asks, shares, [fee_model])[0]
+    return pandas.DataFrame(pnls, index=shares.index, columns=shares.columns)
+
+
+def compute_scenarios(bids, asks, shares, fee_models):
+    """
+    Portfolio P&L under several fee scenarios, from a single pass over the trades.
+
+    :param bids: pandas.DataFrame of bid prices, one column per security
+    :param asks: pandas.DataFrame of ask prices, one column per security
+    :param shares: pandas.DataFrame of target positions, one column per security
+    :param fee_models: list of pnl.fees.FeeModel instances
+    :return: pandas.DataFrame of portfolio P&L, one column per fee model
+    """
+    pnls = _trade_pnls(bids, asks, shares, fee_models).sum(axis=2)
+    return pandas.DataFrame(pnls.T, index=shares.index, columns=[fee_model.name for fee_model in fee_models])
+
+
+def backtest(prices_mid_securities, calibration_start, calibration_end, backtest_end, regression_summary=False):
+    securities = list(prices_mid_securities.keys())
+    mid_frames = OrderedDict((security, prices_mid_securities[security].to_frame('mid')) for security in securities)
+    prices_mid = asof_panel(mid_frames, fields=['mid'], same_day=True)
+    prices_mid.columns = securities
+    logging.info('computing cointegration statistics')
+    cointegration = CoIntegration(prices_mid, calibration_start, calibration_end, backtest_end,
+                                  regression_summary=regression_summary)
+    logging.info('half-life according to warm-up period: %d', cointegration.half_life)
+    return cointegration
+
+
+def bollinger(signal, threshold, half_life=None, ref_value=0.):
+    """
+
+    :param signal:
+    :param threshold:
+    :param half_life:
+    :param ref_value:
+    :return:
+    """
+    logging.info('computing ewma')
+    if half_life:
+        signal_ref = signal.ewm(halflife=half_life).mean()
+
+    else:
+        ref = numpy.empty(len(signal))
+        ref.fill(ref_value)
+        signal_ref = pandas.Series(ref, index=signal.index)
+
+    logging.info('computing scaling')
+    band_inf, band_mid, band_sup, scalings = get_bands(signal.values, signal_ref.values, threshold)
+    bands = pandas.DataFrame({'band_inf': band_inf, 'band_mid': band_mid, 'band_sup': band_sup, 'scaling': -scalings},
+                             index=signal.index)
+    return bands[['band_inf', 'band_mid', 'band_sup']], bands['scaling']
+
+
+def load_quotes(securities, data_path='data'):
+    """
+
+    :param securities: list of securities, stored as <data path>/<security>.pkl
+    :param data_path:
+    :return: tuple of dicts security -> quotes and security -> mid prices
+    """
+    prices_bid_ask_securities = dict()
+    prices_mid_securities = dict()
+    for security in securities:
+        quote = pandas.read_pickle(os.sep.join([data_path, '%s.pkl' % security])).astype(float)
+        prices_bid_ask_securities[security] = quote
+        quote_mid = 0.5 * (quote['bid'] + quote['ask'])
+        prices_mid_securities[security] = quote_mid
+
+    return prices_bid_ask_securities, prices_mid_securities
+
+
+def target_positions(cointegration, securities, step_size, ewma_period, trade_scale):
+    """
+    Positions trading the cointegrated spread over the backtest period.
+
+    :param cointegration: CoIntegration instance
+    :param securities: securities in the order of the cointegration vector
+    :param step_size: variation that triggers a trade in terms of std dev
+    :param ewma_period: length of EWMA in terms of cointegration half-life
+    :param trade_scale: how many spreads to trades at a time
+    :return: tuple (bands, pandas.DataFrame of target positions per security)
+    """
+    threshold = step_size * cointegration.calibration['signal'].std()
+    logging.info('size of threshold: %.2f', threshold)
+
+    bands, scaling = bollinger(cointegration.signal, threshold, half_life=ewma_period * cointegration.half_life)
+    #bands, scaling = bollinger(cointegration.signal, threshold, ref_value=cointegration.calibration['signal'].mean())
+
+    shares = (scaling.values * cointegration.vector[:, None] * trade_scale).astype(int)
+    return bands, pandas.DataFrame(shares.transpose(), index=scaling.index, columns=securities)
@@ -0,0 +1,167 @@
+"""
+Backtests of the cointegration strategy over a grid of parameters, see sweep.
+"""
+import hashlib
+import itertools
+import logging
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas
+
+from mktdatadb.merge import align_quotes
+from spreadstrategy import load_quotes, backtest, target_positions, compute_trades
+
+__author__ = 'Christophe'
+
+_WORKER_STATE = dict()
+
+
+def _init_worker(prices_bid_ask_securities, prices_mid_securities, calibrations=None):
+    _WORKER_STATE['prices_bid_ask'] = prices_bid_ask_securities
+    _WORKER_STATE['prices_mid'] = prices_mid_securities
+    _WORKER_STATE['calibrations'] = calibrations
+
+
+def _prices_digest(prices_mid_securities):
+    """
+    Hash of the timestamps and values of the mid prices, so that cached calibrations are not reused with other data.
+
+    :param prices_mid_securities: dict security -> mid prices
+    :return: hexadecimal string
+    """
+    digest = hashlib.sha1()
+    for security in sorted(prices_mid_securities.keys()):
+        digest.update(security.encode('utf-8'))
+        digest.update(pandas.util.hash_pandas_object(prices_mid_securities[security]).values.tobytes())
+
+    return digest.hexdigest()[:16]
+
+
+def _calibration_path(cache_path, securities, window, prices_digest):
+    filename = '%s_%s_%s.pkl' % ('-'.join(securities), '_'.join(window), prices_digest)
+    return os.sep.join([cache_path, filename])
+
+
+def _calibrate(window):
+    calibration_start, calibration_end, backtest_end = window
+    cointegration = backtest(_WORKER_STATE['prices_mid'], calibration_start, calibration_end, backtest_end)
+    if cointegration.vector is not None:
+        # computed once here instead of once per parameter combination
+        cointegration.signal
+
+    return window, cointegration
+
+
+def calibrate(windows, prices_bid_ask_securities, prices_mid_securities, processes=None, cache_path=None):
+    """
+    Cointegration statistics of each window, read from the cache when available.
+
+    :param windows: list of (calibration start, calibration end, backtest end) strings
+    :param prices_bid_ask_securities: dict security -> quotes
+    :param prices_mid_securities: dict security -> mid prices
+    :param processes: size of the process pool
+    :param cache_path: directory of pickled calibrations, keyed by securities, window and prices content, None for
+    no persistent cache
+    :return: dict window -> CoIntegration instance
+    """
+    securities = list(prices_mid_securities.keys())
+    prices_digest = _prices_digest(prices_mid_securities) if cache_path is not None else None
+    calibrations = dict()
+    missing_windows = list()
+    for window in windows:
+        if cache_path is not None and os.path.isfile(_calibration_path(cache_path, securities, window, prices_digest)):
+            with open(_calibration_path(cache_path, securities, window, prices_digest), mode='rb') as calibration_file:
+                calibrations[window] = pickle.load(calibration_file)
+
+        else:
+            missing_windows.append(window)
+
+    logging.info('calibrating %d window(s), %d cached', len(missing_windows), len(calibrations))
+    if not missing_windows:
+        return calibrations
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(prices_bid_ask_securities, prices_mid_securities)) as executor:
+        for window, cointegration in executor.map(_calibrate, missing_windows):
+            calibrations[window] = cointegration
+            if cache_path is not None:
+                if not os.path.isdir(cache_path):
+                    os.makedirs(cache_path)
+
+                calibration_path = _calibration_path(cache_path, securities, window, prices_digest)
+                with open(calibration_path + '.tmp', mode='wb') as calibration_file:
+                    pickle.dump(cointegration, calibration_file)
+
+                os.replace(calibration_path + '.tmp', calibration_path)
+
+    return calibrations
+
+
+def _max_drawdown(pnls):
+    return float(numpy.max(numpy.maximum.accumulate(pnls) - pnls)) if len(pnls) > 0 else 0.
+
+
+def _run_combination(combination):
+    window, step_size, ewma_period, trade_scale = combination
+    result = {
+        'calibration_start': window[0],
+        'calibration_end': window[1],
+        'backtest_end': window[2],
+        'step_size': step_size,
+        'ewma_period': ewma_period,
+        'trade_scale': trade_scale,
+    }
+    cointegration = _WORKER_STATE['calibrations'][window]
+    if cointegration.vector is None:
+        logging.warning('no cointegration vector for window %s', window)
+        return result
+
+    prices_bid_ask_securities = _WORKER_STATE['prices_bid_ask']
+    bands, shares = target_positions(cointegration, list(prices_bid_ask_securities.keys()), step_size, ewma_period,
+                                     trade_scale)
+    bids, asks, shares = align_quotes(prices_bid_ask_securities, shares)
+    pnls = compute_trades(bids, asks, shares).sum(axis=1).values
+    trades = shares.diff()
+    trades.iloc[0] = shares.iloc[0]
+    traded_notional = numpy.abs(trades.values) * numpy.where(trades.values < 0, bids.values, asks.values)
+    result.update({
+        'pnl': pnls[-1] if len(pnls) > 0 else 0.,
+        'turnover_shares': numpy.abs(trades.values).sum(),
+        'turnover_notional': traded_notional.sum(),
+        'count_trades': numpy.count_nonzero(trades.values),
+        'max_drawdown': _max_drawdown(pnls),
+        'half_life': cointegration.half_life,
+    })
+    return result
+
+
+def sweep(securities, windows, step_sizes, ewma_periods, trade_scales, processes=None, data_path='data',
+          cache_path=None):
+    """
+    Backtests every combination of parameters, loading prices and calibrating each window only once.
+
+    :param securities:
+    :param windows: list of (calibration start, calibration end, backtest end) strings
+    :param step_sizes: variations that trigger a trade in terms of std dev
+    :param ewma_periods: lengths of EWMA in terms of cointegration half-life
+    :param trade_scales: how many spreads to trades at a time
+    :param processes: size of the process pool, None for one process per CPU
+    :param data_path: location of the quotes pickles
+    :param cache_path: directory of pickled calibrations, None for no persistent cache
+    :return: pandas.DataFrame, one row per combination
+    """
+    prices_bid_ask_securities, prices_mid_securities = load_quotes(securities, data_path=data_path)
+    calibrations = calibrate(windows, prices_bid_ask_securities, prices_mid_securities, processes=processes,
+                             cache_path=cache_path)
+    combinations = list(itertools.product(windows, step_sizes, ewma_periods, trade_scales))
+    logging.info('running %d combination(s)', len(combinations))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(prices_bid_ask_securities, prices_mid_securities, calibrations)) as executor:
+        results = list(executor.map(_run_combination, combinations))
+
+    columns = ['calibration_start', 'calibration_end', 'backtest_end', 'step_size', 'ewma_period', 'trade_scale',
+               'pnl', 'turnover_shares', 'turnover_notional', 'count_trades', 'max_drawdown', 'half_life']
+    return pandas.DataFrame(results, columns=columns)
@@ -0,0 +1,103 @@
+"""
+Walk-forward calibration of the cointegrated spread, see walk_forward.
+"""
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas
+
+from spreadstrategy import CoIntegration
+from statsext.walkforward import BlockMoments
+
+__author__ = 'Christophe'
+
+
+def schedule_folds(boundaries, calibration_periods, backtest_periods):
+    """
+
+    :param boundaries: sorted block start dates, the last one ending the history
+    :param calibration_periods: number of blocks per calibration window
+    :param backtest_periods: number of blocks per out-of-sample window, also the step between folds
+    :return: list of (calibration blocks, calibration start, calibration end, backtest end)
+    """
+    folds = list()
+    count_blocks = len(boundaries) - 1
+    for first_block in range(0, count_blocks - calibration_periods, backtest_periods):
+        last_block = first_block + calibration_periods
+        backtest_block = min(last_block + backtest_periods, count_blocks)
+        folds.append((list(range(first_block, last_block)), boundaries[first_block], boundaries[last_block],
+                      boundaries[backtest_block]))
+
+    return folds
+
+
+def _run_fold(fold):
+    prices, calibration_start, calibration_end, backtest_end, vector, half_life = fold
+    cointegration = CoIntegration(prices, calibration_start, calibration_end, backtest_end, vector=vector,
+                                  half_life=half_life)
+    return cointegration.signal
+
+
+def walk_forward(prices, start_date, end_date, calibration_periods=3, backtest_periods=1, freq='MS', lag=1,
+                 significance='95%', processes=None):
+    """
+    Recalibrates the cointegration over a rolling window and stitches the out-of-sample signals.
+
+    The Johansen and half-life statistics of each block (calendar month by default) are computed once and shared
+    by all the calibration windows containing it.
+
+    :param prices: pandas.DataFrame of mid prices, one column per security
+    :param start_date: start of the first calibration window
+    :param end_date: end of the history
+    :param calibration_periods: number of blocks per calibration window
+    :param backtest_periods: number of blocks per out-of-sample window
+    :param freq: pandas frequency of the block boundaries
+    :param lag: number of lagged difference terms used when computing the estimator
+    :param significance: '90%', '95%' or '99%'
+    :param processes: size of the process pool, None for one process per CPU, 1 for running folds in-process
+    :return: dict with the folds table, the stitched signal and the vector and half-life in force at each signal
+    timestamp
+    """
+    boundaries = pandas.date_range(start_date, end_date, freq=freq)
+    history = prices[(prices.index >= boundaries[0]) & (prices.index < boundaries[-1])]
+    calibration_set = history.groupby(pandas.Grouper(freq='D')).ffill().dropna(axis=0)
+    block_ids = numpy.searchsorted(boundaries.values, calibration_set.index.values, side='right') - 1
+    moments = BlockMoments(calibration_set.values, block_ids, lag=lag)
+
+    folds = list()
+    tasks = list()
+    for blocks, calibration_start, calibration_end, backtest_end in schedule_folds(boundaries, calibration_periods,
+                                                                                   backtest_periods):
+        calibration = moments.calibrate(blocks, significance=significance)
+        half_life = None
+        if calibration['ar_slope'] is not None:
+            half_life = -int(math.log(2) / calibration['ar_slope'])
+
+        folds.append({'calibration_start': calibration_start, 'calibration_end': calibration_end,
+                      'backtest_end': backtest_end, 'vector': calibration['vector'], 'half_life': half_life})
+        if calibration['vector'] is None:
+            logging.warning('no cointegration vector for calibration %s - %s', calibration_start, calibration_end)
+            continue
+
+        fold_prices = prices[(prices.index >= calibration_start) & (prices.index < backtest_end)]
+        tasks.append((fold_prices, calibration_start, calibration_end, backtest_end, calibration['vector'],
+                      half_life))
+
+    logging.info('running %d fold(s) out of %d', len(tasks), len(folds))
+    if processes == 1:
+        signals = [_run_fold(task) for task in tasks]
+
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            signals = list(executor.map(_run_fold, tasks))
+
+    folds = pandas.DataFrame(folds, columns=['calibration_start', 'calibration_end', 'backtest_end', 'vector',
+                                             'half_life'])
+    signal = pandas.concat(signals) if signals else pandas.Series(dtype=float)
+    fold_index = numpy.searchsorted(folds['calibration_end'].values, signal.index.values, side='right') - 1
+    vectors = pandas.DataFrame([folds['vector'].iloc[index] for index in fold_index], index=signal.index,
+                               columns=prices.columns)
+    half_lives = pandas.Series(folds['half_life'].values[fold_index], index=signal.index)
+    return {'folds': folds, 'signal': signal, 'vectors': vectors, 'half_life': half_lives}
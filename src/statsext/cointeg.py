@@ -1,8 +1,10 @@
+import collections
+import math
 import numpy
+import scipy.linalg
 from scipy.signal import detrend
 from statsmodels.tsa import tsatools
 from numpy import linalg
-from statsmodels.tsa.stattools import adfuller
 
 __author__ = 'Christophe'
 
@@ -13,15 +15,131 @@ def is_not_stationary(v, significance='5%', max_d=6, reg='nc', autolag='AIC'):
     Parameters
     ----------
     v: ndarray matrix
-        residuals matrix
+        residuals vector, or samples x series matrix for testing several series at once
+    significance: str
+        '1%', '5%' or '10%'
 
     Returns
     -------
     bool: boolean
-        true if v pass the test 
+        true if v pass the test (one boolean per series when v is a matrix)
     """
-    adf = adfuller(v, max_d, reg, autolag)
-    return adf[0] >= adf[4][significance]
+    adf = adf_statistics(v, max_d=max_d, reg=reg, autolag=autolag)
+    not_stationary = adf['statistic'] >= adf['critical_values'][significance]
+    if numpy.ndim(v) == 1:
+        return bool(not_stationary[0])
+
+    return not_stationary
+
+
+# MacKinnon (2010) response surface coefficients of the ADF critical values at 1%, 5% and 10%
+_ADF_TAU = {
+    'nc': numpy.array([
+        [-2.56574, -2.2358, -3.627, 0.0],
+        [-1.941, -0.2686, -3.365, 31.223],
+        [-1.61682, 0.2656, -2.714, 25.364]]),
+    'c': numpy.array([
+        [-3.43035, -6.5393, -16.786, -79.433],
+        [-2.86154, -2.8903, -4.234, -40.04],
+        [-2.56677, -1.5384, -2.809, 0.0]]),
+    'ct': numpy.array([
+        [-3.95877, -9.0531, -28.428, -134.155],
+        [-3.41049, -4.3904, -9.036, -45.374],
+        [-3.12705, -2.5856, -3.925, -22.38]]),
+}
+
+_ADF_SIGNIFICANCES = ('1%', '5%', '10%')
+
+
+def _adf_design(levels, diffs, lag, count_trend, level_first):
+    """
+    Stacked ADF regression matrices [trend, level, lagged differences, differences] of each series.
+
+    :param levels: samples x series array
+    :param diffs: first differences of levels
+    :param lag: number of lagged differences
+    :param count_trend: 0 (no deterministic term), 1 (constant) or 2 (constant and linear trend)
+    :param level_first: when False, the lagged level comes right before the differences
+    :return: series x rows x columns array
+    """
+    count_rows = diffs.shape[0] - lag
+    columns = list()
+    if count_trend > 0:
+        columns.append(numpy.ones_like(diffs[lag:]))
+
+    if count_trend > 1:
+        columns.append(numpy.broadcast_to(numpy.arange(1., count_rows + 1.)[:, None], diffs[lag:].shape))
+
+    lagged_diffs = [diffs[lag - i:lag - i + count_rows] for i in range(1, lag + 1)]
+    if level_first:
+        columns += [levels[lag:-1]] + lagged_diffs
+
+    else:
+        columns += lagged_diffs + [levels[lag:-1]]
+
+    columns.append(diffs[lag:])
+    return numpy.stack(columns, axis=-1).transpose(1, 0, 2)
+
+
+def adf_statistics(v, max_d=6, reg='nc', autolag='AIC'):
+    """
+    Augmented Dickey Fuller statistics of one or several series, same results as statsmodels adfuller.
+
+    The lag selection regressions of a series are nested: a single QR decomposition of the full design matrix
+    (lagged differences up to max_d, then the differences themselves) gives the residual sum of squares of every
+    candidate lag order. The decompositions of all the series are computed as one stacked operation.
+
+    :param v: series vector, or samples x series matrix
+    :param max_d: maximum number of lagged differences
+    :param reg: 'nc' (no deterministic term), 'c' (constant) or 'ct' (constant and linear trend)
+    :param autolag: 'AIC', 'BIC' or None for using max_d lagged differences
+    :return: dict with the statistics, the selected lags, the numbers of observations of the final regressions and
+    the critical values (dict significance -> value per series)
+    """
+    levels = numpy.asarray(v, dtype=float)
+    if levels.ndim == 1:
+        levels = levels[:, None]
+
+    reg = 'nc' if reg == 'n' else reg
+    assert reg in _ADF_TAU, 'unsupported regression: %s' % reg
+    count_trend = len(reg) if reg != 'nc' else 0
+    count_samples, count_series = levels.shape
+    assert max_d <= count_samples // 2 - count_trend - 1, 'max_d too large for the sample size'
+    diffs = numpy.diff(levels, axis=0)
+    lags = numpy.full(count_series, max_d, dtype=int)
+    if autolag is not None:
+        assert autolag.lower() in ('aic', 'bic'), 'unsupported lag selection: %s' % autolag
+        count_rows = count_samples - 1 - max_d
+        r = numpy.linalg.qr(_adf_design(levels, diffs, max_d, count_trend, level_first=True), mode='r')
+        # residual sum of squares when regressing on the first k columns: squared tail of the last column of R
+        tails = numpy.cumsum(r[:, ::-1, -1] ** 2, axis=1)[:, ::-1]
+        counts_regressors = numpy.arange(count_trend + 1, count_trend + max_d + 2)
+        residual_sums = tails[:, counts_regressors]
+        penalty = 2. if autolag.lower() == 'aic' else math.log(count_rows)
+        criteria = count_rows * numpy.log(residual_sums / count_rows) + penalty * counts_regressors
+        lags = numpy.argmin(criteria, axis=1)
+
+    statistics = numpy.empty(count_series)
+    counts_observations = count_samples - 1 - lags
+    for lag in numpy.unique(lags):
+        selected = lags == lag
+        r = numpy.linalg.qr(_adf_design(levels[:, selected], diffs[:, selected], lag, count_trend, level_first=False),
+                            mode='r')
+        count_regressors = count_trend + lag + 1
+        degrees_freedom = count_samples - 1 - lag - count_regressors
+        level_diagonal = r[:, count_regressors - 1, count_regressors - 1]
+        scale = numpy.abs(r[:, count_regressors, count_regressors]) / math.sqrt(degrees_freedom)
+        # t-value of the level coefficient, which comes last among the regressors
+        statistics[selected] = numpy.sign(level_diagonal) * r[:, count_regressors - 1, count_regressors] / scale
+
+    inverse_counts = 1. / counts_observations
+    critical_values = numpy.dot(_ADF_TAU[reg], numpy.vstack([inverse_counts ** power for power in range(4)]))
+    return {
+        'statistic': statistics,
+        'lag': lags,
+        'nobs': counts_observations,
+        'critical_values': dict(zip(_ADF_SIGNIFICANCES, critical_values)),
+    }
 
 
 _ECJP0 = numpy.array([
@@ -177,23 +295,41 @@ def get_critical_values_max_eigenvalue(dim_index, time_polynomial_order):
     return jc
 
 
-def residuals(y, x):
+_JOHANSEN_METHODS = ('pinv', 'qr')
+
+
+def residuals(y, x, method='pinv'):
+    """
+    Residuals of the least-squares projection of y on the columns of x.
+
+    :param y:
+    :param x:
+    :param method: 'pinv' projects through the pseudo-inverse (full SVD), 'qr' through a thin QR decomposition
+    :return:
+    """
     if x.size == 0:
         return y
 
+    if method == 'qr':
+        q, r = linalg.qr(x)
+        return y - numpy.dot(q, numpy.dot(q.T, y))
+
     r = y - numpy.dot(x, numpy.dot(numpy.linalg.pinv(x), y))
     return r
 
 
-def cointegration_johansen(input_df, lag=1):
+def cointegration_johansen(input_df, lag=1, method='pinv'):
     """
     For axis: -1 means no deterministic part, 0 means constant term, 1 means constant plus time-trend,
     > 1 means higher order polynomial.
 
     :param input_df: the input vectors as a pandas.DataFrame instance
     :param lag: number of lagged difference terms used when computing the estimator
+    :param method: 'pinv' for pseudo-inverse projections, explicit inverses and a general eigensolver,
+    'qr' for QR projections, Cholesky solves and a symmetric generalized eigensolver (faster, real eigenvalues)
     :return: returns test statistics data
     """
+    assert method in _JOHANSEN_METHODS, 'unknown method %s' % method
     count_samples, count_dimensions = input_df.shape
     input_df = detrend(input_df, type='constant', axis=0)
     diff_input_df = numpy.diff(input_df, 1, axis=0)
@@ -202,11 +338,11 @@ def cointegration_johansen(input_df, lag=1):
     z = detrend(z, type='constant', axis=0)
     diff_input_df = diff_input_df[lag:]
     diff_input_df = detrend(diff_input_df, type='constant', axis=0)
-    r0t = residuals(diff_input_df, z)
+    r0t = residuals(diff_input_df, z, method=method)
     lx = input_df[:-lag]
     lx = lx[1:]
     diff_input_df = detrend(lx, type='constant', axis=0)
-    rkt = residuals(diff_input_df, z)
+    rkt = residuals(diff_input_df, z, method=method)
 
     if rkt is None:
         return None
@@ -214,12 +350,38 @@ def cointegration_johansen(input_df, lag=1):
     skk = numpy.dot(rkt.T, rkt) / rkt.shape[0]
     sk0 = numpy.dot(rkt.T, r0t) / rkt.shape[0]
     s00 = numpy.dot(r0t.T, r0t) / r0t.shape[0]
-    sig = numpy.dot(sk0, numpy.dot(linalg.inv(s00), sk0.T))
-    eigenvalues, eigenvectors = linalg.eig(numpy.dot(linalg.inv(skk), sig))
+    result = _johansen_statistics(s00, sk0, skk, rkt.shape[0], method=method)
+    result['rkt'] = rkt
+    result['r0t'] = r0t
+    return result
+
 
-    # normalizing the eigenvectors such that (du'skk*du) = I
-    temp = linalg.inv(linalg.cholesky(numpy.dot(eigenvectors.T, numpy.dot(skk, eigenvectors))))
-    dt = numpy.dot(eigenvectors, temp)
+def _johansen_statistics(s00, sk0, skk, t, method='pinv'):
+    """
+    Eigen decomposition and test statistics from the residual moment matrices.
+
+    :param s00: moment matrix of the differences residuals
+    :param sk0: cross moment matrix of the levels and differences residuals
+    :param skk: moment matrix of the levels residuals
+    :param t: number of samples the moments are computed from
+    :param method: 'pinv' or 'qr', see cointegration_johansen
+    :return: test statistics data
+    """
+    count_dimensions = s00.shape[0]
+    if method == 'qr':
+        # sig = sk0 * inv(s00) * sk0' = a'a with a = inv(l) * sk0', l being the Cholesky factor of s00
+        a = scipy.linalg.solve_triangular(linalg.cholesky(s00), sk0.T, lower=True)
+        sig = numpy.dot(a.T, a)
+        # generalized symmetric problem sig * du = lambda * skk * du, eigenvectors come out with du'skk*du = I
+        eigenvalues, dt = scipy.linalg.eigh(sig, skk)
+
+    else:
+        sig = numpy.dot(sk0, numpy.dot(linalg.inv(s00), sk0.T))
+        eigenvalues, eigenvectors = linalg.eig(numpy.dot(linalg.inv(skk), sig))
+
+        # normalizing the eigenvectors such that (du'skk*du) = I
+        temp = linalg.inv(linalg.cholesky(numpy.dot(eigenvectors.T, numpy.dot(skk, eigenvectors))))
+        dt = numpy.dot(eigenvectors, temp)
 
     # sorting eigenvalues and vectors
     order_decreasing = numpy.flipud(numpy.argsort(eigenvalues))
@@ -232,7 +394,6 @@ def cointegration_johansen(input_df, lag=1):
     critical_values_max_eigenvalue = numpy.zeros((count_dimensions, 3))
     critical_values_trace = numpy.zeros((count_dimensions, 3))
     iota = numpy.ones(count_dimensions)
-    t, junk = rkt.shape
     for i in range(0, count_dimensions):
         tmp = numpy.log(iota - sorted_eigenvalues)[i:]
         trace_statistics[i] = -t * numpy.sum(tmp, 0)
@@ -242,8 +403,6 @@ def cointegration_johansen(input_df, lag=1):
         order_decreasing[i] = i
 
     result = dict()
-    result['rkt'] = rkt
-    result['r0t'] = r0t
     result['eigenvalues'] = sorted_eigenvalues
     result['eigenvectors'] = sorted_eigenvectors
     result['trace_statistic'] = trace_statistics  # likelihood ratio trace statistic
@@ -254,19 +413,211 @@ def cointegration_johansen(input_df, lag=1):
     return result
 
 
-def get_johansen(input_vectors, lag=1, significance='95%'):
+def get_johansen(input_vectors, lag=1, significance='95%', method='pinv'):
     """
     Cointegration vectors at the specified level of significance given by the trace statistic test.
 
     :param input_vectors:
     :param lag:
     :param significance:
+    :param method: 'pinv' or 'qr', see cointegration_johansen
     :return:
     """
-    test_results = cointegration_johansen(input_vectors, lag=lag)
+    test_results = cointegration_johansen(input_vectors, lag=lag, method=method)
+    return select_vectors(test_results, significance=significance)
+
+
+def select_vectors(test_results, significance='95%'):
+    """
+    Cointegration vectors passing the trace statistic test, normalized by their smallest absolute component.
+
+    :param test_results: test statistics data, as returned by cointegration_johansen
+    :param significance: '90%', '95%' or '99%'
+    :return: list of vectors
+    """
     trace_statistic = test_results['trace_statistic']
     critical_values = test_results['critical_values_trace']
     significance_indices = {'90%': 0, '95%': 1, '99%': 2}
     count_cointegration_vectors = sum(trace_statistic > critical_values[:, significance_indices[significance]])
     vectors = test_results['eigenvectors'][:, :count_cointegration_vectors]
     return [vectors[:, index] / abs(vectors[:, index]).min() for index in range(count_cointegration_vectors)]
+
+
+def regression_rows(levels, lag=1):
+    """
+    Johansen regression rows [dx_t, x_t-lag, dx_t-1 ... dx_t-lag] for all complete samples, as used by
+    cointegration_johansen.
+
+    :param levels: samples x n array of input vectors
+    :param lag: number of lagged difference terms
+    :return: array of shape (samples - 1 - lag, n * (2 + lag))
+    """
+    levels = numpy.asarray(levels, dtype=float)
+    count_samples = levels.shape[0]
+    diffs = numpy.diff(levels, 1, axis=0)
+    blocks = [diffs[lag:], levels[1:count_samples - lag]]
+    for count_lags in range(1, lag + 1):
+        blocks.append(diffs[lag - count_lags:count_samples - 1 - count_lags])
+
+    return numpy.hstack(blocks)
+
+
+def residual_moments(centered, count_dimensions, t):
+    """
+    Johansen residual moment matrices from the centered cross products of the regression rows
+    [dx_t, x_t-lag, dx_t-1 ... dx_t-lag]. Works on a single matrix or on a stack of matrices (..., p, p).
+
+    :param centered: centered cross products (sum over samples of the outer products of the centered rows)
+    :param count_dimensions: number of input vectors n, rows having n * (2 + lag) entries
+    :param t: number of samples
+    :return: tuple (s00, sk0, skk) of residual moment matrices
+    """
+    n = count_dimensions
+    c00 = centered[..., :n, :n]
+    c0k = centered[..., :n, n:2 * n]
+    ckk = centered[..., n:2 * n, n:2 * n]
+    if centered.shape[-1] > 2 * n:
+        czz = centered[..., 2 * n:, 2 * n:]
+        cz0 = centered[..., 2 * n:, :n]
+        czk = centered[..., 2 * n:, n:2 * n]
+        projected = numpy.linalg.solve(czz, numpy.concatenate([cz0, czk], axis=-1))
+        c00 = c00 - numpy.matmul(numpy.swapaxes(cz0, -1, -2), projected[..., :n])
+        c0k = c0k - numpy.matmul(numpy.swapaxes(cz0, -1, -2), projected[..., n:])
+        ckk = ckk - numpy.matmul(numpy.swapaxes(czk, -1, -2), projected[..., n:])
+
+    return c00 / t, numpy.swapaxes(c0k, -1, -2) / t, ckk / t
+
+
+class RollingJohansen(object):
+    """
+    Johansen estimator over a sliding window of level samples.
+
+    The raw sums of the regression rows [dx_t, x_t-lag, dx_t-1 ... dx_t-lag] are updated as samples enter and leave the
+    window, so that each step costs O(p^2) for the update plus a decomposition of size p, whatever the window length.
+    The statistics are those cointegration_johansen would compute on the same window, within rounding: the sums are
+    recomputed from the rows of the window at regular intervals so that rounding errors do not accumulate.
+    """
+
+    def __init__(self, window, lag=1, method='pinv', resync_every=None):
+        """
+
+        :param window: number of level samples in the window
+        :param lag: number of lagged difference terms used when computing the estimator
+        :param method: eigensolver, 'pinv' or 'qr' (see cointegration_johansen)
+        :param resync_every: number of window slides between two recomputations of the sums, defaults to the window
+        length (amortized cost of O(p^2) per step)
+        """
+        assert window > lag + 2, 'window too short for the number of lags'
+        self._window = window
+        self._lag = lag
+        self._levels = collections.deque(maxlen=lag + 2)
+        self._rows = collections.deque()
+        self._origin = None
+        self._sum = None
+        self._sum_products = None
+        self._count_dimensions = None
+        self._method = method
+        self._resync_every = resync_every or window
+        self._count_slides = 0
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def lag(self):
+        return self._lag
+
+    @property
+    def count_samples(self):
+        """
+        Number of regression rows in the window.
+        """
+        return len(self._rows)
+
+    @property
+    def ready(self):
+        return len(self._rows) == self._window - 1 - self._lag
+
+    def _regression_row(self):
+        # oldest first: levels[0] = x_t-lag-1, ..., levels[-1] = x_t
+        levels = list(self._levels)
+        diffs = [levels[index + 1] - levels[index] for index in range(len(levels) - 1)]
+        lagged_diffs = [diffs[-1 - count_lags] for count_lags in range(1, self._lag + 1)]
+        return numpy.concatenate([diffs[-1], levels[1]] + lagged_diffs)
+
+    def update(self, sample):
+        """
+        Adds a level sample, removing the oldest one once the window is full.
+
+        :param sample: levels of the input vectors at the current step
+        :return: True when the window is full
+        """
+        sample = numpy.asarray(sample, dtype=float)
+        if self._origin is None:
+            # levels are shifted by the first sample to limit cancellation in the centered moments
+            self._origin = sample.copy()
+            self._count_dimensions = sample.shape[0]
+            size = self._count_dimensions * (2 + self._lag)
+            self._sum = numpy.zeros(size)
+            self._sum_products = numpy.zeros((size, size))
+
+        self._levels.append(sample - self._origin)
+        if len(self._levels) < self._lag + 2:
+            return False
+
+        row = self._regression_row()
+        self._rows.append(row)
+        self._sum += row
+        self._sum_products += numpy.outer(row, row)
+        if len(self._rows) > self._window - 1 - self._lag:
+            old_row = self._rows.popleft()
+            self._sum -= old_row
+            self._sum_products -= numpy.outer(old_row, old_row)
+            self._count_slides += 1
+            if self._count_slides == self._resync_every:
+                self._resync()
+
+        return self.ready
+
+    def _resync(self):
+        rows = numpy.array(self._rows)
+        self._sum = rows.sum(axis=0)
+        self._sum_products = numpy.dot(rows.T, rows)
+        self._count_slides = 0
+
+    def moments(self):
+        """
+
+        :return: tuple (s00, sk0, skk) of residual moment matrices
+        """
+        t = float(len(self._rows))
+        centered = self._sum_products - numpy.outer(self._sum, self._sum) / t
+        return residual_moments(centered, self._count_dimensions, t)
+
+    def statistics(self):
+        """
+        Statistics over the current window, same keys as cointegration_johansen except the residuals.
+
+        :return: test statistics data
+        """
+        assert self.ready, 'window not full yet'
+        s00, sk0, skk = self.moments()
+        return _johansen_statistics(s00, sk0, skk, len(self._rows), method=self._method)
+
+
+def rolling_johansen(input_df, window, lag=1, method='pinv', resync_every=None):
+    """
+    Sliding-window Johansen statistics.
+
+    :param input_df: the input vectors as a pandas.DataFrame instance
+    :param window: number of samples per window
+    :param lag: number of lagged difference terms used when computing the estimator
+    :param method: 'pinv' or 'qr', see cointegration_johansen
+    :param resync_every: see RollingJohansen
+    :return: generator of (index label of the last sample in the window, test statistics data)
+    """
+    estimator = RollingJohansen(window, lag=lag, method=method, resync_every=resync_every)
+    for label, sample in zip(input_df.index, numpy.asarray(input_df, dtype=float)):
+        if estimator.update(sample):
+            yield label, estimator.statistics()
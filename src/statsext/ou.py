@@ -0,0 +1,109 @@
+"""
+Mean reversion speed of a spread, from the regression dy_t = intercept + slope * y_t-1 computed in closed form from
+the AR(1) moments.
+
+For an Ornstein-Uhlenbeck process sampled at regular steps, 1 + slope is the AR(1) coefficient, the discrete
+half-life -log(2) / slope being the usual first order approximation of log(2) / theta.
+"""
+import math
+
+import numpy
+
+__author__ = 'Christophe'
+
+
+def _half_life(slope):
+    if slope >= 0:
+        return numpy.inf
+
+    return -math.log(2) / slope
+
+
+def fit_ar1(values, summary=False):
+    """
+    Regression of the differences of the series on its lagged values (with intercept).
+
+    :param values: 1-D array of spread values, the (lagged value, difference) pairs involving a missing value are
+    left out of the regression
+    :param summary: when True, also fits the same regression with statsmodels and adds its summary (slow)
+    :return: dict with slope, intercept, residual_variance, slope_std_error, half_life, theta (mean reversion
+    speed per step, nan when the AR(1) coefficient is not in (0, 1)), and summary when requested
+    """
+    values = numpy.asarray(values, dtype=float)
+    lagged = values[:-1]
+    diffs = numpy.diff(values)
+    # dropping missing values before differencing would join values across the gap
+    valid = ~numpy.isnan(lagged) & ~numpy.isnan(diffs)
+    lagged = lagged[valid]
+    diffs = diffs[valid]
+    count = diffs.shape[0]
+    assert count > 2, 'not enough samples'
+    lagged_centered = lagged - lagged.mean()
+    diffs_centered = diffs - diffs.mean()
+    variance = numpy.dot(lagged_centered, lagged_centered)
+    slope = numpy.dot(lagged_centered, diffs_centered) / variance
+    intercept = diffs.mean() - slope * lagged.mean()
+    residuals = diffs_centered - slope * lagged_centered
+    residual_variance = numpy.dot(residuals, residuals) / (count - 2)
+    coefficient = 1. + slope
+    result = {
+        'slope': slope,
+        'intercept': intercept,
+        'residual_variance': residual_variance,
+        'slope_std_error': math.sqrt(residual_variance / variance),
+        'half_life': _half_life(slope),
+        'theta': -math.log(coefficient) if 0. < coefficient < 1. else numpy.nan,
+    }
+    if summary:
+        import statsmodels.api
+        regress = statsmodels.api.OLS(diffs, statsmodels.api.add_constant(lagged)).fit()
+        result['summary'] = regress.summary()
+
+    return result
+
+
+def rolling_slopes(values, window):
+    """
+    AR(1) slopes over a sliding window, from cumulative moments.
+
+    :param values: 1-D array of spread values without missing values
+    :param window: number of values per window
+    :return: array of slopes, one per window ending at each value, nan for the first window - 1 values
+    """
+    values = numpy.asarray(values, dtype=float)
+    assert window > 3, 'window too short'
+    slopes = numpy.full(values.shape[0], numpy.nan)
+    if values.shape[0] < window:
+        return slopes
+
+    # values are shifted by their first element to limit cancellation in the moments
+    shifted = values - values[0]
+    lagged = shifted[:-1]
+    diffs = numpy.diff(shifted)
+
+    def window_sums(terms):
+        cumulated = numpy.concatenate([[0.], numpy.cumsum(terms)])
+        return cumulated[window - 1:] - cumulated[:-window + 1]
+
+    count = float(window - 1)
+    sum_lagged = window_sums(lagged)
+    sum_diffs = window_sums(diffs)
+    covariance = window_sums(lagged * diffs) - sum_lagged * sum_diffs / count
+    variance = window_sums(lagged * lagged) - sum_lagged * sum_lagged / count
+    slopes[window - 1:] = covariance / variance
+    return slopes
+
+
+def rolling_half_life(values, window):
+    """
+
+    :param values: 1-D array of spread values without missing values
+    :param window: number of values per window
+    :return: array of half-lives (inf when the window is not mean reverting, nan for the first window - 1 values)
+    """
+    slopes = rolling_slopes(values, window)
+    with numpy.errstate(divide='ignore'):
+        half_lives = numpy.where(slopes < 0, -math.log(2) / slopes, numpy.inf)
+
+    half_lives[numpy.isnan(slopes)] = numpy.nan
+    return half_lives
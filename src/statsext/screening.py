@@ -0,0 +1,177 @@
+"""
+Cointegration screening over many combinations of series.
+
+The regression rows and their centered cross products are computed once for the whole universe: the moments of any
+combination are sub-blocks of these matrices, so combinations are evaluated by extracting blocks and running stacked
+linear algebra, without touching the samples again.
+"""
+import itertools
+import logging
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas
+
+from statsext import cointeg
+
+__author__ = 'Christophe'
+
+_SIGNIFICANCE_INDICES = {'90%': 0, '95%': 1, '99%': 2}
+
+_WORKER_STATE = dict()
+
+
+def _init_worker(universe):
+    _WORKER_STATE['universe'] = universe
+
+
+def _centered_products(rows):
+    centered = rows - rows.mean(axis=0)
+    return numpy.dot(centered.T, centered)
+
+
+def _block_indices(combination, count_series, count_blocks):
+    return numpy.concatenate([numpy.asarray(combination) + block * count_series for block in range(count_blocks)])
+
+
+def _screen_chunk(universe, combinations, significance, check_stationarity=False):
+    """
+    Evaluates combinations of the same size in one stacked computation.
+
+    :param universe: precomputed universe moments (see _universe_moments)
+    :param combinations: array (count combinations, size) of series indices
+    :param significance: '90%', '95%' or '99%'
+    :param check_stationarity: when True, runs the ADF test on the spread along the leading eigenvector
+    :return: list of result rows
+    """
+    combinations = numpy.asarray(combinations)
+    count_combinations, size = combinations.shape
+    count_series = universe['count_series']
+    t = universe['t']
+    indices = numpy.array([_block_indices(combination, count_series, 2 + universe['lag'])
+                           for combination in combinations])
+    centered = universe['centered'][indices[:, :, None], indices[:, None, :]]
+    s00, sk0, skk = cointeg.residual_moments(centered, size, t)
+    sig = numpy.matmul(sk0, numpy.linalg.solve(s00, numpy.swapaxes(sk0, -1, -2)))
+    eigenvalues, eigenvectors = numpy.linalg.eig(numpy.linalg.solve(skk, sig))
+    eigenvalues = eigenvalues.real
+    eigenvectors = eigenvectors.real
+    order_decreasing = numpy.argsort(-eigenvalues, axis=1)
+    sorted_eigenvalues = eigenvalues[numpy.arange(count_combinations)[:, None], order_decreasing]
+    log_complements = numpy.log(1. - sorted_eigenvalues)
+    trace_statistics = -t * numpy.cumsum(log_complements[:, ::-1], axis=1)[:, ::-1]
+    eigenvalue_statistics = -t * log_complements
+
+    significance_index = _SIGNIFICANCE_INDICES[significance]
+    critical_values_trace = numpy.array([cointeg.get_critical_values_trace(size - i, time_polynomial_order=0)
+                                         for i in range(size)])[:, significance_index]
+    critical_values_max_eigenvalue = numpy.array(
+        [cointeg.get_critical_values_max_eigenvalue(size - i, time_polynomial_order=0)
+         for i in range(size)])[:, significance_index]
+
+    # half-life of the spread along the leading eigenvector: AR(1) slope of d(spread) on lagged spread
+    leading = eigenvectors[numpy.arange(count_combinations), :, order_decreasing[:, 0]]
+    ar_indices = numpy.array([_block_indices(combination, count_series, 2) for combination in combinations])
+    ar_centered = universe['ar_centered'][ar_indices[:, :, None], ar_indices[:, None, :]]
+    cross = numpy.einsum('ki,kij,kj->k', leading, ar_centered[:, :size, size:], leading)
+    variance = numpy.einsum('ki,kij,kj->k', leading, ar_centered[:, size:, size:], leading)
+    slopes = cross / variance
+
+    vectors = leading / numpy.abs(leading).min(axis=1)[:, None]
+    not_stationary = [None] * count_combinations
+    if check_stationarity:
+        spreads = numpy.einsum('tki,ki->tk', universe['levels'][:, combinations], vectors)
+        not_stationary = cointeg.is_not_stationary(spreads, significance='%d%%' % (100 - int(significance[:2])))
+
+    results = list()
+    tickers = universe['tickers']
+    for index in range(count_combinations):
+        slope = slopes[index]
+        half_life = -math.log(2) / slope if slope < 0 else numpy.inf
+        vector = vectors[index]
+        spread_not_stationary = None if not_stationary[index] is None else bool(not_stationary[index])
+
+        results.append({
+            'tickers': tuple(tickers[series] for series in combinations[index]),
+            'size': size,
+            'trace_statistic': trace_statistics[index, 0],
+            'critical_value_trace': critical_values_trace[0],
+            'trace_margin': trace_statistics[index, 0] - critical_values_trace[0],
+            'eigenvalue_statistic': eigenvalue_statistics[index, 0],
+            'eigenvalue_margin': eigenvalue_statistics[index, 0] - critical_values_max_eigenvalue[0],
+            'count_vectors': int(numpy.sum(trace_statistics[index] > critical_values_trace)),
+            'half_life': half_life,
+            'vector': vector,
+            'not_stationary': spread_not_stationary,
+        })
+
+    return results
+
+
+def _screen_worker_chunk(combinations, significance, check_stationarity):
+    return _screen_chunk(_WORKER_STATE['universe'], combinations, significance, check_stationarity)
+
+
+def _universe_moments(prices, lag, with_levels=True):
+    levels = numpy.asarray(prices, dtype=float)
+    rows = cointeg.regression_rows(levels, lag=lag)
+    ar_rows = numpy.hstack([numpy.diff(levels, 1, axis=0), levels[:-1]])
+    return {
+        'tickers': list(prices.columns),
+        'count_series': levels.shape[1],
+        'lag': lag,
+        't': float(rows.shape[0]),
+        'centered': _centered_products(rows),
+        'ar_centered': _centered_products(ar_rows),
+        'levels': levels if with_levels else None,
+    }
+
+
+def _chunks(sequence, chunk_size):
+    for start in range(0, len(sequence), chunk_size):
+        yield sequence[start:start + chunk_size]
+
+
+def screen(prices, sizes=(2, 3), lag=1, significance='95%', processes=None, chunk_size=2000,
+           check_stationarity=False):
+    """
+    Johansen trace test over every combination of the input series, ranked by trace statistic margin.
+
+    :param prices: pandas.DataFrame of aligned prices, one column per series, without missing values
+    :param sizes: numbers of series per combination
+    :param lag: number of lagged difference terms used when computing the estimator
+    :param significance: '90%', '95%' or '99%'
+    :param processes: size of the process pool, None for one process per CPU, 1 for screening in-process
+    :param chunk_size: number of combinations evaluated per stacked computation
+    :param check_stationarity: when True, also runs is_not_stationary on the spread of each combination
+    :return: pandas.DataFrame, one row per combination, sorted by decreasing trace margin
+    """
+    started = time.time()
+    universe = _universe_moments(prices, lag, with_levels=check_stationarity)
+    tasks = list()
+    for size in sizes:
+        combinations = list(itertools.combinations(range(universe['count_series']), size))
+        tasks.extend(_chunks(combinations, chunk_size))
+
+    logging.info('screening %d chunk(s) of combinations over %d series', len(tasks), universe['count_series'])
+    results = list()
+    if processes == 1:
+        for combinations in tasks:
+            results.extend(_screen_chunk(universe, combinations, significance, check_stationarity))
+
+    else:
+        # the universe is sent once per worker rather than once per chunk
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(universe,)) as executor:
+            futures = [executor.submit(_screen_worker_chunk, combinations, significance, check_stationarity)
+                       for combinations in tasks]
+            for future in futures:
+                results.extend(future.result())
+
+    columns = ['tickers', 'size', 'trace_statistic', 'critical_value_trace', 'trace_margin', 'eigenvalue_statistic',
+               'eigenvalue_margin', 'count_vectors', 'half_life', 'vector', 'not_stationary']
+    table = pandas.DataFrame(results, columns=columns)
+    table = table.sort_values('trace_margin', ascending=False).reset_index(drop=True)
+    logging.info('screened %d combination(s) in %.3fs', len(table), time.time() - started)
+    return table
@@ -0,0 +1,127 @@
+"""
+Streaming computation of a spread (weighted sum of prices) from per-ticker book states.
+
+Equivalent to forward-filling the aligned prices within each day, taking the dot product with the weights and dropping
+incomplete rows, without materializing the aligned frame: the state is the last price of each ticker in the current
+day.
+"""
+import numpy
+
+from mktdatadb.merge import merge_streams
+
+__author__ = 'Christophe'
+
+
+def _day_of(timestamp):
+    if isinstance(timestamp, str):
+        return timestamp[:10]
+
+    return timestamp.date()
+
+
+def mid_price(book_state):
+    """
+
+    :param book_state: dict with bid and ask entries, as yielded by mktdatadb.load_book_states
+    :return: mid price, None when a side is missing
+    """
+    if book_state['bid'] is None or book_state['ask'] is None:
+        return None
+
+    return 0.5 * (float(book_state['bid']) + float(book_state['ask']))
+
+
+class SpreadBuilder(object):
+    """
+    Spread over timestamp-ordered price updates, with prices carried forward within each day.
+    """
+
+    def __init__(self, names, weights, day_key=None):
+        """
+
+        :param names: names of the components, in the order of the weights
+        :param weights: weight of each component
+        :param day_key: function mapping a timestamp to its day, defaults to the date of the timestamp (or its first
+        10 characters for timestamp strings)
+        """
+        self._positions = {name: position for position, name in enumerate(names)}
+        self._weights = numpy.asarray(weights, dtype=float)
+        assert len(self._positions) == self._weights.shape[0], 'one weight expected per component'
+        self._day_key = day_key or _day_of
+        self._prices = numpy.empty(self._weights.shape[0])
+        self._count_missing = 0
+        self._day = None
+        self._pending_timestamp = None
+        self._reset()
+
+    def _reset(self):
+        self._prices.fill(numpy.nan)
+        self._count_missing = self._prices.shape[0]
+
+    def _pending_value(self):
+        if self._pending_timestamp is None or self._count_missing > 0:
+            return None
+
+        return self._pending_timestamp, numpy.dot(self._weights, self._prices)
+
+    def update(self, timestamp, name, price):
+        """
+        Applies a price update. The spread of a timestamp is only known once all its updates are applied, so it is
+        returned when the first update of a later timestamp arrives.
+
+        :param timestamp:
+        :param name: component name
+        :param price: new price, None for no price (the last price is kept)
+        :return: (timestamp, spread) of the previous timestamp, None if there is none or if a price is missing
+        """
+        result = None
+        if self._pending_timestamp is not None and timestamp != self._pending_timestamp:
+            result = self._pending_value()
+
+        day = self._day_key(timestamp)
+        if day != self._day:
+            self._day = day
+            self._reset()
+
+        if price is not None:
+            position = self._positions[name]
+            if numpy.isnan(self._prices[position]):
+                self._count_missing -= 1
+
+            self._prices[position] = price
+
+        self._pending_timestamp = timestamp
+        return result
+
+    def flush(self):
+        """
+
+        :return: (timestamp, spread) of the last timestamp, None if there is none or if a price is missing
+        """
+        result = self._pending_value()
+        self._pending_timestamp = None
+        return result
+
+
+def stream_spread(book_states_by_name, weights, price=None, day_key=None):
+    """
+    Spread values computed incrementally from streams of book states.
+
+    :param book_states_by_name: dict name -> iterator of book states sorted by timestamp, in the order of the weights
+    :param weights: weight of each component
+    :param price: function mapping a book state to a price, defaults to the mid price
+    :param day_key: see SpreadBuilder
+    :return: generator of (timestamp, spread)
+    """
+    if price is None:
+        price = mid_price
+
+    builder = SpreadBuilder(list(book_states_by_name.keys()), weights, day_key=day_key)
+    for timestamp, name, book_state in merge_streams(book_states_by_name):
+        value = builder.update(timestamp, name, price(book_state))
+        if value is not None:
+            yield value
+
+    value = builder.flush()
+    if value is not None:
+        yield value
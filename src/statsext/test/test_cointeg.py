@@ -8,6 +8,8 @@ import io
 import numpy
 import pandas
 
+from statsmodels.tsa.stattools import adfuller
+
 from statsext import cointeg
 
 
@@ -65,6 +67,77 @@ class TestCointegration(unittest.TestCase):
         self.assertFalse(cointeg.is_not_stationary(numpy.dot(y.values, v1), significance='10%'))
         self.assertFalse(cointeg.is_not_stationary(numpy.dot(y.values, v2), significance='10%'))
 
+    def test_rolling_johansen(self):
+        s1 = self.load_resource('s1.pickle')
+        s2 = self.load_resource('s2.pickle')
+        s3 = self.load_resource('s3.pickle')
+        y = pandas.DataFrame({'col1': numpy.cumsum(s1) + s2 + 100., 'col2': 0.5 * numpy.cumsum(s1) + s3 + 50.,
+                              'col3': s3})
+        window = 250
+        for lag in (1, 2):
+            rolling = list(cointeg.rolling_johansen(y.iloc[:window + 20], window, lag=lag))
+            self.assertEqual(21, len(rolling))
+            for label, result in rolling[::10]:
+                expected = cointeg.cointegration_johansen(y.iloc[label - window + 1:label + 1], lag=lag)
+                numpy.testing.assert_allclose(expected['eigenvalues'], result['eigenvalues'], rtol=1e-7)
+                numpy.testing.assert_allclose(expected['trace_statistic'], result['trace_statistic'], rtol=1e-7)
+                numpy.testing.assert_allclose(expected['eigenvalue_statistics'], result['eigenvalue_statistics'],
+                                              rtol=1e-7)
+                numpy.testing.assert_allclose(numpy.abs(expected['eigenvectors']), numpy.abs(result['eigenvectors']),
+                                              rtol=1e-6, atol=1e-9)
+
+    def test_rolling_johansen_drift(self):
+        random_state = numpy.random.RandomState(1)
+        levels = numpy.cumsum(random_state.standard_normal((5000, 2)), axis=0)
+        # burst of large values leaving rounding errors in running sums once out of the window
+        levels[100:1100] += 1e6 * random_state.standard_normal((1000, 2))
+        window = 200
+        expected = cointeg.cointegration_johansen(pandas.DataFrame(levels[-window:]), lag=1)
+        estimator = cointeg.RollingJohansen(window, lag=1)
+        for sample in levels:
+            estimator.update(sample)
+
+        numpy.testing.assert_allclose(expected['eigenvalues'], estimator.statistics()['eigenvalues'], rtol=1e-7)
+        rows = cointeg.regression_rows(levels[-window:] - levels[0], lag=1)
+        numpy.testing.assert_allclose(numpy.dot(rows.T, rows), estimator._sum_products, rtol=1e-9)
+
+    def test_johansen_qr(self):
+        s1 = self.load_resource('s1.pickle')
+        s2 = self.load_resource('s2.pickle')
+        s3 = self.load_resource('s3.pickle')
+        y = pandas.DataFrame({'col1': numpy.cumsum(s1) + s2, 'col2': 0.5 * numpy.cumsum(s1) + s3, 'col3': s3})
+        for lag in (1, 3):
+            expected = cointeg.cointegration_johansen(y, lag=lag)
+            result = cointeg.cointegration_johansen(y, lag=lag, method='qr')
+            self.assertFalse(numpy.iscomplexobj(result['eigenvalues']))
+            numpy.testing.assert_allclose(expected['eigenvalues'], result['eigenvalues'], rtol=1e-8)
+            numpy.testing.assert_allclose(expected['trace_statistic'], result['trace_statistic'], rtol=1e-8)
+            numpy.testing.assert_allclose(numpy.abs(expected['eigenvectors']), numpy.abs(result['eigenvectors']),
+                                          rtol=1e-6)
+
+        vectors = cointeg.get_johansen(y, lag=1, method='qr')
+        numpy.testing.assert_almost_equal(numpy.abs(vectors[0]), numpy.array([1., 1.9999231, 2.6499922]))
+
+    def test_adf_batch(self):
+        s1 = self.load_resource('s1.pickle')
+        s2 = self.load_resource('s2.pickle')
+        s3 = self.load_resource('s3.pickle')
+        x_1t = numpy.cumsum(s1) + s2
+        x_3t = 100. * s3
+        levels = numpy.vstack([x_1t, x_3t, numpy.cumsum(s2) + s3]).T
+        for reg, statsmodels_reg in (('nc', 'n'), ('c', 'c'), ('ct', 'ct')):
+            result = cointeg.adf_statistics(levels, max_d=6, reg=reg, autolag='AIC')
+            for series in range(levels.shape[1]):
+                adf = adfuller(levels[:, series], 6, statsmodels_reg, 'AIC')
+                self.assertAlmostEqual(adf[0], result['statistic'][series])
+                self.assertEqual(adf[2], result['lag'][series])
+                self.assertEqual(adf[3], result['nobs'][series])
+                self.assertAlmostEqual(adf[4]['5%'], result['critical_values']['5%'][series])
+
+        not_stationary = cointeg.is_not_stationary(levels)
+        self.assertEqual([True, False, True], list(not_stationary))
+        self.assertEqual(not_stationary[1], cointeg.is_not_stationary(x_3t))
+
 
 if __name__ == '__main__':
     unittest.main()
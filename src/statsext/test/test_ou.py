@@ -0,0 +1,57 @@
+import unittest
+import math
+
+import numpy
+import statsmodels.api
+
+from statsext import ou
+
+
+def ornstein_uhlenbeck(random, count, theta=0.05, sigma=1.):
+    values = numpy.zeros(count)
+    noise = random.standard_normal(size=count)
+    for index in range(1, count):
+        values[index] = values[index - 1] * (1. - theta) + sigma * noise[index]
+
+    return values + 10.
+
+
+class TestOrnsteinUhlenbeck(unittest.TestCase):
+    def test_fit_ar1(self):
+        values = ornstein_uhlenbeck(numpy.random.RandomState(0), 5000)
+        regress = statsmodels.api.OLS(numpy.diff(values), statsmodels.api.add_constant(values[:-1])).fit()
+        result = ou.fit_ar1(values)
+        self.assertAlmostEqual(regress.params[1], result['slope'])
+        self.assertAlmostEqual(regress.params[0], result['intercept'])
+        self.assertAlmostEqual(regress.bse[1], result['slope_std_error'])
+        self.assertAlmostEqual(-math.log(2) / regress.params[1], result['half_life'])
+        self.assertAlmostEqual(0.05, result['theta'], delta=0.01)
+        self.assertNotIn('summary', result)
+        self.assertIn('summary', ou.fit_ar1(values, summary=True))
+
+    def test_fit_ar1_missing(self):
+        values = ornstein_uhlenbeck(numpy.random.RandomState(2), 1000)
+        values[[0, 100, 101, 500, 999]] = numpy.nan
+        lagged = values[:-1]
+        diffs = numpy.diff(values)
+        valid = ~numpy.isnan(lagged) & ~numpy.isnan(diffs)
+        regress = statsmodels.api.OLS(diffs[valid], statsmodels.api.add_constant(lagged[valid])).fit()
+        result = ou.fit_ar1(values)
+        self.assertAlmostEqual(regress.params[1], result['slope'])
+        self.assertAlmostEqual(regress.params[0], result['intercept'])
+        self.assertAlmostEqual(regress.bse[1], result['slope_std_error'])
+
+    def test_rolling(self):
+        values = ornstein_uhlenbeck(numpy.random.RandomState(1), 2000)
+        window = 250
+        slopes = ou.rolling_slopes(values, window)
+        self.assertTrue(numpy.all(numpy.isnan(slopes[:window - 1])))
+        for end in (window, 1000, 2000):
+            self.assertAlmostEqual(ou.fit_ar1(values[end - window:end])['slope'], slopes[end - 1])
+
+        half_lives = ou.rolling_half_life(values, window)
+        self.assertAlmostEqual(ou.fit_ar1(values[-window:])['half_life'], half_lives[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import math
+import pickle
+
+import numpy
+import pandas
+
+from statsext import cointeg, screening
+
+
+class TestScreening(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        current_module = sys.modules[__name__]
+        cls._resources_path = os.sep.join(
+            [os.path.dirname(current_module.__file__), 'resources'])
+
+    def load_resource(self, relative_path):
+        resource_path = os.sep.join([self._resources_path, relative_path])
+        resource_path_norm = os.path.abspath(resource_path)
+        with open(resource_path_norm, mode='rb') as resource_file:
+            resource = pickle.load(resource_file, encoding='latin1')
+            return resource
+
+    def load_prices(self):
+        s1 = self.load_resource('s1.pickle')[:2000]
+        s2 = self.load_resource('s2.pickle')[:2000]
+        s3 = self.load_resource('s3.pickle')[:2000]
+        return pandas.DataFrame({'A': numpy.cumsum(s1) + s2 + 100., 'B': 0.5 * numpy.cumsum(s1) + s3 + 50.,
+                                 'C': numpy.cumsum(s2) + 20., 'D': s3 + numpy.cumsum(s3) * 0.1 + 10.},
+                                columns=['A', 'B', 'C', 'D'])
+
+    def test_screen(self):
+        prices = self.load_prices()
+        for lag in (1, 2):
+            table = screening.screen(prices, sizes=(2, 3), lag=lag, processes=1)
+            self.assertEqual(6 + 4, len(table))
+            self.assertTrue(numpy.all(numpy.diff(table['trace_margin'].values) <= 0))
+            for row in table.itertuples(index=False):
+                expected = cointeg.cointegration_johansen(prices[list(row.tickers)], lag=lag)
+                self.assertAlmostEqual(1., row.trace_statistic / expected['trace_statistic'][0], places=7)
+                self.assertAlmostEqual(1., row.eigenvalue_statistic / expected['eigenvalue_statistics'][0], places=7)
+
+    def test_half_life(self):
+        prices = self.load_prices()
+        table = screening.screen(prices, sizes=(2,), processes=1)
+        best = table.iloc[0]
+        self.assertEqual(('A', 'B'), best['tickers'])
+        spread = numpy.dot(prices[list(best['tickers'])].values, best['vector'])
+        slope = numpy.polyfit(spread[:-1], numpy.diff(spread), 1)[0]
+        self.assertAlmostEqual(-math.log(2) / slope, best['half_life'], places=6)
+
+    def test_screen_processes(self):
+        prices = self.load_prices()
+        expected = screening.screen(prices, sizes=(2, 3), processes=1, chunk_size=3, check_stationarity=True)
+        table = screening.screen(prices, sizes=(2, 3), processes=2, chunk_size=3, check_stationarity=True)
+        self.assertEqual(list(expected['tickers']), list(table['tickers']))
+        numpy.testing.assert_allclose(expected['trace_statistic'].values, table['trace_statistic'].values)
+        numpy.testing.assert_allclose(expected['half_life'].values, table['half_life'].values)
+        self.assertEqual(list(expected['not_stationary']), list(table['not_stationary']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy
+import pandas
+
+from statsext import spread
+
+
+def random_book_states(random, start, count, null_sides=False):
+    timestamps = pandas.Timestamp(start) + pandas.to_timedelta(numpy.sort(random.randint(0, 3 * 86400, size=count)),
+                                                               unit='s')
+    bids = 100. + numpy.cumsum(random.standard_normal(size=count))
+    book_states = list()
+    for timestamp, bid in zip(timestamps, bids):
+        book_state = {'ts': timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), 'bid': bid, 'ask': bid + 0.02,
+                      'v_bid': 100, 'v_ask': 100}
+        if null_sides and random.rand() < 0.1:
+            book_state['ask'] = None
+
+        book_states.append(book_state)
+
+    return book_states
+
+
+class TestSpread(unittest.TestCase):
+    def test_stream_spread(self):
+        random = numpy.random.RandomState(0)
+        book_states = {
+            'A': random_book_states(random, '2015-03-02 14:00', 300),
+            'B': random_book_states(random, '2015-03-02 18:00', 200, null_sides=True),
+            'C': random_book_states(random, '2015-03-02 10:00', 100),
+        }
+        weights = numpy.array([1., -2.5, 0.75])
+
+        mids = list()
+        for name, states in book_states.items():
+            frame = pandas.DataFrame(states)
+            frame['ts'] = pandas.to_datetime(frame['ts'])
+            mid = 0.5 * (frame['bid'] + frame['ask'].astype(float))
+            mids.append(pandas.Series(mid.values, index=frame['ts']).groupby(level=0).last().rename(name))
+
+        prices = pandas.concat(mids, axis=1)
+        expected = prices.groupby(pandas.Grouper(freq='D')).ffill().dot(weights).dropna()
+
+        streams = {name: iter(states) for name, states in book_states.items()}
+        result = list(spread.stream_spread(streams, weights))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(len(expected), len(result))
+        self.assertEqual(list(expected.index), [pandas.Timestamp(timestamp) for timestamp, value in result])
+        numpy.testing.assert_allclose(expected.values, [value for timestamp, value in result])
+
+
+if __name__ == '__main__':
+    unittest.main()
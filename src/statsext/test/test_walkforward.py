@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import math
+import pickle
+
+import numpy
+import pandas
+
+from statsext import cointeg
+from statsext.walkforward import BlockMoments
+
+
+class TestWalkForward(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        current_module = sys.modules[__name__]
+        cls._resources_path = os.sep.join(
+            [os.path.dirname(current_module.__file__), 'resources'])
+
+    def load_resource(self, relative_path):
+        resource_path = os.sep.join([self._resources_path, relative_path])
+        resource_path_norm = os.path.abspath(resource_path)
+        with open(resource_path_norm, mode='rb') as resource_file:
+            resource = pickle.load(resource_file, encoding='latin1')
+            return resource
+
+    def load_prices(self):
+        s1 = self.load_resource('s1.pickle')[:3000]
+        s2 = self.load_resource('s2.pickle')[:3000]
+        s3 = self.load_resource('s3.pickle')[:3000]
+        return pandas.DataFrame({'A': numpy.cumsum(s1) + s2 + 100., 'B': 0.5 * numpy.cumsum(s1) + s3 + 50.,
+                                 'C': numpy.cumsum(s2) + 20.}, columns=['A', 'B', 'C'])
+
+    def test_block_statistics(self):
+        prices = self.load_prices()
+        block_ids = numpy.arange(len(prices)) // 500
+        for lag in (1, 2):
+            moments = BlockMoments(prices.values, block_ids, lag=lag)
+            self.assertEqual(list(range(6)), moments.blocks)
+            expected = cointeg.cointegration_johansen(prices, lag=lag)
+            result = moments.statistics(range(6))
+            numpy.testing.assert_allclose(expected['eigenvalues'], result['eigenvalues'], rtol=1e-8)
+
+            # rows of blocks 2 and 3 use lag + 1 samples of block 1
+            expected = cointeg.cointegration_johansen(prices.iloc[1000 - lag - 1:2000], lag=lag)
+            result = moments.statistics([2, 3])
+            numpy.testing.assert_allclose(expected['eigenvalues'], result['eigenvalues'], rtol=1e-8)
+            numpy.testing.assert_allclose(expected['trace_statistic'], result['trace_statistic'], rtol=1e-8)
+
+    def test_calibrate(self):
+        prices = self.load_prices()
+        moments = BlockMoments(prices.values, numpy.arange(len(prices)) // 500, lag=1)
+        calibration = moments.calibrate([1, 2, 3])
+        window = prices.iloc[498:2000]
+        vector = cointeg.get_johansen(window, lag=1)[0]
+        numpy.testing.assert_allclose(vector, calibration['vector'], rtol=1e-6)
+        # AR(1) rows of blocks 1 to 3 use a single sample of block 0
+        spread = prices.iloc[499:2000].values.dot(vector)
+        slope = numpy.polyfit(spread[:-1], numpy.diff(spread), 1)[0]
+        self.assertAlmostEqual(slope, calibration['ar_slope'])
+        self.assertAlmostEqual(-math.log(2) / slope, calibration['half_life'])
+
+
+if __name__ == '__main__':
+    unittest.main()
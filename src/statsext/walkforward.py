@@ -0,0 +1,126 @@
+"""
+Calibration statistics over sliding windows made of whole blocks of samples (typically calendar months).
+
+The raw sums of the Johansen regression rows and of the AR(1) rows [dx_t, x_t-1] are accumulated once per block, the
+moments of any window being the sum of the moments of its blocks. Adjacent walk-forward windows share most of their
+blocks, which are therefore never recomputed.
+"""
+import math
+
+import numpy
+
+from statsext import cointeg
+
+__author__ = 'Christophe'
+
+
+def _centered(count, row_sum, row_products):
+    return row_products - numpy.outer(row_sum, row_sum) / count
+
+
+class BlockMoments(object):
+    """
+    Per-block sums of regression rows over a single history of level samples.
+
+    A row belongs to the block of its most recent sample, the lagged samples it uses may belong to the previous block.
+    """
+
+    def __init__(self, levels, block_ids, lag=1):
+        """
+
+        :param levels: samples x n array of input vectors
+        :param block_ids: non-decreasing block identifier of each sample
+        :param lag: number of lagged difference terms used when computing the estimator
+        """
+        levels = numpy.asarray(levels, dtype=float)
+        block_ids = numpy.asarray(block_ids)
+        assert levels.shape[0] == block_ids.shape[0], 'one block identifier expected per sample'
+        self._lag = lag
+        self._count_dimensions = levels.shape[1]
+        # levels are shifted by the first sample to limit cancellation in the centered moments
+        shifted = levels - levels[0]
+        rows = cointeg.regression_rows(shifted, lag=lag)
+        ar_rows = numpy.hstack([numpy.diff(shifted, 1, axis=0), shifted[:-1]])
+        self._sums = self._block_sums(rows, block_ids[lag + 1:])
+        self._ar_sums = self._block_sums(ar_rows, block_ids[1:])
+
+    @staticmethod
+    def _block_sums(rows, row_blocks):
+        sums = dict()
+        blocks, starts = numpy.unique(row_blocks, return_index=True)
+        ends = numpy.append(starts[1:], len(row_blocks))
+        for block, start, end in zip(blocks, starts, ends):
+            block_rows = rows[start:end]
+            sums[block] = (end - start, block_rows.sum(axis=0), numpy.dot(block_rows.T, block_rows))
+
+        return sums
+
+    @property
+    def blocks(self):
+        return sorted(self._sums)
+
+    @property
+    def lag(self):
+        return self._lag
+
+    @staticmethod
+    def _window_sums(sums, blocks):
+        count = 0
+        row_sum = 0.
+        row_products = 0.
+        for block in blocks:
+            if block in sums:
+                block_count, block_sum, block_products = sums[block]
+                count += block_count
+                row_sum = row_sum + block_sum
+                row_products = row_products + block_products
+
+        return count, row_sum, row_products
+
+    def statistics(self, blocks, method='pinv'):
+        """
+        Johansen statistics over the rows of the given blocks.
+
+        :param blocks: identifiers of the blocks making the window
+        :param method: 'pinv' or 'qr', see cointeg.cointegration_johansen
+        :return: test statistics data, same keys as cointeg.cointegration_johansen except the residuals
+        """
+        count, row_sum, row_products = self._window_sums(self._sums, blocks)
+        assert count > 0, 'no samples in blocks %s' % blocks
+        s00, sk0, skk = cointeg.residual_moments(_centered(count, row_sum, row_products), self._count_dimensions,
+                                                 float(count))
+        return cointeg._johansen_statistics(s00, sk0, skk, count, method=method)
+
+    def ar_slope(self, blocks, vector):
+        """
+        Slope of the regression (with intercept) of the spread differences on the lagged spread.
+
+        :param blocks: identifiers of the blocks making the window
+        :param vector: weights of the spread
+        :return:
+        """
+        count, row_sum, row_products = self._window_sums(self._ar_sums, blocks)
+        centered = _centered(count, row_sum, row_products)
+        n = self._count_dimensions
+        cross = numpy.dot(vector, numpy.dot(centered[:n, n:], vector))
+        variance = numpy.dot(vector, numpy.dot(centered[n:, n:], vector))
+        return cross / variance
+
+    def calibrate(self, blocks, significance='95%', method='pinv'):
+        """
+
+        :param blocks: identifiers of the blocks making the window
+        :param significance: '90%', '95%' or '99%'
+        :param method: 'pinv' or 'qr', see cointeg.cointegration_johansen
+        :return: dict with the cointegration vectors, the leading vector, its AR(1) slope and half-life (None when
+        no vector passes the test)
+        """
+        vectors = cointeg.select_vectors(self.statistics(blocks, method=method), significance=significance)
+        result = {'vectors': vectors, 'vector': None, 'ar_slope': None, 'half_life': None}
+        if len(vectors) > 0:
+            result['vector'] = vectors[0]
+            result['ar_slope'] = self.ar_slope(blocks, vectors[0])
+            if result['ar_slope'] < 0:
+                result['half_life'] = -math.log(2) / result['ar_slope']
+
+        return result
@@ -1,106 +1,427 @@
+"""
+Live ingestion of quote streams into eventbase generators.
+
+Quotes are read as lines 'timestamp,ticker,bid,ask' (timestamp in epoch nanoseconds, empty price for a missing side)
+from a socket, parsed into columnar batches and fed to the generators of a block graph. Stages are asyncio tasks
+connected by bounded queues: a slow consumer fills its queue, which suspends the upstream stages and eventually the
+socket reads (TCP flow control then slows the sender down).
+
+ReplayServer serves recorded quotes on a local socket, standing in for a live feed.
+"""
+import argparse
+import asyncio
+import itertools
 import logging
-from random import gauss
-from time import sleep
+import time
+from collections import OrderedDict
 
-import rx
-asyncio = rx.config['asyncio']
+import numpy
 
-from rx import Observable, Observer
-from rx.concurrency import AsyncIOScheduler
-from rx.observable import Observable
-from rx.internal import extensionmethod
+import eventbase
+from mktdatadb.merge import merge_streams
 
+__author__ = 'Christophe'
 
-@extensionmethod(Observable)
-def to_async_generator(self, future_ctor=None, sentinel=None):
-    future_ctor = future_ctor or rx.config.get("Future")
-    if not future_ctor:
-        raise Exception('Future type not provided nor in rx.config.Future')
+_READ_SIZE = 1 << 16
 
-    loop = asyncio.get_event_loop()
-    future = [future_ctor()]
-    notifications = []
 
-    def feeder():
-        if not len(notifications) or future[0].done():
-            return
+class StageMetrics(object):
+    """
+    Counters of a pipeline stage. Latencies run from the reception of the data to the end of its processing by the
+    stage.
+    """
 
-        notification = notifications.pop(0)
+    def __init__(self, name):
+        self._name = name
+        self._count = 0
+        self._count_batches = 0
+        self._latency_sum = 0.
+        self._latency_max = 0.
+        self._busy = 0.
+        self._first_time = None
+        self._last_time = None
+        self._max_queue_size = 0
 
-        if notification.kind == "E":
-            future[0].set_exception(notification.exception)
-        elif notification.kind == "C":
-            future[0].set_exception(StopIteration(sentinel))
-        else:
-            future[0].set_result(notification.value)
+    @property
+    def name(self):
+        return self._name
 
-    def on_next(value):
-        """Takes on_next values and appends them to the notification queue"""
+    def record(self, count, arrival_time, start_time, queue_size=0):
+        """
 
-        notifications.append(value)
-        loop.call_soon(feeder)
+        :param count: number of quotes processed
+        :param arrival_time: reception time of the quotes (time.perf_counter)
+        :param start_time: start of the processing by the stage (time.perf_counter)
+        :param queue_size: size of the output queue after processing
+        """
+        now = time.perf_counter()
+        if self._first_time is None:
+            self._first_time = start_time
 
-    self.materialize().subscribe(on_next)
+        self._last_time = now
+        self._count += count
+        self._count_batches += 1
+        latency = now - arrival_time
+        self._latency_sum += latency * count
+        self._latency_max = max(self._latency_max, latency)
+        self._busy += now - start_time
+        self._max_queue_size = max(self._max_queue_size, queue_size)
 
-    @asyncio.coroutine
-    def gen():
-        """Generator producing futures"""
+    def snapshot(self):
+        """
 
-        loop.call_soon(feeder)
-        future[0] = future_ctor()
+        :return: dict with the counts, the throughput (quotes per second of activity), the mean and max latencies
+        (seconds), the time spent in the stage (including waits on a full output queue) and the largest output queue
+        size
+        """
+        elapsed = 0.
+        if self._first_time is not None:
+            elapsed = self._last_time - self._first_time
 
-        return future[0]
-    return gen
+        return {
+            'stage': self._name,
+            'count': self._count,
+            'batches': self._count_batches,
+            'throughput': self._count / elapsed if elapsed > 0. else numpy.nan,
+            'latency_mean': self._latency_sum / self._count if self._count else numpy.nan,
+            'latency_max': self._latency_max,
+            'busy': self._busy,
+            'max_queue_size': self._max_queue_size,
+        }
 
+    def __repr__(self):
+        return '<StageMetrics:%(stage)s count=%(count)d batches=%(batches)d throughput=%(throughput).0f/s ' \
+               'latency_mean=%(latency_mean).6fs latency_max=%(latency_max).6fs>' % self.snapshot()
 
-class LoggingObserver(Observer):
 
-    def __init__(self, name):
-        Observer.__init__(self)
-        self._name = name
+def format_quote(timestamp, ticker, bid, ask):
+    """
+
+    :param timestamp: epoch nanoseconds
+    :param ticker:
+    :param bid: None for a missing side
+    :param ask: None for a missing side
+    :return: quote line, as bytes
+    """
+    bid = '' if bid is None else repr(float(bid))
+    ask = '' if ask is None else repr(float(ask))
+    return ('%d,%s,%s,%s\n' % (timestamp, ticker, bid, ask)).encode('ascii')
+
+
+def quote_lines(book_states_by_ticker):
+    """
+    Quote lines of book states merged in timestamp order, for recording a replay file.
 
-    def on_next(self, x):
-        logging.info('<%s>received: %s', self._name, x)
+    :param book_states_by_ticker: dict ticker -> iterator of book states with an int64 epoch-ns ts field, such as
+    mapped book states
+    :return: generator of quote lines
+    """
+    for timestamp, ticker, book_state in merge_streams(book_states_by_ticker):
+        yield format_quote(timestamp, ticker, book_state['bid'], book_state['ask'])
 
-    def on_error(self, e):
-        logging.info('<%s>error: %s', self._name, e)
 
-    def on_completed(self):
-        logging.info('<%s>sequence completed', self._name)
+def parse_quotes(lines):
+    """
 
+    :param lines: quote lines, as bytes
+    :return: tuple (int64 timestamps, tickers, n x 2 array of bid and ask)
+    """
+    fields = b','.join(line for line in lines if line.strip()).split(b',')
+    if fields == [b'']:
+        return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=object), numpy.empty((0, 2))
 
-@asyncio.coroutine
-def go():
+    assert len(fields) % 4 == 0, 'malformed quote lines'
+    timestamps = numpy.array(fields[0::4]).astype(numpy.int64)
+    tickers = numpy.array(fields[1::4]).astype(str).astype(object)
+    prices = numpy.array([field.strip() or b'nan' for field in fields[2::4] + fields[3::4]]).astype(float)
+    return timestamps, tickers, prices.reshape(2, -1).T
 
-    def uniform():
-        while True:
-            sleep(0.5)
-            yield gauss(0., 1.)
 
-    gen_white_noise = Observable.from_(uniform(), scheduler=AsyncIOScheduler())
+class QuoteFeed(object):
+    """
+    Generators of bid and ask per ticker, fed by batches of parsed quotes.
 
-    def trf_shift(shift):
-        return lambda value: value + shift
+    Each batch is replayed through a sequencer, so that the blocks see the quotes of the different tickers in
+    timestamp order, exactly as during a historical replay of the same graph.
+    """
 
-    def trf_scale(scale):
-        return lambda value: scale * value
+    def __init__(self, tickers, sequencer=None):
+        """
 
-    white_noise_scaled = gen_white_noise.map(trf_scale(5.0)).map(trf_shift(10.0))
-    white_noise_scaled.subscribe(LoggingObserver('white_noise_scaled'))
-    gen_white_noise.subscribe(LoggingObserver('white_noise'))
-    gen = white_noise_scaled.to_async_generator()
+        :param tickers: tickers to feed, quotes of other tickers are dropped
+        :param sequencer: eventbase.StreamSequencer, a new one by default
+        """
+        self._sequencer = sequencer or eventbase.StreamSequencer()
+        self._generators = OrderedDict()
+        for ticker in tickers:
+            generator = eventbase.Generator(self._sequencer, ticker, dimension=2)
+            generator.attach(ticker)
+            self._generators[ticker] = generator
 
-    # Wish we could write something like:
-    # ys = (x for x in yield from gen())
+        self._count_dropped = 0
+
+    @property
+    def generators(self):
+        return self._generators
+
+    @property
+    def sequencer(self):
+        return self._sequencer
+
+    @property
+    def count_dropped(self):
+        return self._count_dropped
+
+    def feed(self, timestamps, tickers, values):
+        """
+
+        :param timestamps: int64 timestamps sorted within each ticker
+        :param tickers: ticker of each quote
+        :param values: n x 2 array of bid and ask
+        """
+        count_fed = 0
+        for ticker, generator in self._generators.items():
+            selected = tickers == ticker
+            if selected.any():
+                count_fed += numpy.count_nonzero(selected)
+                self._sequencer.subscribe_batches([(timestamps[selected], values[selected])], generator.emit_batch)
+
+        self._count_dropped += len(timestamps) - count_fed
+        self._sequencer.start()
+
+
+async def _read_stage(reader, output_queue, batch_size, metrics):
+    remainder = b''
     while True:
-        x = yield from gen()
-        if x is None:
+        data = await reader.read(_READ_SIZE)
+        if not data:
             break
 
+        arrival_time = start_time = time.perf_counter()
+        lines = (remainder + data).split(b'\n')
+        remainder = lines.pop()
+        for start in range(0, len(lines), batch_size):
+            batch = lines[start:start + batch_size]
+            await output_queue.put((arrival_time, batch))
+            metrics.record(len(batch), arrival_time, start_time, queue_size=output_queue.qsize())
+            start_time = time.perf_counter()
+
+    if remainder.strip():
+        arrival_time = time.perf_counter()
+        await output_queue.put((arrival_time, [remainder]))
+        metrics.record(1, arrival_time, arrival_time, queue_size=output_queue.qsize())
+
+    await output_queue.put(None)
+
+
+async def _parse_stage(input_queue, output_queue, metrics):
+    while True:
+        item = await input_queue.get()
+        if item is None:
+            break
+
+        start_time = time.perf_counter()
+        arrival_time, lines = item
+        timestamps, tickers, values = parse_quotes(lines)
+        await output_queue.put((arrival_time, timestamps, tickers, values))
+        metrics.record(len(timestamps), arrival_time, start_time, queue_size=output_queue.qsize())
+
+    await output_queue.put(None)
+
+
+async def _feed_stage(input_queue, feed, metrics):
+    while True:
+        item = await input_queue.get()
+        if item is None:
+            break
+
+        start_time = time.perf_counter()
+        arrival_time, timestamps, tickers, values = item
+        if len(timestamps) > 0:
+            feed.feed(timestamps, tickers, values)
+
+        metrics.record(len(timestamps), arrival_time, start_time)
+        # lets the upstream stages run between large batches
+        await asyncio.sleep(0)
+
+
+async def ingest(reader, feed, batch_size=10000, queue_size=8, metrics=None):
+    """
+    Reads quote lines until the end of the stream and feeds them to the generators.
+
+    :param reader: asyncio.StreamReader, such as returned by asyncio.open_connection
+    :param feed: QuoteFeed
+    :param batch_size: maximum number of quotes per batch
+    :param queue_size: maximum number of batches waiting between two stages
+    :param metrics: dict stage name -> StageMetrics to update, new metrics by default
+    :return: dict stage name -> StageMetrics
+    """
+    if metrics is None:
+        metrics = OrderedDict((name, StageMetrics(name)) for name in ('read', 'parse', 'feed'))
+
+    lines_queue = asyncio.Queue(maxsize=queue_size)
+    batches_queue = asyncio.Queue(maxsize=queue_size)
+    tasks = [
+        asyncio.ensure_future(_read_stage(reader, lines_queue, batch_size, metrics['read'])),
+        asyncio.ensure_future(_parse_stage(lines_queue, batches_queue, metrics['parse'])),
+        asyncio.ensure_future(_feed_stage(batches_queue, feed, metrics['feed'])),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return metrics
+
+
+async def _close_writer(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+
+    except ConnectionError as error:
+        logging.warning('connection closed with error: %s', error)
+
+
+class ReplayServer(object):
+    """
+    Local TCP server sending recorded quote lines to each client, standing in for a live feed.
+    """
+
+    def __init__(self, source, host='127.0.0.1', port=0, rate=None, chunk_size=1000):
+        """
+
+        :param source: path of a file of quote lines, or list of quote lines (bytes)
+        :param host:
+        :param port: 0 for any free port
+        :param rate: maximum number of quotes per second, None for sending as fast as the client reads
+        :param chunk_size: number of quotes per write
+        """
+        self._source = source
+        self._host = host
+        self._port = port
+        self._rate = rate
+        self._chunk_size = chunk_size
+        self._server = None
+
+    @property
+    def host(self):
+        return self._host
+
+    @property
+    def port(self):
+        return self._port
+
+    def _read_chunk(self, lines):
+        return list(itertools.islice(lines, self._chunk_size))
+
+    async def _serve(self, reader, writer):
+        logging.info('replaying quotes to %s', writer.get_extra_info('peername'))
+        loop = asyncio.get_running_loop()
+        from_file = isinstance(self._source, str)
+        lines = None
+        try:
+            if from_file:
+                # file reads run in the default executor, keeping the event loop responsive
+                lines = await loop.run_in_executor(None, open, self._source, 'rb')
+
+            else:
+                lines = iter(self._source)
+
+            while True:
+                if from_file:
+                    chunk = await loop.run_in_executor(None, self._read_chunk, lines)
+
+                else:
+                    chunk = self._read_chunk(lines)
+
+                if not chunk:
+                    break
+
+                writer.write(b''.join(chunk))
+                # waits while the client is not reading
+                await writer.drain()
+                if self._rate is not None:
+                    await asyncio.sleep(len(chunk) / float(self._rate))
+
+        except ConnectionError as error:
+            logging.warning('replay interrupted: %s', error)
+
+        finally:
+            if from_file and lines is not None:
+                lines.close()
+
+            await _close_writer(writer)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+        logging.info('replay server listening on %s:%d', self._host, self._port)
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+async def _log_metrics(metrics, period):
+    while True:
+        await asyncio.sleep(period)
+        for stage_metrics in metrics.values():
+            logging.info('%s', stage_metrics)
+
+
+async def _run(args):
+    feed = QuoteFeed(args.tickers)
+    for generator in feed.generators.values():
+        logger = eventbase.TransferLogger('%s-logger' % generator.name, dimension=2)
+        logger.chain(generator, 'quotes')
+
+    metrics = OrderedDict((name, StageMetrics(name)) for name in ('read', 'parse', 'feed'))
+    reporter = asyncio.ensure_future(_log_metrics(metrics, args.report_period))
+    try:
+        if args.replay_file:
+            async with ReplayServer(args.replay_file, rate=args.rate) as server:
+                reader, writer = await asyncio.open_connection(server.host, server.port)
+                await ingest(reader, feed, batch_size=args.batch_size, queue_size=args.queue_size, metrics=metrics)
+                await _close_writer(writer)
+
+        else:
+            reader, writer = await asyncio.open_connection(args.host, args.port)
+            await ingest(reader, feed, batch_size=args.batch_size, queue_size=args.queue_size, metrics=metrics)
+            await _close_writer(writer)
+
+    finally:
+        reporter.cancel()
+
+    for stage_metrics in metrics.values():
+        logging.info('%s', stage_metrics)
+
+    logging.info('%d quote(s) of other tickers dropped', feed.count_dropped)
+
 
 def main():
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(go())
+    parser = argparse.ArgumentParser(description='Ingests a quote stream into eventbase generators.')
+    parser.add_argument('tickers', nargs='+')
+    parser.add_argument('--replay-file', help='replays a file of quote lines through a local server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--rate', type=float, help='replay rate in quotes per second (default: unthrottled)')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--queue-size', type=int, default=8)
+    parser.add_argument('--report-period', type=float, default=5., help='seconds between metrics reports')
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    logging.basicConfig(format='%(asctime)-15s %(levelname)s %(name)s - %(message)s', level=logging.INFO)
+    main()
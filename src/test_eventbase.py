@@ -0,0 +1,431 @@
+import unittest
+
+import numpy
+import pandas
+
+import eventbase
+from bollinger import get_bands
+
+
+def recorder(dispatched):
+    def record(sequencer_ts, value):
+        dispatched.append((sequencer_ts, value))
+
+    return record
+
+
+class Recorder(eventbase.TransferBlock):
+    """
+    Sink keeping the updates of a signal, row by row, optionally also in a log shared with other recorders.
+    """
+
+    def __init__(self, name, dimension, log=None):
+        super(Recorder, self).__init__(name, count_inputs=1, dimension=dimension)
+        self.timestamps = list()
+        self.values = list()
+        self._log = log
+
+    def _record(self, update_ts, value):
+        self.timestamps.append(update_ts)
+        self.values.append(numpy.array(value, dtype=float))
+        if self._log is not None:
+            self._log.append((self._name, update_ts))
+
+    def on_update(self, update_ts, signal):
+        self._record(update_ts, signal.value)
+
+    def on_batch(self, update_timestamps, signal):
+        for update_ts, value in zip(update_timestamps, signal.values):
+            self._record(update_ts, value)
+
+
+def record(block, dimension, log=None):
+    recorder = Recorder('record %s' % block.name, dimension, log=log)
+    recorder.chain(block, 'input')
+    return recorder
+
+
+def add_block(block, input_block, signal_name):
+    block.attach(signal_name)
+    block.chain(input_block, 'input')
+    return block
+
+
+class Sum(eventbase.TransferBlock):
+    """
+    Sum of two inputs, counting its computations per timestamp.
+    """
+
+    def __init__(self, name, dimension=1):
+        super(Sum, self).__init__(name, count_inputs=2, dimension=dimension)
+        self.counts = dict()
+
+    def on_update(self, update_ts, signal):
+        self.counts[update_ts] = self.counts.get(update_ts, 0) + 1
+        self.emit(update_ts, sum(numpy.array(signal.value) for signal in self._inputs.values()))
+
+
+def scale_block(name, factor, input_block):
+    block = eventbase.TransferBlock(name, count_inputs=1, dimension=1)
+    block.transfer = lambda value: factor * value
+    return add_block(block, input_block, name)
+
+
+def join_block(name, left, right):
+    block = Sum(name)
+    block.attach(name)
+    block.chain(left, 'left')
+    block.chain(right, 'right')
+    return block
+
+
+def stream_generator(sequencer, name, items):
+    stream = [(item_ts, numpy.array([value])) for item_ts, value in items]
+    generator = eventbase.StreamGenerator(sequencer, name, stream)
+    generator.attach(name)
+    return generator
+
+
+def transfer_values(block, values, batch_size=None, timestamps=None, flush=False):
+    """
+    Feeds a block with the rows of values, tick by tick or in batches, through an input signal.
+
+    :param timestamps: timestamps of the rows, defaults to their positions
+    :param flush: when True, flushes the block once fed
+    :return: tuple (timestamps, values) of the emitted updates, one row per update
+    """
+    values = numpy.reshape(numpy.asarray(values, dtype=float), (len(values), -1))
+    source = eventbase.TransferId('source', values.shape[1])
+    source.attach('source')
+    block.attach('output')
+    block.chain(source, 'input')
+    recorder = record(block, block.dimension)
+    if timestamps is None:
+        timestamps = numpy.arange(len(values))
+
+    if batch_size is None:
+        for update_ts, value in zip(timestamps, values):
+            source.output.value = (update_ts, value)
+
+    else:
+        for start in range(0, len(values), batch_size):
+            source.output.values = (timestamps[start:start + batch_size], values[start:start + batch_size])
+
+    if flush:
+        block.flush()
+
+    return numpy.array(recorder.timestamps), numpy.array(recorder.values)
+
+
+# ties across streams and within streams, batch boundaries falling between events of a same timestamp
+_TIMESTAMPS_A = numpy.array([0, 1, 2, 2, 3, 4, 4, 7, 8, 8, 9, 12])
+_TIMESTAMPS_B = numpy.array([2, 2, 5, 6, 7, 7, 8, 10, 11, 12])
+
+
+def replay_network(batch_size=None):
+    """
+    Replays two generators through the same network of blocks, tick by tick or in batches.
+
+    :param batch_size: None for replaying tick by tick
+    :return: tuple (log of generator updates, dict name -> recorder)
+    """
+    random = numpy.random.RandomState(0)
+    values_a = random.standard_normal((len(_TIMESTAMPS_A), 1))
+    values_b = random.standard_normal((len(_TIMESTAMPS_B), 1))
+    sequencer = eventbase.StreamSequencer()
+    generators = list()
+    for name, timestamps, values in (('A', _TIMESTAMPS_A, values_a), ('B', _TIMESTAMPS_B, values_b)):
+        if batch_size is None:
+            generator = eventbase.StreamGenerator(sequencer, name, zip(timestamps, values))
+
+        else:
+            batches = [(timestamps[start:start + batch_size], values[start:start + batch_size])
+                       for start in range(0, len(timestamps), batch_size)]
+            generator = eventbase.BatchGenerator(sequencer, name, iter(batches))
+
+        generator.attach('signal ' + name)
+        generators.append(generator)
+
+    generator_a, generator_b = generators
+    blocks = [
+        add_block(eventbase.TransferDelayed('delayed', 1, delay=2), generator_a, 'delayed A'),
+        add_block(eventbase.TransferRollingMean('mean', 1, window=3), generator_a, 'mean A'),
+        add_block(eventbase.TransferRollingVariance('variance', 1, window=3), generator_b, 'variance B'),
+        add_block(eventbase.TransferBollinger('bands', 0.5, halflife=3), generator_b, 'bands B'),
+    ]
+    blocks.append(add_block(eventbase.TransferEWMA('ewma', 1, halflife=2.), blocks[0], 'ewma delayed A'))
+    log = list()
+    recorders = {generator.name: record(generator, 1, log=log) for generator in generators}
+    recorders.update({block.name: record(block, block.dimension) for block in blocks})
+    sequencer.start()
+    return log, recorders
+
+
+class TestStreamSequencer(unittest.TestCase):
+    def test_tie_order(self):
+        dispatched = list()
+        sequencer = eventbase.StreamSequencer()
+        sequencer.subscribe([(1, 'a1'), (2, 'a2'), (2, 'a3'), (3, 'a4')], recorder(dispatched))
+        sequencer.subscribe([(2, 'b1'), (2, 'b2')], recorder(dispatched))
+        sequencer.subscribe([(1, 'c1'), (2, 'c2')], recorder(dispatched))
+        sequencer.start()
+        self.assertEqual([(1, 'a1'), (1, 'c1'), (2, 'a2'), (2, 'a3'), (2, 'b1'), (2, 'b2'), (2, 'c2'), (3, 'a4')],
+                         dispatched)
+
+    def test_lazy_pulling(self):
+        events = list()
+
+        def stream(name, timestamps):
+            for sequencer_ts in timestamps:
+                events.append(('pulled', name, sequencer_ts))
+                yield sequencer_ts, name
+
+        sequencer = eventbase.StreamSequencer()
+        sequencer.subscribe(stream('A', [1, 3]), lambda sequencer_ts, value: events.append(('dispatched', value,
+                                                                                              sequencer_ts)))
+        sequencer.subscribe(stream('B', [2]), lambda sequencer_ts, value: events.append(('dispatched', value,
+                                                                                          sequencer_ts)))
+        self.assertEqual([('pulled', 'A', 1), ('pulled', 'B', 2)], events)
+        sequencer.start()
+        self.assertEqual([('pulled', 'A', 1), ('pulled', 'B', 2),
+                          ('dispatched', 'A', 1), ('pulled', 'A', 3),
+                          ('dispatched', 'B', 2),
+                          ('dispatched', 'A', 3)], events)
+
+    def test_expect_interleaved(self):
+        dispatched = list()
+        sequencer = eventbase.StreamSequencer()
+        sequencer.subscribe([(1, 'a1'), (2, 'a2'), (3, 'a3')], recorder(dispatched))
+        sequencer.expect(2, lambda sequencer_ts: dispatched.append((sequencer_ts, 'expected')))
+        sequencer.subscribe([(2, 'b1'), (4, 'b2')], recorder(dispatched))
+        sequencer.expect(0, lambda sequencer_ts: dispatched.append((sequencer_ts, 'first')))
+        sequencer.start()
+        self.assertEqual([(0, 'first'), (1, 'a1'), (2, 'a2'), (2, 'expected'), (2, 'b1'), (3, 'a3'), (4, 'b2')],
+                         dispatched)
+
+    def test_empty_streams(self):
+        sequencer = eventbase.StreamSequencer()
+        sequencer.start()
+
+        dispatched = list()
+        sequencer.subscribe(iter([]), recorder(dispatched))
+        sequencer.subscribe_batches(iter([]), lambda timestamps, values: dispatched.append(tuple(timestamps)))
+        sequencer.subscribe_batches(iter([([], []), ([1, 2], ['b1', 'b2']), ([], [])]),
+                                    lambda timestamps, values: dispatched.append(tuple(values)))
+        sequencer.subscribe([(2, 'a1')], recorder(dispatched))
+        sequencer.start()
+        self.assertEqual([('b1', 'b2'), (2, 'a1')], dispatched)
+
+    def test_batch_parity(self):
+        expected_log, expected = replay_network()
+        self.assertEqual(len(_TIMESTAMPS_A) + len(_TIMESTAMPS_B), len(expected_log))
+        for batch_size in (1, 2, 3, 4, 100):
+            log, recorders = replay_network(batch_size)
+            self.assertEqual(expected_log, log)
+            for name, recorder in expected.items():
+                self.assertEqual(recorder.timestamps, recorders[name].timestamps)
+                numpy.testing.assert_allclose(numpy.array(recorder.values), numpy.array(recorders[name].values),
+                                              rtol=1e-12, err_msg=name)
+
+
+class TestExecutionPlan(unittest.TestCase):
+    def diamond(self, sequencer):
+        generator = stream_generator(sequencer, 'generator', [(1, 1.), (2, 2.), (3, 3.)])
+        left = scale_block('left', 2., generator)
+        right = scale_block('right', 10., generator)
+        join = join_block('join', left, right)
+        recorder = record(join, 1)
+        return generator, join, recorder
+
+    def test_order(self):
+        sequencer = eventbase.StreamSequencer()
+        generator, join, recorder = self.diamond(sequencer)
+        plan = eventbase.ExecutionPlan([generator])
+        order = [block.name for block in plan.order]
+        self.assertEqual(5, len(order))
+        self.assertEqual('generator', order[0])
+        self.assertEqual({'left', 'right'}, set(order[1:3]))
+        self.assertEqual(['join', 'record join'], order[3:])
+
+    def test_cycle(self):
+        sequencer = eventbase.StreamSequencer()
+        generator = stream_generator(sequencer, 'generator', [(1, 1.)])
+        join = Sum('join')
+        join.attach('join')
+        join.chain(generator, 'left')
+        delayed = add_block(eventbase.TransferDelayed('delayed', 1), join, 'delayed')
+        join.chain(delayed, 'right')
+        self.assertRaises(AssertionError, eventbase.ExecutionPlan, [generator])
+
+    def test_diamond(self):
+        sequencer = eventbase.StreamSequencer()
+        generator, join, recorder = self.diamond(sequencer)
+        eventbase.ExecutionPlan([generator])
+        sequencer.start()
+        self.assertEqual({1: 1, 2: 1, 3: 1}, join.counts)
+        self.assertEqual([1, 2, 3], recorder.timestamps)
+        numpy.testing.assert_array_equal([[12.], [24.], [36.]], recorder.values)
+
+    def test_fused_chain(self):
+        sequencer = eventbase.StreamSequencer()
+        generator = stream_generator(sequencer, 'generator', [(1, 1.), (2, 2.)])
+        passthrough = add_block(eventbase.TransferId('passthrough', 1), generator, 'passthrough')
+        scaled = scale_block('scaled', 3., passthrough)
+        shifted = add_block(eventbase.TransferBlock('shifted', count_inputs=1, dimension=1), scaled, 'shifted')
+        shifted.transfer = lambda value: value + 1.
+        recorder = record(shifted, 1)
+        plan = eventbase.ExecutionPlan([generator])
+        # one fused step for the chain, one for the recorder
+        self.assertEqual(2, len(plan._compile((0,), batch=False)))
+        sequencer.start()
+        numpy.testing.assert_array_equal([[4.], [7.]], recorder.values)
+        numpy.testing.assert_array_equal([2.], passthrough.output.value)
+        numpy.testing.assert_array_equal([6.], scaled.output.value)
+        self.assertEqual(2, scaled.output._timestamp)
+
+    def test_same_timestamp(self):
+        sequencer = eventbase.StreamSequencer()
+        generator_a = stream_generator(sequencer, 'A', [(1, 1.), (2, 2.), (3, 3.), (5, 5.)])
+        generator_b = stream_generator(sequencer, 'B', [(1, 10.), (2, 20.), (4, 40.), (5, 50.)])
+        join = join_block('join', generator_a, generator_b)
+        recorder = record(join, 1)
+        eventbase.ExecutionPlan([generator_a, generator_b])
+        sequencer.start()
+        self.assertEqual({1: 1, 2: 1, 3: 1, 4: 1, 5: 1}, join.counts)
+        numpy.testing.assert_array_equal([[11.], [22.], [23.], [43.], [55.]], recorder.values)
+
+    def test_sampler_consumers(self):
+        sequencer = eventbase.StreamSequencer()
+        generator = stream_generator(sequencer, 'generator', [(0, 1.), (3, 2.), (5, 3.), (12, 4.)])
+        sampler = add_block(eventbase.TransferSampler('sampler', 1, interval=5), generator, 'sampler')
+        scaled = scale_block('scaled', 100., generator)
+        join = join_block('join', sampler, scaled)
+        recorder = record(join, 1)
+        eventbase.ExecutionPlan([generator])
+        sequencer.start()
+        sampler.flush()
+        self.assertEqual([0, 3, 5, 5, 12, 10, 15], recorder.timestamps)
+        # each sampled value is joined with the scaled value of the update closing its interval, not the previous one
+        numpy.testing.assert_array_equal([[302.], [403.], [404.]], [recorder.values[index] for index in (3, 5, 6)])
+
+
+class TestMissingValues(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(3)
+        self.values = random.standard_normal((60, 2))
+        self.values[[2, 3, 4, 20, 45], 0] = numpy.nan
+        self.values[[10, 30], 1] = numpy.inf
+        self.values[[31, 59], 1] = numpy.nan
+
+    def expected(self):
+        # non-finite values are treated as missing
+        return pandas.DataFrame(numpy.where(numpy.isfinite(self.values), self.values, numpy.nan))
+
+    def test_rolling(self):
+        _, means = transfer_values(eventbase.TransferRollingMean('mean', 1, window=2), [1, 2, numpy.nan, 3, 4, 5, 6, 7])
+        numpy.testing.assert_allclose([[numpy.nan], [1.5], [numpy.nan], [numpy.nan], [3.5], [4.5], [5.5], [6.5]],
+                                      means)
+        for window, min_periods in ((5, None), (5, 2), (4, 1)):
+            expected = self.expected().rolling(window, min_periods=min_periods)
+            for batch_size in (None, 3, 7, len(self.values)):
+                _, means = transfer_values(eventbase.TransferRollingMean('mean', 2, window, min_periods=min_periods),
+                                           self.values, batch_size=batch_size)
+                numpy.testing.assert_allclose(expected.mean().values, means, rtol=1e-10)
+                _, variances = transfer_values(eventbase.TransferRollingVariance('variance', 2, window,
+                                                                                 min_periods=min_periods),
+                                               self.values, batch_size=batch_size)
+                numpy.testing.assert_allclose(expected.var().values, variances, rtol=1e-10, atol=1e-14)
+
+    def test_rolling_segments(self):
+        # batches spanning several segments of cumulative sums, values far from zero
+        random = numpy.random.RandomState(6)
+        values = 1e4 + numpy.cumsum(random.standard_normal((2 * eventbase._ROLLING_SEGMENT + 100, 2)), axis=0)
+        values[random.randint(0, len(values), size=50), random.randint(0, 2, size=50)] = numpy.nan
+        expected = pandas.DataFrame(values).rolling(30, min_periods=2)
+        for batch_size in (None, 700, len(values)):
+            _, means = transfer_values(eventbase.TransferRollingMean('mean', 2, 30, min_periods=2), values,
+                                       batch_size=batch_size)
+            numpy.testing.assert_allclose(expected.mean().values, means, rtol=1e-10)
+            _, variances = transfer_values(eventbase.TransferRollingVariance('variance', 2, 30, min_periods=2), values,
+                                           batch_size=batch_size)
+            numpy.testing.assert_allclose(expected.var().values, variances, rtol=1e-7)
+
+    def test_ewma(self):
+        for adjust in (True, False):
+            for ignore_na in (False, True):
+                expected = self.expected().ewm(alpha=0.3, adjust=adjust, ignore_na=ignore_na).mean()
+                for batch_size in (None, 1, 3, 7, len(self.values)):
+                    _, averages = transfer_values(eventbase.TransferEWMA('ewma', 2, alpha=0.3, adjust=adjust,
+                                                                         ignore_na=ignore_na), self.values,
+                                                  batch_size=batch_size)
+                    numpy.testing.assert_allclose(expected.values, averages, rtol=1e-12,
+                                                  err_msg=str((adjust, ignore_na, batch_size)))
+
+
+class TestBlocks(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(4)
+        self.values = numpy.cumsum(random.standard_normal((200, 2)), axis=0)
+        self.signal = self.values[:, :1]
+
+    def assert_transfers(self, make_block, values, expected, expected_timestamps=None, timestamps=None, flush=False):
+        # same updates tick by tick and in batches of various sizes
+        if expected_timestamps is None:
+            expected_timestamps = numpy.arange(len(values))
+
+        for batch_size in (None, 1, 4, 17, len(values)):
+            emitted_timestamps, emitted = transfer_values(make_block(), values, batch_size=batch_size,
+                                                          timestamps=timestamps, flush=flush)
+            numpy.testing.assert_array_equal(expected_timestamps, emitted_timestamps)
+            numpy.testing.assert_allclose(expected, emitted, rtol=1e-10, atol=1e-12, err_msg=str(batch_size))
+
+    def test_delayed(self):
+        expected = pandas.DataFrame(self.values).shift(3).fillna(-1.).values
+        self.assert_transfers(lambda: eventbase.TransferDelayed('delayed', 2, delay=3, initial=-1.), self.values,
+                              expected)
+
+    def test_sampler(self):
+        random = numpy.random.RandomState(5)
+        timestamps = 7 + numpy.cumsum(random.randint(0, 4, size=len(self.values)))
+        slots = (timestamps - timestamps[0]) // 5
+        last = pandas.DataFrame(self.values).groupby(slots).last()
+        expected_timestamps = timestamps[0] + 5 * (last.index.values + 1)
+        self.assert_transfers(lambda: eventbase.TransferSampler('sampler', 2, interval=5), self.values,
+                              last.values[:-1], expected_timestamps=expected_timestamps[:-1], timestamps=timestamps)
+        self.assert_transfers(lambda: eventbase.TransferSampler('sampler', 2, interval=5), self.values, last.values,
+                              expected_timestamps=expected_timestamps, timestamps=timestamps, flush=True)
+
+        # intervals aligned on a given origin
+        slots = timestamps // 10
+        last = pandas.DataFrame(self.values).groupby(slots).last()
+        self.assert_transfers(lambda: eventbase.TransferSampler('sampler', 2, interval=10, origin=0), self.values,
+                              last.values, expected_timestamps=10 * (last.index.values + 1), timestamps=timestamps,
+                              flush=True)
+
+    def test_rolling(self):
+        frame = pandas.DataFrame(self.values)
+        self.assert_transfers(lambda: eventbase.TransferRollingMean('mean', 2, window=10), self.values,
+                              frame.rolling(10).mean().values)
+        self.assert_transfers(lambda: eventbase.TransferRollingVariance('variance', 2, window=10), self.values,
+                              frame.rolling(10).var().values)
+
+    def test_ewma(self):
+        frame = pandas.DataFrame(self.values)
+        for adjust in (True, False):
+            self.assert_transfers(lambda: eventbase.TransferEWMA('ewma', 2, halflife=5., adjust=adjust), self.values,
+                                  frame.ewm(halflife=5., adjust=adjust).mean().values)
+            self.assert_transfers(lambda: eventbase.TransferEWMA('ewma', 2, alpha=0.1, adjust=adjust), self.values,
+                                  frame.ewm(alpha=0.1, adjust=adjust).mean().values)
+
+    def test_bollinger(self):
+        signal = self.signal[:, 0]
+        mu = pandas.Series(signal).ewm(halflife=20.).mean().values
+        expected = numpy.column_stack(get_bands(signal, mu, 0.5, limit=3, current_scaling=1.))
+        self.assert_transfers(lambda: eventbase.TransferBollinger('bands', 0.5, halflife=20., limit=3,
+                                                                  current_scaling=1.), self.signal, expected)
+        expected = numpy.column_stack(get_bands(signal, 2., 0.8))
+        self.assert_transfers(lambda: eventbase.TransferBollinger('bands', 0.8, reference=2.), self.signal, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+import pandas
+
+import spreadstrategy
+import spreadsweep
+from mktdatadb.merge import align_quotes
+from pnl import AverageCostProfitAndLoss
+
+WINDOWS = [('2015-04-01', '2015-05-01', '2015-06-01'), ('2015-04-15', '2015-05-15', '2015-06-15')]
+
+
+def cointegrated_quotes(seed):
+    # quotes every 10 minutes of the trading day, second mid price tied to the first one by a mean reverting spread
+    random = numpy.random.RandomState(seed)
+    days = pandas.bdate_range('2015-04-01', '2015-06-30')
+    index = pandas.DatetimeIndex([day + pandas.Timedelta(minutes=570 + 10 * count) for day in days
+                                  for count in range(39)])
+    mid1 = 50. + numpy.cumsum(random.standard_normal(len(index)) * 0.05)
+    spread = numpy.zeros(len(index))
+    for count in range(1, len(index)):
+        spread[count] = 0.9 * spread[count - 1] + random.standard_normal() * 0.05
+
+    mid2 = 10. + 0.5 * mid1 + spread
+    return dict((security, pandas.DataFrame({'bid': mid - 0.01, 'ask': mid + 0.01}, index=index))
+                for security, mid in (('AAA', mid1), ('BBB', mid2)))
+
+
+def save_quotes(quotes, data_path):
+    for security, quote in quotes.items():
+        quote.to_pickle(os.sep.join([data_path, '%s.pkl' % security]))
+
+
+def expected_pnl(quotes, window, step_size, ewma_period, trade_scale):
+    # trades replayed fill by fill, the realized P&L of closed round trips being kept across positions
+    prices_mid = dict((security, 0.5 * (quote['bid'] + quote['ask'])) for security, quote in quotes.items())
+    cointegration = spreadstrategy.backtest(prices_mid, *window)
+    _, shares = spreadstrategy.target_positions(cointegration, list(quotes.keys()), step_size, ewma_period,
+                                                trade_scale)
+    bids, asks, shares = align_quotes(quotes, shares)
+    total_pnl = 0.
+    for security in shares.columns:
+        pos = AverageCostProfitAndLoss()
+        closed_pnl = 0.
+        trades = shares[security].diff().fillna(shares[security].iloc[0]).values
+        for fill_qty, bid, ask, target in zip(trades, bids[security].values, asks[security].values,
+                                              shares[security].values):
+            if fill_qty == 0:
+                continue
+
+            fill_price = bid if target < 0 else ask
+            if pos.quantity == 0:
+                closed_pnl += pos.get_total_pnl(fill_price)
+                pos = AverageCostProfitAndLoss()
+
+            pos.add_fill(fill_qty, fill_price, fees={'cfd': max(0.005 * abs(fill_qty), 1.)})
+
+        mark_price = bids[security].values[-1] if shares[security].values[-1] < 0 else asks[security].values[-1]
+        total_pnl += closed_pnl + pos.get_total_pnl(mark_price)
+
+    return total_pnl
+
+
+class TestSweep(unittest.TestCase):
+    def test_sweep(self):
+        quotes = cointegrated_quotes(7)
+        with tempfile.TemporaryDirectory() as data_path:
+            save_quotes(quotes, data_path)
+            cache_path = os.sep.join([data_path, 'cache'])
+            results = spreadsweep.sweep(['AAA', 'BBB'], WINDOWS, [1., 2.], [10.], [10.], processes=2,
+                                        data_path=data_path, cache_path=cache_path)
+            self.assertEqual(4, len(results))
+            self.assertEqual(2, len(os.listdir(cache_path)))
+            for _, result in results.iterrows():
+                window = (result['calibration_start'], result['calibration_end'], result['backtest_end'])
+                self.assertGreater(result['count_trades'], 0)
+                self.assertGreaterEqual(result['max_drawdown'], 0.)
+                self.assertAlmostEqual(expected_pnl(quotes, window, result['step_size'], 10., 10.), result['pnl'])
+
+            # cached calibrations reused with the same prices only
+            cached = spreadsweep.sweep(['AAA', 'BBB'], WINDOWS, [1., 2.], [10.], [10.], processes=2,
+                                       data_path=data_path, cache_path=cache_path)
+            pandas.testing.assert_frame_equal(results, cached)
+            self.assertEqual(2, len(os.listdir(cache_path)))
+            save_quotes(cointegrated_quotes(8), data_path)
+            spreadsweep.sweep(['AAA', 'BBB'], WINDOWS, [1.], [10.], [10.], processes=2, data_path=data_path,
+                              cache_path=cache_path)
+            self.assertEqual(4, len(os.listdir(cache_path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
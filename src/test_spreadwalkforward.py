@@ -0,0 +1,73 @@
+import math
+import unittest
+
+import numpy
+import pandas
+
+import spreadwalkforward
+from spreadstrategy import CoIntegration
+from statsext import cointeg
+
+
+def cointegrated_prices(seed):
+    # mid prices every 10 minutes of the trading day, some missing, two of them tied by a mean reverting spread
+    random = numpy.random.RandomState(seed)
+    days = pandas.bdate_range('2015-01-01', '2015-06-30')
+    index = pandas.DatetimeIndex([day + pandas.Timedelta(minutes=570 + 10 * count) for day in days
+                                  for count in range(39)])
+    common = numpy.cumsum(random.standard_normal(len(index)) * 0.05)
+    spread = numpy.zeros(len(index))
+    for count in range(1, len(index)):
+        spread[count] = 0.9 * spread[count - 1] + random.standard_normal() * 0.05
+
+    prices = pandas.DataFrame({'A': 50. + common, 'B': 35. + 0.5 * common + spread,
+                               'C': 20. + numpy.cumsum(random.standard_normal(len(index)) * 0.05)},
+                              index=index, columns=['A', 'B', 'C'])
+    prices.iloc[random.randint(0, len(index), size=100), random.randint(0, 3, size=100)] = numpy.nan
+    return prices
+
+
+class TestWalkForward(unittest.TestCase):
+    def test_schedule_folds(self):
+        boundaries = pandas.date_range('2015-01-01', '2015-07-01', freq='MS')
+        folds = spreadwalkforward.schedule_folds(boundaries, 3, 2)
+        self.assertEqual([[0, 1, 2], [2, 3, 4]], [fold[0] for fold in folds])
+        self.assertEqual([boundaries[3], boundaries[5]], [fold[2] for fold in folds])
+        self.assertEqual([boundaries[5], boundaries[6]], [fold[3] for fold in folds])
+
+    def test_walk_forward(self):
+        prices = cointegrated_prices(11)
+        result = spreadwalkforward.walk_forward(prices, '2015-01-01', '2015-07-01', calibration_periods=2,
+                                                backtest_periods=1, processes=1)
+        folds = result['folds']
+        self.assertEqual(4, len(folds))
+        calibration_set = prices.groupby(pandas.Grouper(freq='D')).ffill().dropna(axis=0)
+        signals = list()
+        for fold in folds.itertuples():
+            # direct fit on the calibration window, plus the lag + 1 rows before it used by the differences
+            rows = numpy.flatnonzero((calibration_set.index >= fold.calibration_start) &
+                                     (calibration_set.index < fold.calibration_end))
+            window = calibration_set.iloc[max(rows[0] - 2, 0):rows[-1] + 1]
+            vectors = cointeg.get_johansen(window, lag=1)
+            self.assertGreater(len(vectors), 0)
+            numpy.testing.assert_allclose(vectors[0], fold.vector, rtol=1e-6)
+            spread = calibration_set.iloc[max(rows[0] - 1, 0):rows[-1] + 1].values.dot(vectors[0])
+            slope = numpy.polyfit(spread[:-1], numpy.diff(spread), 1)[0]
+            self.assertEqual(-int(math.log(2) / slope), fold.half_life)
+            signals.append(CoIntegration(prices, fold.calibration_start, fold.calibration_end, fold.backtest_end,
+                                         vector=fold.vector, half_life=fold.half_life).signal)
+
+        pandas.testing.assert_series_equal(pandas.concat(signals), result['signal'])
+        self.assertTrue((result['signal'].index >= folds['calibration_end'].iloc[0]).all())
+        last_fold = result['signal'].index >= folds['calibration_end'].iloc[-1]
+        numpy.testing.assert_array_equal(numpy.tile(folds['vector'].iloc[-1], (last_fold.sum(), 1)),
+                                         result['vectors'][last_fold].values)
+        self.assertTrue((result['half_life'][last_fold] == folds['half_life'].iloc[-1]).all())
+
+        in_pool = spreadwalkforward.walk_forward(prices, '2015-01-01', '2015-07-01', calibration_periods=2,
+                                                 backtest_periods=1, processes=2)
+        pandas.testing.assert_series_equal(result['signal'], in_pool['signal'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+import numpy
+
+import eventbase
+import streamprocessor
+
+
+class Collector(eventbase.TransferBlock):
+    """
+    Sink keeping the quotes fed to a generator.
+    """
+
+    def __init__(self, name):
+        super(Collector, self).__init__(name, count_inputs=1, dimension=2)
+        self.timestamps = list()
+        self.values = list()
+
+    def on_batch(self, update_timestamps, signal):
+        self.timestamps.extend(update_timestamps)
+        self.values.extend(numpy.array(signal.values))
+
+
+def collected_feed(tickers, feed_class=streamprocessor.QuoteFeed):
+    feed = feed_class(tickers)
+    collectors = dict()
+    for ticker, generator in feed.generators.items():
+        collectors[ticker] = Collector('%s-collector' % ticker)
+        collectors[ticker].chain(generator, 'quotes')
+
+    return feed, collectors
+
+
+def quotes(count):
+    lines = list()
+    for index in range(count):
+        ticker = ('A', 'B', 'C')[index % 3]
+        bid = None if index % 7 == 0 else 100. + index
+        lines.append(streamprocessor.format_quote(1000 + index, ticker, bid, 100.5 + index))
+
+    return lines
+
+
+class SlowQuoteFeed(streamprocessor.QuoteFeed):
+    """
+    Feed taking some time per batch and tracking how far the read stage gets ahead of it.
+    """
+
+    def __init__(self, tickers):
+        super(SlowQuoteFeed, self).__init__(tickers)
+        self.metrics = None
+        self.count_fed = 0
+        self.max_ahead = 0
+
+    def feed(self, timestamps, tickers, values):
+        self.max_ahead = max(self.max_ahead, self.metrics['read'].snapshot()['count'] - self.count_fed)
+        time.sleep(0.001)
+        super(SlowQuoteFeed, self).feed(timestamps, tickers, values)
+        self.count_fed += len(timestamps)
+
+
+def stream_reader(*chunks):
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+
+    reader.feed_eof()
+    return reader
+
+
+class TestStreamProcessor(unittest.TestCase):
+    def assert_fed(self, lines, collectors):
+        timestamps, tickers, values = streamprocessor.parse_quotes(lines)
+        for ticker, collector in collectors.items():
+            selected = tickers == ticker
+            numpy.testing.assert_array_equal(timestamps[selected], collector.timestamps)
+            numpy.testing.assert_array_equal(values[selected], numpy.reshape(collector.values, (-1, 2)))
+
+    def test_parse_quotes(self):
+        timestamps, tickers, values = streamprocessor.parse_quotes([b'1,A,1.5,\n', b'\n', b'2,B,,2.5'])
+        numpy.testing.assert_array_equal([1, 2], timestamps)
+        self.assertEqual(['A', 'B'], list(tickers))
+        numpy.testing.assert_array_equal([[1.5, numpy.nan], [numpy.nan, 2.5]], values)
+
+    def test_partial_lines(self):
+        feed, collectors = collected_feed(['A', 'B'])
+
+        async def run():
+            # lines split across reads, last line without end of line
+            reader = stream_reader(b'1,A,1.0,', b'1.5\n2,B,,2', b'.5\n3,C,1', b'.0,2.0\n4,A,1.25,1.75')
+            return await streamprocessor.ingest(reader, feed, batch_size=2)
+
+        metrics = asyncio.run(run())
+        self.assertEqual([1, 4], collectors['A'].timestamps)
+        numpy.testing.assert_array_equal([[1.0, 1.5], [1.25, 1.75]], collectors['A'].values)
+        self.assertEqual([2], collectors['B'].timestamps)
+        numpy.testing.assert_array_equal([[numpy.nan, 2.5]], collectors['B'].values)
+        self.assertEqual(1, feed.count_dropped)
+        self.assertEqual(4, metrics['parse'].snapshot()['count'])
+
+    def test_replay(self):
+        lines = quotes(3000)
+        feed, collectors = collected_feed(['A', 'B'])
+
+        async def run():
+            async with streamprocessor.ReplayServer(lines, chunk_size=70) as server:
+                reader, writer = await asyncio.open_connection(server.host, server.port)
+                metrics = await streamprocessor.ingest(reader, feed, batch_size=100)
+                await streamprocessor._close_writer(writer)
+                return metrics
+
+        metrics = asyncio.run(run())
+        self.assert_fed(lines, collectors)
+        self.assertTrue(numpy.isnan(collectors['A'].values[0][0]))
+        self.assertEqual(1000, feed.count_dropped)
+        self.assertEqual(3000, metrics['feed'].snapshot()['count'])
+
+    def test_replay_file(self):
+        lines = quotes(500)
+        feed, collectors = collected_feed(['A', 'B', 'C'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.sep.join([directory, 'quotes.csv'])
+            with open(path, mode='wb') as quotes_file:
+                quotes_file.writelines(lines)
+
+            async def run():
+                async with streamprocessor.ReplayServer(path, chunk_size=64) as server:
+                    reader, writer = await asyncio.open_connection(server.host, server.port)
+                    await streamprocessor.ingest(reader, feed, batch_size=50)
+                    await streamprocessor._close_writer(writer)
+
+            asyncio.run(run())
+
+        self.assert_fed(lines, collectors)
+        self.assertEqual(0, feed.count_dropped)
+
+    def test_backpressure(self):
+        lines = quotes(20000)
+        batch_size = 100
+        max_ahead = dict()
+        for queue_size in (1, 50):
+            feed, collectors = collected_feed(['A', 'B', 'C'], feed_class=SlowQuoteFeed)
+
+            async def run():
+                metrics = dict((name, streamprocessor.StageMetrics(name)) for name in ('read', 'parse', 'feed'))
+                feed.metrics = metrics
+                async with streamprocessor.ReplayServer(lines, chunk_size=500) as server:
+                    reader, writer = await asyncio.open_connection(server.host, server.port)
+                    await streamprocessor.ingest(reader, feed, batch_size=batch_size, queue_size=queue_size,
+                                                 metrics=metrics)
+                    await streamprocessor._close_writer(writer)
+
+                return metrics
+
+            metrics = asyncio.run(run())
+            self.assert_fed(lines, collectors)
+            self.assertLessEqual(metrics['read'].snapshot()['max_queue_size'], queue_size)
+            self.assertLessEqual(metrics['parse'].snapshot()['max_queue_size'], queue_size)
+            max_ahead[queue_size] = feed.max_ahead
+
+        # one batch in each queue, one being parsed and one being fed at most
+        self.assertLessEqual(max_ahead[1], 4 * batch_size)
+        self.assertGreater(max_ahead[50], 4 * batch_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
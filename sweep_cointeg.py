@@ -0,0 +1,40 @@
+import argparse
+import logging
+
+from spreadsweep import sweep
+
+__author__ = 'Christophe'
+
+
+def _parse_window(text):
+    window = tuple(text.split(':'))
+    if len(window) != 3:
+        raise argparse.ArgumentTypeError('expected CALIBRATION_START:CALIBRATION_END:BACKTEST_END, got %s' % text)
+
+    return window
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtests the cointegration strategy over a grid of parameters.')
+    parser.add_argument('securities', nargs='+')
+    parser.add_argument('--windows', nargs='+', type=_parse_window,
+                        default=[('2015-04-01', '2015-05-01', '2015-06-01')],
+                        help='windows as CALIBRATION_START:CALIBRATION_END:BACKTEST_END (YYYY-MM-DD)')
+    parser.add_argument('--step-sizes', nargs='+', type=float, default=[1.])
+    parser.add_argument('--ewma-periods', nargs='+', type=float, default=[10.])
+    parser.add_argument('--trade-scales', nargs='+', type=float, default=[10.])
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--data-path', default='data')
+    parser.add_argument('--cache-path', help='directory for caching calibrations across runs')
+    parser.add_argument('--output', default='sweep.csv')
+    args = parser.parse_args()
+
+    results = sweep(args.securities, args.windows, args.step_sizes, args.ewma_periods, args.trade_scales,
+                    processes=args.processes, data_path=args.data_path, cache_path=args.cache_path)
+    results.to_csv(args.output, index=False)
+    logging.info('results written to %s:\n%s', args.output, results)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)-15s %(levelname)s %(name)s - %(message)s', level=logging.INFO)
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import logging
+
+import pandas
+
+from spreadstrategy import load_quotes
+from spreadwalkforward import walk_forward
+
+__author__ = 'Christophe'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Walk-forward calibration of the cointegrated spread.')
+    parser.add_argument('securities', nargs='+')
+    parser.add_argument('--start-date', required=True, help='start of the first calibration window (YYYY-MM-DD)')
+    parser.add_argument('--end-date', required=True, help='end of the history (YYYY-MM-DD)')
+    parser.add_argument('--calibration-periods', type=int, default=3)
+    parser.add_argument('--backtest-periods', type=int, default=1)
+    parser.add_argument('--freq', default='MS', help='pandas frequency of the calibration blocks')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--data-path', default='data')
+    parser.add_argument('--output', default='walkforward.pkl')
+    args = parser.parse_args()
+
+    prices_bid_ask_securities, prices_mid_securities = load_quotes(args.securities, data_path=args.data_path)
+    prices = pandas.concat([prices_mid_securities[security] for security in args.securities], axis=1)
+    prices.columns = args.securities
+    result = walk_forward(prices, args.start_date, args.end_date, calibration_periods=args.calibration_periods,
+                          backtest_periods=args.backtest_periods, freq=args.freq, processes=args.processes)
+    logging.info('folds:\n%s', result['folds'])
+    stitched = pandas.concat([result['signal'].rename('signal'), result['half_life'].rename('half_life'),
+                              result['vectors']], axis=1)
+    stitched.to_pickle(args.output)
+    logging.info('stitched output written to %s', args.output)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)-15s %(levelname)s %(name)s - %(message)s', level=logging.INFO)
+    main()